@@ -3,6 +3,10 @@
 from smartrade.utils import check
 
 class BalanceInfo:
+    __slots__ = ('_account_value', '_cash_value', '_buying_power', '_nonmarginable_buying_power',
+                 '_long_margin_value', '_long_stock_value', '_short_stock_value', '_long_option_value',
+                 '_short_option_value', '_total_interest', '_margin_equity', '_maint_req', '_margin_balance')
+
     def __init__(self, **vals):
         for key, val in vals.items():
             setattr(self, "_" + key, val)
@@ -94,6 +98,9 @@ class BalanceInfo:
                 f"long_option_value={self.long_option_value}, short_option_value={self.short_option_value}")
 
 class PositionInfo:
+    __slots__ = ('_symbol', '_quantity', '_price', '_cost', '_day_gain', '_day_gain_percent',
+                 '_day_cost', '_pre_quantity', '_maint_req')
+
     def __init__(self, **vals):
         for key, val in vals.items():
             setattr(self, "_" + key, val)
@@ -144,6 +151,8 @@ class PositionInfo:
                 f"day_cost={self.day_cost}, pre_quantity={self.pre_quantity}, maint_req={self.maint_req}")
 
 class LegInfo:
+    __slots__ = ('_symbol', '_quantity', '_action')
+
     def __init__(self, **vals):
         for key, val in vals.items():
             setattr(self, "_" + key, val)
@@ -164,6 +173,10 @@ class LegInfo:
         return f"symbol={self.symbol}, quantity={self.quantity}, action={self.action}"
 
 class OrderInfo:
+    __slots__ = ('_legs', '_order_id', '_order_type', '_status', '_price', '_quantity', '_filled_quantity',
+                 '_strategy_type', '_duration', '_cancelable', '_editable', '_cancel_time', '_entered_time',
+                 '_close_time')
+
     def __init__(self, **vals):
         for key, val in vals.items():
             setattr(self, "_" + key, val)
@@ -231,6 +244,8 @@ class OrderInfo:
                 f"duration={self.duration}, cancel_time={self.cancel_time}")
 
 class AccountInfo:
+    __slots__ = ('_account_id', '_cur_bal', '_pre_bal', '_positions', '_orders', '_account_type', '_day_trader')
+
     def __init__(self, acct_id, cur_bal, pre_bal, **vals):
         self._account_id = acct_id
         self._cur_bal = cur_bal
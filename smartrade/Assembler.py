@@ -1,19 +1,42 @@
 # -*- coding: utf-8 -*-
 
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import timedelta
+import time
+
+from pymongo import InsertOne, UpdateOne
 
 from smartrade import app_logger
+from smartrade.CashLedger import CashLedger
+from smartrade.indexes import ensure_transaction_flags
 from smartrade.TransactionGroup import TransactionGroup
 from smartrade.utils import get_database, ASC, check
 
 logger = app_logger.get_logger(__name__)
 
+def _group_ticker_transactions(db_name, account, atomic, ticker, save_db):
+    """Group one ticker's transactions, return (groups, elapsed seconds)."""
+    start = time.perf_counter()
+    groups = Assembler(db_name, account, atomic).group_transactions(ticker, save_db)
+    return groups, time.perf_counter() - start
+
 class Assembler:
-    def __init__(self, db_name, account):
+    MAX_WORKERS = 4
+
+    def __init__(self, db_name, account, atomic=False):
+        """
+        atomic: save the regrouping of a ticker in one session transaction(requires a replica set)
+        """
+        ensure_transaction_flags(db_name, account)
         db = get_database(db_name)
+        self._db_name = db_name
+        self._account = account
+        self._client = db.client
         self._tx_collection = db.transactions
         self._group_collection = db.transaction_groups
         self._account_cond = self.account_condition(account)
+        self._atomic = atomic
+        self._ledger = CashLedger(db_name, {**self._account_cond, 'valid': 1, **self.effective_condition()})
 
     @classmethod
     def account_condition(cls, account):
@@ -21,29 +44,19 @@ class Assembler:
 
     @classmethod
     def effective_condition(cls):
-        unmerged_cond = {'$or':[{'merge_parent': None}, {'$expr':{'$eq':["$merge_parent", "$_id"]}}, {'$expr':{'$eq':["$merge_parent", "$slice_parent"]}}]}
-        unsliced_cond = {'$expr':{'$ne':["$slice_parent", "$_id"]}}
-        return {'$and': [unmerged_cond, unsliced_cond]}
+        return {'effective': True}
 
     @classmethod
     def ineffective_condition(cls):
-        merged_cond = {'$and':[{'merge_parent': {'$ne': None}}, {'$expr':{'$ne':["$merge_parent", "$_id"]}}, {'$expr':{'$ne':["$merge_parent", "$slice_parent"]}}]}
-        sliced_cond = {'$expr':{'$eq':["$slice_parent", "$_id"]}}
-        return {'$or': [merged_cond, sliced_cond]}
+        return {'effective': False}
 
     @classmethod
     def virtual_condition(cls):
-        sliced_cond = {'$expr':{'$ne':["$slice_parent", "$_id"]}}
-        is_sliced_cond = {'$and': [sliced_cond, {'slice_parent': {'$ne': None}}]}
-        merged_cond = {'$expr':{'$eq':["$merge_parent", "$_id"]}}
-        return {'$or': [merged_cond, is_sliced_cond]}
+        return {'original': False}
 
     @classmethod
     def original_condition(cls):
-        sliced_cond = {'$expr':{'$eq':["$slice_parent", "$_id"]}}
-        is_sliced_cond = {'$or': [sliced_cond, {'slice_parent': {'$eq': None}}]}
-        merged_cond = {'$expr':{'$ne':["$merge_parent", "$_id"]}}
-        return {'$and': [merged_cond, is_sliced_cond]}
+        return {'original': True}
 
     def group_transactions(self, ticker, save_db=False):
         tx_collection = self._tx_collection
@@ -70,43 +83,110 @@ class Assembler:
         leading_tx = tx_collection.find(leading_cond).sort(order)
         following_tx = tx_collection.find(following_cond).sort(order)
         groups, updated_tx_list, created_tx_map = TransactionGroup.assemble(leading_tx, following_tx)
-        if save_db:
-            incomplete = self._group_collection.delete_many({**self._account_cond, 'ui': ticker, 'completed': False})
-            logger.debug("deleted %s incomplete transaction group(s)", incomplete.deleted_count)
-
+        tx_ops = [] if save_db else None
         for tx in created_tx_map.values():
             check(tx.is_virtual() and tx.grouped is None, f"transaction {tx} should be virtual and not grouped")
-            self._save(save_db, tx, False)
+            self._save(tx_ops, tx, False)
         for tx in updated_tx_list:
             check(tx.is_original(), f"transaction {tx} should be original")
-            self._save(save_db, tx, True)
+            self._save(tx_ops, tx, True)
         for group in groups:
             for otx, ctx in group.chains.items():
                 check(otx.is_effective(), f"transaction {otx} should be effective")
                 update = self._was_created(otx, created_tx_map)
                 otx.grouped = group.completed
-                self._save(save_db, otx, update)
+                self._save(tx_ops, otx, update)
                 for tx in ctx:
                     check(tx.is_effective(), f"transaction {tx} should be effective")
                     update = self._was_created(tx, created_tx_map)
                     tx.grouped = group.completed
-                    self._save(save_db, tx, update)
+                    self._save(tx_ops, tx, update)
 
-            if save_db:
-                self._group_collection.insert_one(group.to_json())
+        if save_db:
+            group_docs = [group.to_json() for group in groups]
+            if self._atomic:
+                with self._client.start_session() as session:
+                    session.with_transaction(lambda s: self._flush(ticker, tx_ops, group_docs, s))
+            else:
+                self._flush(ticker, tx_ops, group_docs)
+            # merged and sliced transactions replace the effective ones of their days
+            self._ledger.refresh(tx.date for tx in [*created_tx_map.values(), *updated_tx_list])
         return groups
 
+    def regroup(self, tickers, save_db=True, max_workers=MAX_WORKERS, with_groups=False):
+        """
+        Group transactions of independent tickers concurrently.
+
+        max_workers: maximal number of tickers being grouped at the same time(in threads, since a process
+            would re-import and configure the whole app and lose the quote provider of TransactionGroup)
+        with_groups: also return the transaction groups of every ticker
+        Returns:
+            {'transactionGroups': total group count,
+             'tickers': {ticker: (group count, elapsed seconds)},
+             'failures': {ticker: error message},
+             'groups': {ticker: transaction groups} (only if with_groups)}
+        """
+        res = {'transactionGroups': 0, 'tickers': {}, 'failures': {}}
+        if with_groups:
+            res['groups'] = {}
+        if not tickers: return res
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=min(max_workers, len(tickers))) as executor:
+            futures = {executor.submit(_group_ticker_transactions, self._db_name, self._account,
+                                       self._atomic, ticker, save_db): ticker for ticker in tickers}
+            for future in as_completed(futures):
+                ticker = futures[future]
+                try:
+                    groups, elapsed = future.result()
+                except Exception as e:
+                    logger.error("failed to group transactions of ticker %s", ticker, exc_info=True)
+                    res['failures'][ticker] = str(e)
+                    continue
+
+                count = len(groups)
+                if with_groups:
+                    res['groups'][ticker] = groups
+                logger.debug("grouped %s transaction group(s) of ticker %s in %.3f seconds", count, ticker, elapsed)
+                res['tickers'][ticker] = (count, elapsed)
+                res['transactionGroups'] += count
+        logger.info("grouped %s transaction group(s) of %s ticker(s) in %.3f seconds, %s failure(s)",
+                    res['transactionGroups'], len(tickers), time.perf_counter() - start, len(res['failures']))
+        return res
+
+    def regroup_written(self, written_tickers, save_db=True, max_workers=MAX_WORKERS):
+        """
+        Regroup only the tickers that have newly written transactions.
+
+        written_tickers: (account, ui) pairs, e.g. Loader.written_tickers
+        """
+        account = self._account_cond['account']
+        tickers = sorted({ui for acct, ui in written_tickers if acct == account})
+        return self.regroup(tickers, save_db, max_workers)
+
+    def _flush(self, ticker, tx_ops, group_docs, session=None):
+        incomplete = self._group_collection.delete_many(
+            {**self._account_cond, 'ui': ticker, 'completed': False}, session=session)
+        logger.debug("deleted %s incomplete transaction group(s)", incomplete.deleted_count)
+        if tx_ops:
+            # ordered: a created transaction may be updated later in the same batch
+            res = self._tx_collection.bulk_write(tx_ops, ordered=True, session=session)
+            logger.debug("created %s and updated %s transaction(s)", res.inserted_count, res.modified_count)
+        if group_docs:
+            self._group_collection.insert_many(group_docs, session=session)
+            logger.debug("created %s transaction group(s)", len(group_docs))
+
     def _was_created(self, tx, created_tx_map):
         return tx.grouped is not None or tx.is_original() or (str(tx.id) in created_tx_map)
 
-    def _save(self, save_db, tx, update):
-        if not save_db: return
-                
-        tx_collection = self._tx_collection
+    def _save(self, tx_ops, tx, update):
+        if tx_ops is None: return
+
         if update:
             logger.debug("updating transaction: %s", tx)
-            tx_collection.update_one({'_id': tx.id},
-                                     {'$set': {'merge_parent': tx.merge_parent, 'slice_parent': tx.slice_parent, 'grouped': tx.grouped}}, upsert=False)
+            tx_ops.append(UpdateOne({'_id': tx.id},
+                                    {'$set': {'merge_parent': tx.merge_parent, 'slice_parent': tx.slice_parent, 'grouped': tx.grouped,
+                                              'effective': tx.is_effective(), 'original': tx.is_original()}}))
         else:
             logger.debug("creating transaction: %s", tx)
-            tx_collection.insert_one(tx.to_json())
+            tx_ops.append(InsertOne(tx.to_json()))
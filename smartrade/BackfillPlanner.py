@@ -0,0 +1,183 @@
+# -*- coding: utf-8 -*-
+
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+
+from smartrade import app_logger
+from smartrade.Assembler import Assembler
+from smartrade.Inspector import Inspector
+from smartrade.MarketDataProvider import MarketDataProvider
+from smartrade.TokenBucket import TokenBucket
+from smartrade.Transaction import Symbol
+from smartrade.utils import get_database, DESC
+
+logger = app_logger.get_logger(__name__)
+
+class BackfillPlanner:
+    """Plans the daily price history missing for every symbol an account has traded,
+    and downloads it as a resumable job persisted in the backfill_jobs collection.
+    """
+
+    MIN_COVERED_DAYS = 7 # covered days between two gaps worth a separate request
+    MAX_ATTEMPTS = 3 # runs a task fails before it's abandoned, e.g. a delisted symbol
+    _running = {} # account => job id being run by a background thread
+    _running_lock = threading.Lock()
+
+    def __init__(self, db_name, account, provider: MarketDataProvider):
+        self._provider = provider
+        self._inspector = Inspector(db_name, account, provider)
+        self._account = Assembler.account_condition(account)['account']
+        db = get_database(db_name)
+        self._tx_collection = db.transactions
+        self._job_collection = db.backfill_jobs
+        self._valid_tx_cond = {**Assembler.account_condition(account), 'valid': 1}
+        # PolygonApi paces its own requests
+        self._buckets = {'broker': TokenBucket(provider.broker_requests_per_minute() / 60)}
+
+    def _needed_ranges(self):
+        """symbol => first day whose price is needed: the day it's first traded, or the underlying of an option."""
+        res = self._tx_collection.aggregate([
+            {'$match': {**self._valid_tx_cond, 'ui': {'$nin': [None, ""]}}},
+            {'$group': {'_id': {'ui': "$ui", 'expired': "$expired", 'strike': "$strike", 'type': "$type"},
+                        'start': {'$min': "$date"}}}])
+        starts = {}
+        for doc in res:
+            key = doc['_id']
+            start = datetime.combine(doc['start'].date(), datetime.min.time()).replace(tzinfo=timezone.utc)
+            symbols = [key['ui']]
+            if key.get('expired', None):
+                symbols.append(format(Symbol.from_fields(key['ui'], key['expired'], key['strike'], key['type'])))
+            for symbol in symbols:
+                starts[symbol] = min(start, starts.get(symbol, start))
+        return starts
+
+    def plan(self):
+        '''
+        Download tasks of the missing daily prices, current positions first.
+
+        Every gap of a symbol is a task, clipped to the history depth of the source serving the symbol,
+        except that gaps separated by fewer than MIN_COVERED_DAYS covered days are requested together.
+        '''
+        starts = self._needed_ranges()
+        held = {format(Symbol.of(key)) for key in self._inspector.positions()}
+        coverage = self._provider.coverage_ranges(list(starts))
+        tasks = []
+        unavailable = 0
+        for symbol, start in starts.items():
+            source = self._provider.price_source(symbol)
+            start = max(start, self._provider.history_start(source))
+            end = MarketDataProvider._latest_price_day(symbol)
+            if start > end:
+                unavailable += 1
+                continue
+
+            for start, end in self._coalesce(self._provider.missing_price_ranges(symbol, start, end, coverage[symbol])):
+                tasks.append({'symbol': symbol, 'source': source, 'start': start, 'end': end,
+                              'status': 'pending', 'count': 0, 'error': None, 'attempts': 0})
+        tasks.sort(key=lambda task: (task['symbol'] not in held, task['source'], task['symbol']))
+        logger.info("planned %s backfill tasks of %s symbols, %s symbols are beyond the history depth",
+                    len(tasks), len(starts), unavailable)
+        return tasks
+
+    @classmethod
+    def _coalesce(cls, gaps):
+        ranges = []
+        for start, end in gaps:
+            if ranges and (start - ranges[-1][1]).days <= cls.MIN_COVERED_DAYS:
+                ranges[-1] = (ranges[-1][0], end)
+            else:
+                ranges.append((start, end))
+        return ranges
+
+    def _unfinished_job(self):
+        for job in self._job_collection.find({'account': self._account, 'status': {'$ne': 'done'}}) \
+                                       .sort([("created", DESC)]).limit(1):
+            return job
+        return None
+
+    def _create_job(self):
+        now = datetime.utcnow()
+        job = {'account': self._account, 'created': now, 'updated': now, 'status': 'running', 'tasks': self.plan()}
+        job['_id'] = self._job_collection.insert_one(job).inserted_id
+        return job
+
+    def run(self, job_id=None):
+        '''
+        Run the given job, or resume the latest unfinished job of the account, or plan a new one.
+        Tasks completed before are skipped, so an interrupted job picks up where it stopped.
+        A task failing MAX_ATTEMPTS times is abandoned, so that it doesn't hold back the plans of new gaps.
+
+        Returns:
+            progress of the job
+        '''
+        job = self._job_collection.find_one({'_id': job_id}) if job_id else self._unfinished_job()
+        job = job or self._create_job()
+        self._job_collection.update_one({'_id': job['_id']}, {'$set': {'status': 'running'}})
+        pending = {}
+        for i, task in enumerate(job['tasks']):
+            if task['status'] in ('pending', 'failed'):
+                pending.setdefault(task['source'], []).append((i, task))
+        logger.info("running backfill job %s: %s of %s tasks left", job['_id'], sum(map(len, pending.values())),
+                    len(job['tasks']))
+        # one worker per source so that a slow source doesn't hold back the others
+        with ThreadPoolExecutor(max(len(pending), 1), thread_name_prefix="backfill") as executor:
+            futures = [executor.submit(self._run_tasks, job['_id'], tasks) for tasks in pending.values()]
+            for future in futures:
+                future.result()
+        progress = self.progress(job['_id'])
+        status = 'done' if progress['failed'] == 0 else 'incomplete'
+        self._job_collection.update_one({'_id': job['_id']}, {'$set': {'status': status}})
+        return {**progress, 'status': status}
+
+    def _run_tasks(self, job_id, tasks):
+        for i, task in tasks:
+            bucket = self._buckets.get(task['source'], None)
+            if bucket:
+                bucket.acquire()
+            status, count, error, attempts = 'done', 0, None, task.get('attempts', 0) + 1
+            try:
+                start, end = (task[key].replace(tzinfo=timezone.utc) for key in ('start', 'end'))
+                count = self._provider.backfill_daily_prices(task['symbol'], start, end, task['source'])
+            except Exception as e:
+                logger.error("failed to backfill %s (error type: %s, error: %s)", task['symbol'], type(e), e)
+                status, error = 'failed' if attempts < self.MAX_ATTEMPTS else 'abandoned', str(e)
+            self._job_collection.update_one({'_id': job_id}, {'$set': {
+                f'tasks.{i}.status': status, f'tasks.{i}.count': count, f'tasks.{i}.error': error,
+                f'tasks.{i}.attempts': attempts, 'updated': datetime.utcnow()}})
+            logger.info("backfill job %s: task %s (%s) %s", job_id, i + 1, task['symbol'], status)
+
+    def start(self):
+        """Run the backfill in a background thread unless one is running for the account, return the job id."""
+        with self._running_lock:
+            job_id = self._running.get(self._account, None)
+            if job_id: return job_id
+
+            job = self._unfinished_job() or self._create_job()
+            job_id = self._running[self._account] = job['_id']
+
+        def run():
+            try:
+                self.run(job_id)
+            except Exception as e:
+                logger.error("backfill job %s failed (error type: %s, error: %s)", job_id, type(e), e)
+            finally:
+                with self._running_lock:
+                    self._running.pop(self._account, None)
+
+        threading.Thread(target=run, name=f"backfill-{self._account}", daemon=True).start()
+        return job_id
+
+    def progress(self, job_id=None):
+        '''Progress of the given job or the latest job of the account, None if there's no job.'''
+        condition = {'_id': job_id} if job_id else {'account': self._account}
+        with self._running_lock:
+            running_id = self._running.get(self._account, None)
+        for job in self._job_collection.find(condition).sort([("created", DESC)]).limit(1):
+            tasks = job['tasks']
+            counts = {status: len([t for t in tasks if t['status'] == status])
+                      for status in ('done', 'failed', 'abandoned', 'pending')}
+            return {'id': str(job['_id']), 'status': job['status'], 'created': job['created'], 'updated': job['updated'],
+                    'total': len(tasks), **counts, 'prices': sum(t['count'] for t in tasks),
+                    'running': running_id == job['_id']}
+        return None
@@ -7,6 +7,14 @@ import yaml
 from smartrade.exceptions import ConfigurationError
 
 class BrokerClient:
+    HISTORY_DAYS = 365 * 20 # depth of the daily price history
+    REQUESTS_PER_MINUTE = 120 # request quota
+
+    def history_days(self):
+        return self.HISTORY_DAYS
+
+    def requests_per_minute(self):
+        return self.REQUESTS_PER_MINUTE
 
     def get_account_id(self, account_alias=None): ...
     
@@ -0,0 +1,154 @@
+# -*- coding: utf-8 -*-
+
+import threading
+from datetime import datetime, timedelta
+
+from pymongo import DeleteOne, UpdateOne
+
+from smartrade import app_logger
+from smartrade.utils import get_database, ASC, DESC
+
+logger = app_logger.get_logger(__name__)
+
+class CashLedger:
+    """Cumulative cash of an account at the end of every day having effective transactions, persisted in the
+    cash_ledger collection and kept up to date by the writers of the transactions(Loader and Assembler).
+    """
+
+    EPSILON = 1e-9
+
+    _locks = {} # (database name, account) => lock of the ledger
+    _locks_lock = threading.Lock()
+
+    def __init__(self, db_name, tx_cond):
+        """
+        tx_cond: condition of the effective transactions of the account
+        """
+        db = get_database(db_name)
+        self._tx_collection = db.transactions
+        self._collection = db.cash_ledger
+        self._tx_cond = tx_cond
+        self._account_cond = {'account': tx_cond['account']}
+        with self._locks_lock:
+            self._lock = self._locks.setdefault((db_name, tx_cond['account']), threading.Lock())
+
+    @classmethod
+    def _day(cls, time):
+        return datetime.combine(time.date(), datetime.min.time())
+
+    def _daily_amounts(self, condition):
+        """day => [first time, last time, total amount] of the effective transactions matching the condition."""
+        daily = {}
+        for doc in self._tx_collection.find(condition, {'date': 1, 'amount': 1}):
+            time = doc['date']
+            day = daily.setdefault(self._day(time), [time, time, 0.0])
+            day[0], day[1] = min(day[0], time), max(day[1], time)
+            day[2] += doc.get('amount') or 0
+        return daily
+
+    def rebuild(self):
+        """Recompute the whole ledger of the account, return the number of days."""
+        with self._lock:
+            count = self._rebuild()
+        logger.debug("rebuilt cash ledger of account %s with %s day(s)", self._account_cond['account'], count)
+        return count
+
+    def _rebuild(self):
+        self._collection.delete_many(self._account_cond)
+        docs = []
+        cash = 0.0
+        for day, (first, last, amount) in sorted(self._daily_amounts(self._tx_cond).items()):
+            cash += amount
+            docs.append({**self._account_cond, 'date': day, 'first': first, 'last': last, 'amount': amount, 'cash': cash})
+        if docs:
+            self._collection.insert_many(docs)
+        return len(docs)
+
+    def _ensure(self):
+        """Build the ledger of an account whose transactions predate it, return whether it's built."""
+        if self._collection.find_one(self._account_cond) or not self._tx_collection.find_one(self._tx_cond):
+            return False
+
+        self._rebuild()
+        return True
+
+    def refresh(self, times):
+        """Bring the days of the given times up to date after the transactions of those days were written.
+
+        The changed days are rewritten, and the cash of them and the later days is summed up again from the
+        saved amounts, so a refresh also repairs the days left behind by an interrupted or concurrent one.
+        """
+        days = sorted({self._day(time) for time in times if time})
+        if not days: return
+
+        one_day = timedelta(days=1)
+        with self._lock:
+            if self._ensure(): return
+
+            daily = self._daily_amounts(
+                {**self._tx_cond, '$or': [{'date': {'$gte': day, '$lt': day + one_day}} for day in days]})
+            saved = {doc['date']: doc for doc in self._collection.find({**self._account_cond, 'date': {'$in': days}})}
+            requests = []
+            changed = []
+            for day in days:
+                doc = saved.get(day)
+                day_cond = {**self._account_cond, 'date': day}
+                if day not in daily:
+                    if doc:
+                        requests.append(DeleteOne(day_cond))
+                        changed.append(day)
+                    continue
+
+                first, last, amount = daily[day]
+                if not doc or (doc['first'], doc['last']) != (first, last) or abs(doc['amount'] - amount) > self.EPSILON:
+                    requests.append(UpdateOne(day_cond, {'$set': {'first': first, 'last': last, 'amount': amount}},
+                                              upsert=True))
+                    changed.append(day)
+            if requests:
+                self._collection.bulk_write(requests, ordered=True)
+                self._sum_up(changed[0])
+        logger.debug("refreshed %s day(s) of cash ledger of account %s, %s changed",
+                     len(days), self._account_cond['account'], len(changed))
+
+    def _sum_up(self, start_day):
+        """Set the cash of the days since start_day from their amounts."""
+        cash = self._cash_before(start_day)
+        requests = []
+        for doc in self._collection.find({**self._account_cond, 'date': {'$gte': start_day}}).sort([('date', ASC)]):
+            cash += doc['amount']
+            if doc.get('cash') is None or abs(doc['cash'] - cash) > self.EPSILON:
+                requests.append(UpdateOne({'_id': doc['_id']}, {'$set': {'cash': cash}}))
+        if requests:
+            self._collection.bulk_write(requests, ordered=False)
+
+    def _last_day(self, condition):
+        for doc in self._collection.find(condition).sort([('date', DESC)]).limit(1):
+            return doc
+        return None
+
+    def _cash_before(self, day):
+        doc = self._last_day({**self._account_cond, 'date': {'$lt': day}})
+        return doc['cash'] if doc else 0.0
+
+    def cash(self, time=None, inclusive=True):
+        """Total amount of the effective transactions dated up to the time(before it if not inclusive), all if time is None."""
+        condition = {**self._account_cond, 'date': {'$lte': time}} if time else self._account_cond
+        doc = self._last_day(condition)
+        if not doc:
+            with self._lock:
+                if not self._ensure(): return 0.0
+            doc = self._last_day(condition)
+            if not doc: return 0.0
+
+        if not time or doc['last'] < time or (inclusive and doc['last'] == time):
+            return doc['cash']
+
+        cash = doc['cash'] - doc['amount']
+        if doc['first'] > time or (not inclusive and doc['first'] == time):
+            return cash
+
+        # only part of the transactions of the day
+        date_limit = {'$gte': doc['date'], ('$lte' if inclusive else '$lt'): time}
+        for tx in self._tx_collection.find({**self._tx_cond, 'date': date_limit}, {'amount': 1}):
+            cash += tx.get('amount') or 0
+        return cash
@@ -3,10 +3,13 @@
 from datetime import datetime, timedelta
 
 from dateutil.parser import parse
+from pymongo import ReplaceOne
 
 from smartrade import app_logger
 from smartrade.Assembler import Assembler
-from smartrade.Transaction import InstrumentType, Symbol, Transaction
+from smartrade.CashLedger import CashLedger
+from smartrade.indexes import ensure_transaction_flags
+from smartrade.Transaction import Action, InstrumentType, Symbol, Transaction
 from smartrade.TransactionGroup import TransactionGroup
 from smartrade.utils import check, get_database, ASC, DESC
 
@@ -14,6 +17,7 @@ logger = app_logger.get_logger(__name__)
 
 class Inspector:
     def __init__(self, db_name, account, provider=None):
+        ensure_transaction_flags(db_name, account)
         db = get_database(db_name)
         self._provider = provider
         self._tx_collection = db.transactions
@@ -22,14 +26,16 @@ class Inspector:
         self._account_cond = Assembler.account_condition(account)
         self._valid_tx_cond = {**self._account_cond, 'valid': 1}
         self._effective_tx_cond = {**self._valid_tx_cond, **Assembler.effective_condition()}
+        self._ledger = CashLedger(db_name, self._effective_tx_cond)
         self._trading_tx_cond = {'action': {'$in': ['BTO', 'STO', 'STC', 'BTC', 'EXPIRED', 'ASSIGNED', 'EXERCISE',
                                                     'SPLIT', 'SPLIT_FROM', 'SPLIT_TO']}}
 
     def transaction_period(self):
         start_date = end_date = datetime.now()
-        for obj in self._tx_collection.find(self._valid_tx_cond).sort([("date", ASC)]).limit(1):
+        # merged and sliced transactions share the dates of the effective ones
+        for obj in self._tx_collection.find(self._effective_tx_cond).sort([("date", ASC)]).limit(1):
             start_date = obj['date']
-        for obj in self._tx_collection.find(self._valid_tx_cond).sort([("date", DESC)]).limit(1):
+        for obj in self._tx_collection.find(self._effective_tx_cond).sort([("date", DESC)]).limit(1):
             end_date = obj['date']
         return (start_date, end_date)
 
@@ -46,7 +52,27 @@ class Inspector:
         return -self._total_amount(self._trading_tx_cond, start_date, end_date)
 
     def total_cash(self, start_date=None, end_date=None):
-        return self._total_amount(None, start_date, end_date)
+        start_date, end_date = self._parse_date(start_date), self._parse_date(end_date)
+        start_cash = self._ledger.cash(start_date, False) if start_date else 0.0
+        return self._ledger.cash(end_date) - start_cash
+
+    def account_totals(self, start_date=None, end_date=None):
+        """total_investment, total_interest, total_dividend, total_trading and total_cash in one pass."""
+        buckets = {'total_investment': {'action': {'$in': ['TRANSFER', 'JOURNAL']}},
+                   'total_interest': {'action': {'$in': ['INTEREST']}},
+                   'total_dividend': {'action': {'$in': ['DIVIDEND']}},
+                   'total_trading': self._trading_tx_cond}
+        group = {'_id': None, 'total_cash': {'$sum': "$amount"}}
+        for name, cond in buckets.items():
+            group[name] = {'$sum': {'$cond': [{'$in': ["$action", cond['action']['$in']]}, "$amount", 0.0]}}
+        totals = dict.fromkeys([*buckets, 'total_cash'], 0.0)
+        res = self._tx_collection.aggregate(
+            [{'$match': self._date_limit({**self._effective_tx_cond}, start_date, end_date)},
+             {'$group': group}])
+        for r in res:
+            totals.update({name: r[name] for name in totals})
+        totals['total_trading'] = -totals['total_trading'] or 0.0
+        return totals
 
     def _total_amount(self, restrictions, start_date=None, end_date=None):
         amount = 'total_amount'
@@ -77,24 +103,27 @@ class Inspector:
         total_market_value = 0
         total_profit = 0
         positions = {}
-        for ticker in self.distinct_tickers(start_date, end_date):
-            tx_groups = self.ticker_transaction_groups(ticker, include_quotes)
-            total, profit, position, *_ = TransactionGroup.summarize(tx_groups, include_quotes)
+        ticker_groups = [self.ticker_transaction_groups(ticker, False)
+                         for ticker in self.distinct_tickers(start_date, end_date)]
+        if include_quotes:
+            TransactionGroup.quote([group for tx_groups in ticker_groups for group in tx_groups])
+        for tx_groups in ticker_groups:
+            total, profit, position, *_ = TransactionGroup.summarize(tx_groups)
             total_profit += profit
             total_market_value += profit - total
             positions.update(position)
         return total_profit, total_market_value, positions
 
+    @classmethod
+    def _parse_date(cls, date):
+        return parse(date) if isinstance(date, str) else date
+
     def _date_limit(self, condition, start_date, end_date):
         date_limit = {}
         if end_date:
-            if isinstance(end_date, str):
-                end_date = parse(end_date)
-            date_limit['$lte'] = end_date
+            date_limit['$lte'] = self._parse_date(end_date)
         if start_date:
-            if isinstance(start_date, str):
-                start_date = parse(start_date)
-            date_limit['$gte'] = start_date
+            date_limit['$gte'] = self._parse_date(start_date)
         if date_limit:
             condition['date'] = date_limit
         return condition
@@ -132,39 +161,81 @@ class Inspector:
         return [Transaction.from_doc(doc) for doc in self._tx_collection.find({**self._valid_tx_cond, 'ui': ticker})]
     
     def ticker_transaction_groups(self, ticker, include_quotes=True):
-        return [TransactionGroup.from_doc(doc, include_quotes) for doc in self._group_collection.find({**self._account_cond, 'ui': ticker})]
+        tx_groups = [TransactionGroup.from_doc(doc, False) for doc in self._group_collection.find({**self._account_cond, 'ui': ticker})]
+        if include_quotes:
+            TransactionGroup.quote(tx_groups)
+        return tx_groups
         # add start_date and end_date condition?
         #condition = self._date_limit({**self._account_cond, 'ui': ticker}, start_date, end_date)
         #return [TransactionGroup.from_doc(doc) for doc in self._group_collection.find(condition)]
 
     def positions(self, tickers=None, day=None):
+        """symbol => quantity of the open positions as of the day, summed up by the server per option series."""
         condition = self._date_limit({**self._effective_tx_cond, **self._trading_tx_cond}, None, day)
         if tickers:
             condition['ui'] = {'$in': tickers}
-        positions = {}
-        for tx in [Transaction.from_doc(doc) for doc in self._tx_collection.find(condition).sort([("date", ASC)])]:
-            key = str(tx.symbol)
-            if tx.symbol.type == InstrumentType.AUTO:
-                key = key[:-1] + "C"
-                if key not in positions:
-                    key = key[:-1] + "P"
-                    check(key in positions, f"key {key} should be in positions")
-            bal = positions.get(key, 0)
-            qty = tx.quantity * tx.position_sign(bal)
-            positions[key] = bal + qty
+        is_expired = {'$eq': ["$action", 'EXPIRED']}
+        held, expired = {}, {}
+        for series in self._tx_collection.aggregate(
+                [{'$match': condition},
+                 # the actions other than EXPIRED have fixed position signs, see Transaction.position_sign
+                 {'$group': {'_id': {'ui': "$ui", 'expired': "$expired", 'strike': "$strike", 'type': "$type"},
+                             'held': {'$sum': {'$cond': [is_expired, 0, {'$cond': [
+                                 {'$in': ["$action", ['BTO', 'BTC', 'ASSIGNED']]},
+                                 "$quantity", {'$multiply': [-1, "$quantity"]}]}]}},
+                             'expired': {'$sum': {'$cond': [is_expired, "$quantity", 0]}}}},
+                 # EXPIRED closes the position toward zero whichever side it is on, never past it
+                 {'$addFields': {'position': {'$cond': [
+                     {'$gt': ["$held", 0]}, {'$max': [{'$subtract': ["$held", "$expired"]}, 0]},
+                     {'$min': [{'$add': ["$held", "$expired"]}, 0]}]}}},
+                 # AUTO type contracts belong to the call or put of the same series
+                 {'$group': {'_id': {'ui': "$_id.ui", 'expired': "$_id.expired", 'strike': "$_id.strike"},
+                             'contracts': {'$push': {'type': "$_id.type", 'held': "$held", 'expired': "$expired"}},
+                             'open': {'$sum': {'$cond': [{'$ne': ["$position", 0]}, 1, 0]}},
+                             'auto': {'$sum': {'$cond': [{'$eq': ["$_id.type", 'AUTO']}, 1, 0]}}}},
+                 {'$match': {'$or': [{'open': {'$gt': 0}}, {'auto': {'$gt': 0}}]}}]):
+            group = series['_id']
+            contracts = sorted(series['contracts'], key=lambda contract: contract['type'] == 'AUTO')
+            for contract in contracts:
+                symbol = Symbol.from_fields(group.get('ui'), group.get('expired'), group.get('strike'), contract['type'])
+                key = str(symbol)
+                if symbol.type == InstrumentType.AUTO:
+                    key = key[:-1] + "C"
+                    if key not in held:
+                        key = key[:-1] + "P"
+                        check(key in held, f"key {key} should be in positions")
+                held[key] = held.get(key, 0) + contract['held']
+                expired[key] = expired.get(key, 0) + contract['expired']
+        positions = {key: self._expire(qty, expired[key]) for key, qty in held.items()}
         return {k : v for k, v in positions.items() if v != 0}
 
+    @classmethod
+    def _add_position(cls, positions, tx):
+        key = str(tx.symbol)
+        if tx.symbol.type == InstrumentType.AUTO:
+            key = key[:-1] + "C"
+            if key not in positions:
+                key = key[:-1] + "P"
+                check(key in positions, f"key {key} should be in positions")
+        bal = positions.get(key, 0)
+        if tx.action == Action.EXPIRED:
+            positions[key] = cls._expire(bal, tx.quantity)
+        else:
+            positions[key] = bal + tx.quantity * tx.position_sign(bal)
+
+    @classmethod
+    def _expire(cls, held, expired):
+        """Position left after the expired quantity closes the held one toward zero, never past it."""
+        if held > 0: return max(held - expired, 0)
+        return min(held + expired, 0)
+
     def compute_balance(self, day=None):
         cash = self.total_cash(end_date=day)
-        total_value = cash
         pos = self.positions(day=day)
-        for symbol, quantity in pos.items():
-            symbol_obj = Symbol(symbol)
-            symbol_str = format(symbol_obj)
-            price = self._provider.get_price(symbol_str, day)
-            value = quantity * price * (100 if symbol_obj.is_option() else 1)
-            total_value += value
-        return (pos, cash, round(total_value, 2))
+        symbols = {symbol: format(Symbol.of(symbol)) for symbol in pos}
+        price_day = day or datetime.utcnow()
+        prices = self._provider.get_prices(symbols.values(), [price_day])
+        return (pos, cash, self._total_value(cash, pos, {symbol: prices[symbols[symbol], price_day] for symbol in pos}))
     
     def get_balance(self, day):
         day = datetime.combine(day.date(), datetime.min.time())
@@ -187,16 +258,60 @@ class Inspector:
             end_date = today
         if end_date > last_tx_date and not self.positions():
             end_date = last_tx_date
-        start = datetime.combine(start_date.date(), datetime.max.time())
-        end = datetime.combine(end_date.date(), datetime.max.time())
+        start = datetime.combine(start_date.date(), datetime.min.time())
+        end = datetime.combine(end_date.date(), datetime.min.time())
         logger.debug("getting balance history from %s to %s", start, end)
-        delta = timedelta(days=1)
-        res = {}
+        days = []
         while start <= end:
-            bal = self.get_balance(start)
-            res[start.strftime("%Y-%m-%d")] = bal #f"{bal:,.2f}"
-            start += delta
-        return res #dict(sorted(res.items()))
+            days.append(start)
+            start += timedelta(days=1)
+        saved = {doc['date']: (doc['balance'], doc.get('actual_balance', None)) for doc in self._bal_collection.find(
+            {**self._account_cond, 'date': {'$gte': days[0], '$lte': days[-1]}})} if days else {}
+        missing = [day for day in days if day not in saved]
+        if missing:
+            logger.debug("computing %s of %s balances", len(missing), len(days))
+            computed = self._compute_balances(missing)
+            self._bal_collection.bulk_write([ReplaceOne(
+                {**self._account_cond, 'date': day}, {**self._account_cond, 'date': day, 'balance': bal}, upsert=True)
+                for day, bal in computed.items()], ordered=False)
+            saved.update({day: (bal, None) for day, bal in computed.items()})
+        return {day.strftime("%Y-%m-%d"): saved[day] for day in days}
+
+    def _compute_balances(self, days):
+        """Balances at the beginning of the given ascending days, sweeping the transactions once in date order.
+
+        Same as `compute_balance` for each day, with the prices of all the positions retrieved as one grid.
+        """
+        condition = self._date_limit({**self._effective_tx_cond}, None, days[-1])
+        docs = self._tx_collection.find(condition).sort([("date", ASC)])
+        trading_actions = set(self._trading_tx_cond['action']['$in'])
+        cash = 0
+        positions = {}
+        daily_positions = []
+        doc = next(docs, None)
+        for day in days:
+            while doc and doc['date'] <= day:
+                cash += doc.get('amount') or 0
+                if doc['action'] in trading_actions:
+                    self._add_position(positions, Transaction.from_doc(doc))
+                doc = next(docs, None)
+            daily_positions.append((cash, {k: v for k, v in positions.items() if v != 0}))
+
+        held_days = [day for day, (_, pos) in zip(days, daily_positions) if pos]
+        symbols = {symbol: format(Symbol.of(symbol)) for _, pos in daily_positions for symbol in pos}
+        prices = self._provider.get_prices(symbols.values(), held_days)
+
+        balances = {}
+        for day, (cash, pos) in zip(days, daily_positions):
+            balances[day] = self._total_value(cash, pos, {symbol: prices[symbols[symbol], day] for symbol in pos})
+        return balances
+
+    @classmethod
+    def _total_value(cls, cash, positions, prices):
+        total_value = cash
+        for symbol, quantity in positions.items():
+            total_value += quantity * prices[symbol] * (100 if Symbol.of(symbol).is_option() else 1)
+        return round(total_value, 2)
 
     def save_actual_balance(self, balance_map):
         logger.debug("saving actual balance")
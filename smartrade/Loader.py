@@ -4,28 +4,43 @@ import csv
 import datetime
 import json
 import re
+import time
+
+from pymongo.errors import BulkWriteError
 
 from smartrade import app_logger
+from smartrade.Assembler import Assembler
+from smartrade.CashLedger import CashLedger
+from smartrade.indexes import ensure_transaction_flags
 from smartrade.Transaction import Transaction, Validity
-from smartrade.utils import get_database, DESC
+from smartrade.utils import get_database, DateParser, DESC
 
 logger = app_logger.get_logger(__name__)
 
 class Loader:
-    def __init__(self, db_name, account, broker=None):
+    BATCH_SIZE = 1000
+    DUPLICATE_KEY = 11000 # code of the write errors of the documents already saved
+
+    def __init__(self, db_name, account, broker=None, batch_size=BATCH_SIZE):
+        ensure_transaction_flags(db_name, account)
         db = get_database(db_name)
         self._transactions = db.transactions
         self._transaction_groups = db.transaction_groups
         self._account = account[-4:]
         self._account_cond = {'account' : account[-4:]}
         self._valid_tx_cond = {**self._account_cond, 'valid': 1}
+        self._effective_tx_cond = {**self._valid_tx_cond, **Assembler.effective_condition()}
+        self._ledger = CashLedger(db_name, self._effective_tx_cond)
         self._broker = broker
+        self._batch_size = batch_size
+        self._written_tickers = set()
+        self._duplicates = 0
     
     def live_load(self, reload_all=True, start_date=None, end_date=None):
         if not self._broker: raise ValueError("Broker is null")
 
         if not start_date:
-            for obj in self._transactions.find(self._valid_tx_cond).sort([("date", DESC)]).limit(1):
+            for obj in self._transactions.find(self._effective_tx_cond).sort([("date", DESC)]).limit(1):
                 start_date = obj['date'] + datetime.timedelta(1)
         logger.debug("BEGIN: live load account %s from date: %s", self._account, start_date)
         json_obj = self._broker.get_transactions(self._account, start_date, end_date)
@@ -59,12 +74,14 @@ class Loader:
             account = re.match('.*account ([^ ]+) .*', row).groups()[0][-4:]
             if account != self._account: return [], []
 
+            date_parser = DateParser()
             for row in reader:
                 try:
                     date, action, symbol, description, quantity, price, fee, amount, _ = row
                     tx = Transaction.from_dict(
                         account=account, date=date, action=action, symbol=symbol,
-                        quantity=quantity, price=price, fee=fee, amount=amount, description=description)
+                        quantity=quantity, price=price, fee=fee, amount=amount, description=description,
+                        date_parser=date_parser)
                     transactions.append(tx)
                 except Exception as e:
                     logger.error("Error occurred", exc_info=True)
@@ -77,6 +94,7 @@ class Loader:
 
     def _get_transactions(self, json_obj):
         transactions = []
+        date_parser = DateParser()
         for obj in json_obj:
             tx_item = obj['transactionItem']
             account = tx_item.get('accountId', None)
@@ -178,7 +196,7 @@ class Loader:
             tx = Transaction.from_dict(account=self._account, date=date, action=action,
                                        symbol=symbol, quantity=quantity, price=price,
                                        fee=total_fee, amount=amount, description=description,
-                                       tx_id=tx_id, ignored=ignored)
+                                       tx_id=tx_id, ignored=ignored, date_parser=date_parser)
             transactions.append(tx)
         return transactions
 
@@ -191,9 +209,72 @@ class Loader:
             logger.debug("deleted %s transaction groups", res.deleted_count)
             logger.info("END: reload")
         logger.info("BEGIN: insert %s transations", len(transactions))
-        for tx in transactions:
-            self._transactions.insert_one(tx.to_json())
-        logger.info("END: insert %s transations", len(transactions))
+        stats = []
+        error = None
+        for batch in self._batches((tx.to_json() for tx in transactions), self._batch_size):
+            count, elapsed, failed, batch_error = self._insert_batch(batch)
+            stats.append((count, elapsed, failed))
+            error = error or batch_error
+        failed = sum(batch_stats[2] for batch_stats in stats)
+        logger.info("END: insert %s transations in %s batch(es), %s failed", len(transactions), len(stats), failed)
+        # the ledger counts the transactions inserted before the error
+        if reload:
+            self._ledger.rebuild()
+        else:
+            self._ledger.refresh(tx.date for tx in transactions)
+        if error: raise error
+
+        return stats
+
+    def _insert_batch(self, docs):
+        '''
+        Insert a batch of documents, skipping the ones already saved.
+
+        Returns:
+            (document count, elapsed seconds, failed count, BulkWriteError of other errors or None)
+        '''
+        start = time.perf_counter()
+        failed_indexes = set()
+        error = None
+        try:
+            self._transactions.insert_many(docs, ordered=False)
+        except BulkWriteError as e:
+            errors = e.details.get('writeErrors', [])
+            failed_indexes = {write_error['index'] for write_error in errors}
+            duplicates = len([write_error for write_error in errors if write_error.get('code') == self.DUPLICATE_KEY])
+            self._duplicates += duplicates
+            if duplicates < len(errors):
+                error = e
+            logger.error("failed to insert %s of %s transactions(%s duplicate), first error: %s",
+                         len(failed_indexes), len(docs), duplicates, errors[0]['errmsg'] if errors else None)
+        elapsed = time.perf_counter() - start
+        failed = len(failed_indexes)
+        for i, doc in enumerate(docs):
+            if doc.get('ui') and i not in failed_indexes:
+                self._written_tickers.add((doc['account'], doc['ui']))
+        logger.debug("inserted %s transactions in %.3f seconds", len(docs) - failed, elapsed)
+        return len(docs), elapsed, failed, error
+
+    @property
+    def written_tickers(self):
+        """(account, ui) pairs of all the transactions this loader has written."""
+        return self._written_tickers
+
+    @property
+    def duplicates(self):
+        """Number of the transactions this loader has skipped as already saved."""
+        return self._duplicates
+
+    @classmethod
+    def _batches(cls, docs, batch_size):
+        batch = []
+        for doc in docs:
+            batch.append(doc)
+            if len(batch) >= batch_size:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
 
     @classmethod
     def _get_symbol(cls, instrument):
@@ -3,11 +3,18 @@
 import yaml
 
 class MarketApi:
+    HISTORY_DAYS = 365 * 20 # depth of the daily price history
+
+    def history_days(self):
+        return self.HISTORY_DAYS
 
     def get_url(self): ...
 
     def get_daily_prices(self, symbol, start_date, end_date): ...
 
+    def get_daily_prices_of(self, symbols, start_date, end_date):
+        return {symbol: self.get_daily_prices(symbol, start_date, end_date) for symbol in symbols}
+
     @classmethod
     def get_providers(cls, config_path):
         providers = []
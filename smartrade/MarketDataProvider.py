@@ -1,48 +1,128 @@
 # -*- coding: utf-8 -*-
 
-from typing import Iterable, Union
+from typing import Dict, Iterable, Union
 
-from datetime import datetime, time, timedelta, timezone
-from time import sleep
+import asyncio
+import os
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from datetime import date, datetime, time, timedelta, timezone
+from time import monotonic, sleep
 
 from dateutil.parser import parse
+from pymongo import ReplaceOne
 
 from smartrade import app_logger
 from smartrade.BrokerClient import BrokerClient
 from smartrade.MarketApi import MarketApi
+from smartrade.PriceCoverage import PriceCoverage
+from smartrade.PriceStore import PriceStore
+from smartrade.QuoteCache import QuoteCache
 from smartrade.Transaction import Symbol
 from smartrade.exceptions import TooManyRequestsError
-from smartrade.utils import check, get_database, ASC, DESC
+from smartrade.utils import backoff_delay, get_database, ASC, DESC
 
 logger = app_logger.get_logger(__name__)
 
+class PriceGrid:
+    """Prices of symbols (rows) on days (columns)."""
+
+    def __init__(self, symbols, days):
+        self.symbols = symbols
+        self.days = days
+        self.values = [[0] * len(days) for _ in symbols]
+        self._rows = {symbol: i for i, symbol in enumerate(symbols)}
+        self._columns = {day: j for j, day in enumerate(days)}
+
+    def __getitem__(self, key):
+        if isinstance(key, tuple):
+            symbol, day = key
+            return self.values[self._rows[symbol]][self._columns[day]]
+        return self.values[self._rows[key]]
+
+    def column(self, day):
+        j = self._columns[day]
+        return [row[j] for row in self.values]
+
+    def to_dict(self):
+        return {symbol: dict(zip(self.days, row)) for symbol, row in zip(self.symbols, self.values)}
+
+    def to_numpy(self):
+        import numpy # optional dependency
+        return numpy.array(self.values, dtype=float)
+
+
 class MarketDataProvider:
     OPEN_TIME = time(13, 30)
     CLOSE_TIME = time(20)
 
-    def __init__(self, broker: BrokerClient, market_api: MarketApi, db_name: str):
+    HOURS_MISS_TTL = 3600 # seconds before the calendar is reloaded for a day missing from it
+    UNSETTLED_DAYS = 2 # latest days whose daily prices may not be published yet
+    QUOTE_CHUNK_SIZE = 100 # symbols per broker quote request
+    QUOTE_WORKERS = 4
+    MAX_QUOTE_RETRIES = 6
+    QUOTE_TTL = float(os.getenv('QUOTE_TTL', 15)) # seconds a live quote stays fresh during market hours
+
+    def __init__(self, broker: BrokerClient, market_api: MarketApi, db_name: str, quote_cache: QuoteCache = None,
+                 price_store: PriceStore = None):
         self._broker = broker
         self._api = market_api
         db = get_database(db_name)
         self._quote_collection = db.quotes
         self._price_collection = db.price_history
+        self._hours_collection = db.market_hours
+        self._hours_lock = threading.Lock()
+        self._market_hours = {} # date => (open time, close time) or None when market is closed
+        self._calendar_loaded = None # monotonic time of the last calendar load
+        self._quote_lock = threading.Lock()
+        self._quote_executor = None
+        self._pending_quotes = {} # symbol => Future of the in-flight quote request
+        self._quote_cache = quote_cache or QuoteCache() # may be shared by providers
+        self._price_store = price_store # optional local copy of price_history
+        self._store_lock = threading.Lock()
+        self._synced_symbols = set() # symbols whose earlier saved prices are copied into the price store
+        self._coverage = PriceCoverage(db_name)
 
-    @classmethod
-    def _trading_day(cls, day):
-        weekday = day.weekday()
-        if 0 <= weekday < 5: return day
+    def _calendar_hours(self, day: date):
+        '''
+        Market hours of the day from the in-memory calendar backed by the market_hours collection,
+        defaulting to the regular hours of weekdays when the day has never been retrieved.
+        Never calls the broker, and queries the collection at most once per HOURS_MISS_TTL however many days miss.
+        '''
+        with self._hours_lock:
+            if day not in self._market_hours and (
+                    self._calendar_loaded is None or monotonic() - self._calendar_loaded > self.HOURS_MISS_TTL):
+                # the whole calendar at once, including the days retrieved by other processes since the last load
+                self._market_hours.update((doc['date'].date(), self._hours_of_doc(doc))
+                                          for doc in self._hours_collection.find())
+                self._calendar_loaded = monotonic()
+            if day in self._market_hours: return self._market_hours[day]
+
+        if day.weekday() >= 5: return None
 
-        return day - timedelta((weekday + 3) % 7)
+        time_zone = timezone.utc
+        return (datetime.combine(day, self.OPEN_TIME).replace(tzinfo=time_zone),
+                datetime.combine(day, self.CLOSE_TIME).replace(tzinfo=time_zone))
+
+    def _in_calendar(self, day: date):
+        self._calendar_hours(day) # load the calendar if it's never loaded
+        with self._hours_lock:
+            return day in self._market_hours
 
     @classmethod
-    def _trading_time(cls, day, time_zone=timezone.utc):
-        trading_day = cls._trading_day(day)
-        open_time = datetime.combine(trading_day, cls.OPEN_TIME).replace(tzinfo=time_zone)
-        if trading_day < open_time:
-            trading_day = cls._trading_day(trading_day - timedelta(days=1))
-            open_time = datetime.combine(trading_day, cls.OPEN_TIME).replace(tzinfo=time_zone)
-        close_time = datetime.combine(trading_day, cls.CLOSE_TIME).replace(tzinfo=time_zone)
-        return (open_time, close_time)
+    def _hours_of_doc(cls, doc):
+        if not doc['open']: return None
+
+        return doc['open'].replace(tzinfo=timezone.utc), doc['close'].replace(tzinfo=timezone.utc)
+
+    def _trading_time(self, day):
+        '''(open time, close time) of the latest trading session opened by the given time.'''
+        trading_day = day.date()
+        while True:
+            hours = self._calendar_hours(trading_day)
+            if hours and hours[0] <= day: return hours
+
+            trading_day -= timedelta(days=1)
 
     @classmethod
     def _day_range(cls, day, min_time=None, max_time=None):
@@ -71,13 +151,6 @@ class MarketDataProvider:
         now = datetime.now(time_zone)
         market_open_time, market_close_time = self._trading_time(now)
         logger.debug("open time: %s, close time: %s", market_open_time, market_close_time)
-        market_hours = self.get_market_hours(now)
-        if market_hours:
-            if False: # TODO: may differ due to time zone
-                check(market_hours[0] == market_open_time, f"{market_hours[0]} should equal to {market_open_time}")
-                check(market_hours[1] == market_close_time, f"{market_hours[1]} should equal to {market_close_time}")
-        else: # weekend, holiday or any day before today
-            logger.info("market hours is unavailable") # TODO: check a non-weekend holiday
         if not day:
             day = now
         elif isinstance(day, str):
@@ -111,6 +184,88 @@ class MarketDataProvider:
                 quotes[symbol] = self._quote_info(doc)
         return quotes, False
     
+    def submit_quotes(self, symbols: Iterable[str]) -> Dict[str, Future]:
+        '''
+        Quote symbols in the background. Fresh quotes come from the quote cache, the in-flight requests
+        of the same symbols are shared, and the others are quoted in chunks of QUOTE_CHUNK_SIZE symbols
+        per `get_quotes` call.
+
+        Returns:
+            dict of symbol => Future of (quote or None, real quote)
+        '''
+        futures = {}
+        new_symbols = []
+        with self._quote_lock:
+            for symbol in dict.fromkeys(symbols):
+                cached = self._quote_cache.get(symbol)
+                if cached:
+                    futures[symbol] = Future()
+                    futures[symbol].set_result(cached)
+                    continue
+
+                future = self._pending_quotes.get(symbol, None)
+                if not future:
+                    future = self._pending_quotes[symbol] = Future()
+                    new_symbols.append(symbol)
+                futures[symbol] = future
+            if new_symbols and not self._quote_executor:
+                self._quote_executor = ThreadPoolExecutor(self.QUOTE_WORKERS, thread_name_prefix="quote")
+        for i in range(0, len(new_symbols), self.QUOTE_CHUNK_SIZE):
+            chunk = new_symbols[i:i + self.QUOTE_CHUNK_SIZE]
+            self._quote_executor.submit(self._quote_chunk, chunk, [futures[symbol] for symbol in chunk])
+        return futures
+
+    def _quote_chunk(self, symbols, futures):
+        results = error = None
+        try:
+            quotes, actual = self.get_quotes(symbols)
+            results = [(quotes.get(symbol, None), actual) for symbol in symbols]
+            # the old quotes resorted to are retried next time
+            if actual:
+                ttl = self._quote_ttl()
+                for symbol, result in zip(symbols, results):
+                    if result[0]:
+                        self._quote_cache.put(symbol, result, ttl)
+        except Exception as e:
+            logger.error("failed to quote %s (error type: %s, error: %s)", symbols, type(e), e)
+            error = e
+        with self._quote_lock:
+            for symbol in symbols:
+                self._pending_quotes.pop(symbol, None)
+        for i, future in enumerate(futures):
+            if error:
+                future.set_exception(error)
+            else:
+                future.set_result(results[i])
+
+    def _quote_ttl(self, now=None):
+        """Seconds a quote taken at the time(default: now) stays fresh: until the next market open after the close."""
+        now = now or datetime.now(timezone.utc)
+        open_time, close_time = self._trading_time(now)
+        if open_time <= now < close_time: return self.QUOTE_TTL
+
+        day = now.date()
+        while True:
+            hours = self._calendar_hours(day)
+            if hours and hours[0] > now: return max((hours[0] - now).total_seconds(), self.QUOTE_TTL)
+
+            day += timedelta(days=1)
+
+    def quote_cache_stats(self):
+        return self._quote_cache.stats()
+
+    def get_latest_quotes(self, symbols: Iterable[str]):
+        '''
+        Returns:
+            dict of symbol => (quote or None, real quote)
+        '''
+        return {symbol: future.result() for symbol, future in self.submit_quotes(symbols).items()}
+
+    async def get_latest_quotes_async(self, symbols: Iterable[str]):
+        futures = self.submit_quotes(symbols)
+        results = await asyncio.gather(*(asyncio.wrap_future(future) for future in futures.values()))
+        return dict(zip(futures, results))
+
     def _quote_info(self, doc):
         return ((doc['bidPrice'] + doc['askPrice']) / 2,
                 doc['netChange'],
@@ -119,21 +274,27 @@ class MarketDataProvider:
                 )
 
     def _retrieve_and_save(self, symbols, day):
-        while True:
+        for attempt in range(self.MAX_QUOTE_RETRIES + 1):
             try:
                 logger.debug("retrieving quote(latest market price) of %s at time %s...", symbols, day)
                 self._do_retrieve_and_save(symbols, day)
                 return True
-            except TooManyRequestsError:
-                logger.warn("Too many requests, retry after 30 seconds...")
-                sleep(30)
+            except TooManyRequestsError as e:
+                if attempt == self.MAX_QUOTE_RETRIES: break
+
+                delay = backoff_delay(attempt, e.retry_after)
+                logger.warning("Too many requests, retry after %.1f seconds...", delay)
+                sleep(delay)
             except Exception as e:
                 # logger.error("Error occurred", exc_info=True)
                 logger.error("failed to quote (error type: %s, error: %s)", type(e), e)
                 return False
+        logger.error("failed to quote %s: too many requests", symbols)
+        return False
 
     def _do_retrieve_and_save(self, symbols, day):
         quotes = self._broker.get_quotes(symbols)
+        requests = []
         for symbol, quote in quotes.items():
             specifier = {**self._day_range(day), 'symbol': symbol}
             q = {'symbol': symbol, 'date': day}
@@ -151,7 +312,9 @@ class MarketDataProvider:
             else:
                 for key in ('52WkHigh', '52WkLow',  'peRatio'):
                     q[key] = quote[key]
-            self._quote_collection.replace_one(specifier, q, upsert=True)
+            requests.append(ReplaceOne(specifier, q, upsert=True))
+        if requests:
+            self._quote_collection.bulk_write(requests, ordered=False)
 
     def get_daily_price_history(self, symbol, start_date=None, end_date=None):
         '''
@@ -160,14 +323,9 @@ class MarketDataProvider:
         start_date: date in UTC timezone, default: earliest yesterday
         end_date: date in UTC timezone, default: latest yesterday
         '''
-        today = datetime.utcnow().date()
         time_zone = timezone.utc
-        earliest_today = datetime.combine(today, datetime.min.time()).replace(tzinfo=time_zone)
-        latest_day = earliest_today - timedelta(milliseconds=1)
-        symbol_obj = Symbol(symbol)
-        if symbol_obj.is_option():
-            latest_day = min(latest_day, datetime.combine(symbol_obj.expired, datetime.min.time()).replace(tzinfo=time_zone))
-            #TODO: option price may not available when it's 0
+        earliest_today = datetime.combine(datetime.utcnow().date(), datetime.min.time()).replace(tzinfo=time_zone)
+        latest_day = self._latest_price_day(symbol)
         if not end_date or end_date > latest_day:
             end_date = latest_day
 
@@ -175,35 +333,150 @@ class MarketDataProvider:
             start_date = earliest_today - timedelta(days=1)
         if start_date > end_date: return []
 
-        next_saved_time = None
-        for doc in self._price_collection.find({'symbol': symbol}).sort([("time", DESC)]).limit(1):
-            next_saved_time = doc['time'].replace(tzinfo=time_zone) + timedelta(days=1)
-        logger.debug(f"next_save_time: {next_saved_time}, end_date: {end_date}")
-        if next_saved_time and next_saved_time >= end_date:
-            logger.info(f"all prices of {symbol} were retrieved before")
-        elif next_saved_time:
-            logger.info(f"part of prices of {symbol} were retrieved before")
-            self._retrieve_and_save_daily_prices(symbol, next_saved_time, latest_day, True)
-        else:
-            logger.info(f"price of {symbol} is never retrieved before")
-            self._retrieve_and_save_daily_prices(symbol, earliest_today - timedelta(days=365*20), latest_day, False)
+        self._update_price_history(symbol, start_date, end_date)
+
+        if self._price_store:
+            return PriceStore.to_docs(symbol, self._price_store.read(symbol, start_date, end_date))
 
         res = self._price_collection.find(
             {'symbol': symbol, 'time': {'$gte': start_date, '$lte': end_date}}).sort([("time", ASC)])
         return [doc for doc in res]
-    
-    def _retrieve_and_save_daily_prices(self, symbol, start_date, end_date, short_term):
-        logger.info(f"Retrieving price history of {symbol} from {start_date} to {end_date}...")
-        if '_' in symbol or short_term: # delta < 365 * 2:
+
+    @classmethod
+    def _latest_price_day(cls, symbol):
+        """Latest time of the available daily prices: yesterday or expiration day."""
+        time_zone = timezone.utc
+        earliest_today = datetime.combine(datetime.utcnow().date(), datetime.min.time()).replace(tzinfo=time_zone)
+        latest_day = earliest_today - timedelta(milliseconds=1)
+        symbol_obj = Symbol.of(symbol)
+        if symbol_obj.is_option():
+            latest_day = min(latest_day, datetime.combine(symbol_obj.expired, datetime.min.time()).replace(tzinfo=time_zone))
+            #TODO: option price may not available when it's 0
+        return latest_day
+
+    def _update_price_history(self, symbol, start_date, end_date, ranges=None):
+        """Retrieve the daily prices of the days between the dates that haven't been retrieved before."""
+        if self._price_store:
+            self._sync_price_store(symbol)
+        if ranges is None:
+            ranges = self.coverage_ranges([symbol])[symbol]
+        if not ranges:
+            logger.info(f"price of {symbol} is never retrieved before")
+            # retrieve the whole history at once so that later requests are served locally
+            start_date = min(start_date, self.history_start(self.price_source(symbol)))
+        for start, end in self.missing_price_ranges(symbol, start_date, end_date, ranges):
             # free polygon api only support 2-year history
-            res = self._api.get_daily_prices(symbol, start_date, end_date)
-        else:
-            # TDAmeritrade doesn't support option and some stock data(e.g. HOOD) sometimes are unavailable
-            res = self._broker.get_daily_prices(symbol, start_date, end_date)
+            source = 'api' if start >= self.history_start('api') else self.price_source(symbol)
+            self.backfill_daily_prices(symbol, start, end, source)
+
+    def _save_daily_prices(self, symbol, res):
+        requests = []
         for doc in res:
             doc['symbol'] = symbol
-            specifier = {'time': doc['time'], 'symbol': symbol}
-            self._price_collection.replace_one(specifier, doc, upsert=True)
+            specifier = {'symbol': symbol, 'time': doc['time']}
+            requests.append(ReplaceOne(specifier, doc, upsert=True))
+        if requests:
+            self._price_collection.bulk_write(requests, ordered=False)
+        if self._price_store and res:
+            self._price_store.save(symbol, res)
+
+    def price_source(self, symbol):
+        """Name of the client serving the daily price history of the symbol: options are only available from the api."""
+        return 'api' if Symbol.of(symbol).is_option() else 'broker'
+
+    def broker_requests_per_minute(self):
+        return self._broker.requests_per_minute()
+
+    def history_start(self, source):
+        """Earliest day of the daily price history available from the source."""
+        client = self._api if source == 'api' else self._broker
+        earliest_today = datetime.combine(datetime.utcnow().date(), datetime.min.time()).replace(tzinfo=timezone.utc)
+        return earliest_today - timedelta(days=client.history_days())
+
+    def backfill_daily_prices(self, symbol, start_date, end_date, source):
+        """Retrieve and save the daily prices of the symbol from the source, return the number of prices."""
+        logger.info(f"Retrieving price history of {symbol} from {start_date} to {end_date} via {source}...")
+        client = self._api if source == 'api' else self._broker
+        res = client.get_daily_prices(symbol, start_date, end_date)
+        self._save_daily_prices(symbol, res)
+        # the range is covered even if it has no prices, except the latest days not published yet
+        end_day = end_date.date()
+        unsettled_day = datetime.utcnow().date() - timedelta(days=self.UNSETTLED_DAYS)
+        if end_day >= unsettled_day:
+            end_day = max([unsettled_day - timedelta(days=1), *(doc['time'].date() for doc in res)])
+        if end_day >= start_date.date():
+            self._coverage.add(symbol, (start_date, end_day))
+        return len(res)
+
+    def coverage_ranges(self, symbols):
+        """symbol => retrieved day ranges, seeded from the saved prices of the symbols never recorded."""
+        ranges = self._coverage.ranges_of(symbols)
+        unrecorded = [symbol for symbol in symbols if symbol not in ranges]
+        if unrecorded:
+            seeded = self._saved_price_ranges(unrecorded)
+            self._coverage.seed(seeded)
+            for symbol in unrecorded:
+                ranges[symbol] = seeded.get(symbol, [])
+        return ranges
+
+    def _saved_price_ranges(self, symbols):
+        """symbol => (first day, last day) runs of the saved prices, split wherever a trading day has no price."""
+        runs = {}
+        for doc in self._price_collection.find({'symbol': {'$in': symbols}}, {'symbol': 1, 'time': 1}) \
+                                         .sort([('symbol', ASC), ('time', ASC)]):
+            day = doc['time'].date()
+            symbol_runs = runs.setdefault(doc['symbol'], [])
+            # e.g. an earlier retrieval failed mid-way
+            if symbol_runs and not self.has_trading_day(symbol_runs[-1][1] + timedelta(days=1), day - timedelta(days=1)):
+                symbol_runs[-1] = (symbol_runs[-1][0], day)
+            else:
+                symbol_runs.append((day, day))
+        return runs
+
+    def missing_price_ranges(self, symbol, start_date, end_date, ranges=None):
+        '''
+        (start time, end time) ranges between the dates whose daily prices need to be retrieved.
+        Ranges without trading days are recorded as retrieved instead.
+        '''
+        if ranges is None:
+            ranges = self.coverage_ranges([symbol])[symbol]
+        time_zone = timezone.utc
+        missing = []
+        closed = []
+        for start_day, end_day in PriceCoverage.missing(ranges, start_date, end_date):
+            if not self.has_trading_day(start_day, end_day):
+                closed.append((start_day, end_day))
+                continue
+
+            start = datetime.combine(start_day, datetime.min.time()).replace(tzinfo=time_zone)
+            end = min(datetime.combine(end_day, datetime.max.time()).replace(tzinfo=time_zone), end_date)
+            missing.append((start, end))
+        if closed:
+            self._coverage.add(symbol, *closed)
+        return missing
+
+    def has_trading_day(self, start_day: date, end_day: date):
+        """Whether market opens on any day between the days (inclusive) according to the calendar."""
+        day = start_day
+        while day <= end_day:
+            if self._calendar_hours(day): return True
+
+            day += timedelta(days=1)
+        return False
+
+    def _sync_price_store(self, symbol):
+        """Copy the prices saved in price_history after the last time in the price store, once per symbol
+        since the prices retrieved afterwards are saved into both.
+        """
+        with self._store_lock:
+            if symbol in self._synced_symbols: return
+
+            self._synced_symbols.add(symbol)
+        last_time = self._price_store.last_time(symbol)
+        condition = {'symbol': symbol}
+        if last_time:
+            condition['time'] = {'$gt': last_time}
+        self._price_store.save(symbol, self._price_collection.find(condition))
 
     def get_price(self, symbol, day : datetime = None):
         '''
@@ -232,14 +505,129 @@ class MarketDataProvider:
         #return prices[-1]['weighted_average'] if prices else 0
         return prices[-1]['close'] if prices else 0
     
+    def get_prices(self, symbols: Iterable[str], days: Iterable[datetime]):
+        '''
+        Prices of every symbol on every day with the same fallbacks as `get_price`:
+        the close quote saved on the day, otherwise the prior close in the last 10 days.
+        Past days are answered by one price history and one quote query, missing price history
+        is retrieved once per symbol, and days after yesterday share the same live quotes.
+
+        days: dates in UTC timezone
+        Returns:
+            PriceGrid of symbols x days
+        '''
+        symbols = list(dict.fromkeys(symbols))
+        days = list(days)
+        grid = PriceGrid(symbols, days)
+        if not symbols or not days: return grid
+
+        time_zone = timezone.utc
+        utc_days = sorted({day.replace(tzinfo=time_zone) for day in days})
+        latest_yesterday = datetime.combine(datetime.utcnow().date(), datetime.min.time()).replace(tzinfo=time_zone) \
+            - timedelta(milliseconds=1)
+        past_days = [day for day in utc_days if day <= latest_yesterday]
+        prices = {}
+        if past_days:
+            prices.update(self._get_past_prices(symbols, past_days))
+        if len(past_days) < len(utc_days):
+            latest_prices = {symbol: quote[0] for symbol, (quote, actual) in self.get_latest_quotes(symbols).items()
+                             if actual and quote and quote[0]}
+            unquoted = [symbol for symbol in symbols if symbol not in latest_prices]
+            if unquoted:
+                logger.warning("cannot find the quotes of symbols %s", unquoted)
+                for (symbol, _), price in self._get_past_prices(unquoted, [latest_yesterday]).items():
+                    latest_prices[symbol] = price
+            for symbol in symbols:
+                for day in utc_days[len(past_days):]:
+                    prices[symbol, day] = latest_prices[symbol]
+        for i, symbol in enumerate(symbols):
+            grid.values[i] = [prices[symbol, day.replace(tzinfo=time_zone)] for day in days]
+        return grid
+
+    def _get_past_prices(self, symbols, days):
+        time_zone = timezone.utc
+        start_date = days[0] - timedelta(days=10)
+        end_date = datetime.combine(days[-1].date(), datetime.max.time()).replace(tzinfo=time_zone)
+        coverage = self.coverage_ranges(symbols)
+        with ThreadPoolExecutor(self.QUOTE_WORKERS, thread_name_prefix="price") as executor:
+            # the market api limits its own request rate
+            updates = [executor.submit(self._update_price_history, symbol, start_date,
+                                       min(end_date, self._latest_price_day(symbol)), coverage[symbol])
+                       for symbol in symbols if start_date <= self._latest_price_day(symbol)]
+            for update in updates:
+                update.result()
+
+        history = {symbol: [] for symbol in symbols}
+        if self._price_store:
+            for symbol in symbols:
+                records = self._price_store.read(symbol, start_date, end_date)
+                history[symbol] = [(time.replace(tzinfo=time_zone), close) for time, close
+                                   in zip(records['time'].astype(datetime).tolist(), records['close'].tolist())]
+        else:
+            for doc in self._price_collection.find(
+                    {'symbol': {'$in': symbols}, 'time': {'$gte': start_date, '$lte': end_date}}).sort([("time", ASC)]):
+                history[doc['symbol']].append((doc['time'].replace(tzinfo=time_zone), doc['close']))
+        close_quotes = {}
+        for doc in self._quote_collection.find(
+                {'symbol': {'$in': symbols}, 'date': {'$gte': start_date, '$lte': end_date}}):
+            if doc['date'].time() >= self.CLOSE_TIME:
+                close_quotes[doc['symbol'], doc['date'].date()] = self._quote_info(doc)[0]
+
+        close_days = {day: self._trading_time(day)[1].date() for day in days}
+        prices = {}
+        for symbol in symbols:
+            symbol_history = history[symbol]
+            i = 0
+            for day in days:
+                price = close_quotes.get((symbol, close_days[day]), None)
+                if price is None:
+                    day_end = datetime.combine(day.date(), datetime.max.time()).replace(tzinfo=time_zone)
+                    while i < len(symbol_history) and symbol_history[i][0] <= day_end:
+                        i += 1
+                    last = symbol_history[i - 1] if i > 0 else None
+                    price = last[1] if last and last[0] >= day - timedelta(days=10) else 0
+                prices[symbol, day] = price
+        return prices
+
     def get_market_hours(self, day=None):
+        '''
+        Market hours of the day in UTC timezone, retrieved from the broker and saved when not in the calendar.
+
+        Returns:
+            (open time, close time), or None if market is closed
+        '''
         if not day:
-            day = datetime.now()
+            day = datetime.now(timezone.utc)
         elif isinstance(day, str):
             day = parse(day)
-        hours = self._broker.get_market_hours(day)
-        if not hours:
-            return None
-        
-        start, end = hours
-        return parse(start), parse(end)
+        if isinstance(day, datetime):
+            day = day.date()
+        if not self._in_calendar(day):
+            self._retrieve_and_save_market_hours(day)
+        return self._calendar_hours(day)
+
+    def load_market_hours(self, start_date, end_date):
+        '''Retrieve market hours of the days that are not in the calendar yet.'''
+        day = start_date.date() if isinstance(start_date, datetime) else start_date
+        end_day = end_date.date() if isinstance(end_date, datetime) else end_date
+        while day <= end_day:
+            if not self._in_calendar(day):
+                self._retrieve_and_save_market_hours(day)
+            day += timedelta(days=1)
+
+    def _retrieve_and_save_market_hours(self, day):
+        try:
+            hours = self._broker.get_market_hours(datetime.combine(day, datetime.min.time()))
+        except Exception as e:
+            logger.error("failed to retrieve market hours of %s (error type: %s, error: %s)", day, type(e), e)
+            return False
+
+        if hours:
+            hours = tuple(parse(t).astimezone(timezone.utc) for t in hours)
+        self._hours_collection.replace_one(
+            {'date': datetime.combine(day, datetime.min.time())},
+            {'date': datetime.combine(day, datetime.min.time()),
+             'open': hours[0] if hours else None, 'close': hours[1] if hours else None}, upsert=True)
+        with self._hours_lock:
+            self._market_hours[day] = hours
+        return True
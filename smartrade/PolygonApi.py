@@ -1,39 +1,84 @@
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 import time
 
 import requests
+from requests.adapters import HTTPAdapter
 
 from smartrade import app_logger
-from smartrade.exceptions import TooManyRequestsError
+from smartrade.exceptions import ServerError, TooManyRequestsError
 from smartrade.MarketApi import MarketApi
+from smartrade.TokenBucket import TokenBucket
 from smartrade.Transaction import Symbol
-from smartrade.utils import http_response
+from smartrade.utils import backoff_delay, http_response
 
 logger = app_logger.get_logger(__name__)
 
 class PolygonApi(MarketApi):
+    REQUESTS_PER_MINUTE = 5 # quota of the free plan
+    TIMEOUT = 30 # seconds
+    MAX_RETRIES = 6
+    MAX_WORKERS = 4
+    HISTORY_DAYS = 365 * 2 # history depth of the free plan
+
     def __init__(self, config):
         self._api_key = config['api_key']
         self._url = config['url']
+        self._timeout = config.get('timeout', self.TIMEOUT)
+        self._max_retries = config.get('max_retries', self.MAX_RETRIES)
+        self._max_workers = config.get('max_workers', self.MAX_WORKERS)
+        self._history_days = config.get('history_days', self.HISTORY_DAYS)
+        rate = config.get('requests_per_minute', self.REQUESTS_PER_MINUTE)
+        self._bucket = TokenBucket(rate / 60, config.get('burst', rate))
+        # keep-alive connections shared by the concurrent requests
+        self._session = requests.Session()
+        self._session.mount(self._url, HTTPAdapter(pool_connections=1, pool_maxsize=self._max_workers))
+
+    def history_days(self):
+        return self._history_days
+
+    def _get(self, path):
+        """GET json of the path within the request quota, retrying on rate limit, server and connection errors.
+
+        The error of the last attempt is raised when the retries run out.
+        """
+        for attempt in range(self._max_retries + 1):
+            self._bucket.acquire()
+            retry_after = None
+            try:
+                r = self._session.get(f"{self._url}{path}", params={'apiKey': self._api_key}, timeout=self._timeout)
+                if r.status_code < 500:
+                    return http_response(r)
+
+                logger.warning("server error %s of %s", r.status_code, path)
+                error = ServerError(f"server error {r.status_code} of {path}")
+            except TooManyRequestsError as e:
+                self._bucket.drain()
+                retry_after = e.retry_after
+                error = e
+            except (requests.ConnectionError, requests.Timeout) as e:
+                logger.warning("failed to request %s (error type: %s, error: %s)", path, type(e), e)
+                error = e
+            if attempt == self._max_retries: break
+
+            delay = backoff_delay(attempt, retry_after)
+            logger.warning("retry %s after %.1f seconds", path, delay)
+            time.sleep(delay)
+        raise error
 
     def get_daily_prices(self, symbol, start_date, end_date):
         logger.debug("get daily price for %s", symbol)
         start = start_date.strftime("%Y-%m-%d")
         end = end_date.strftime("%Y-%m-%d")
-        symbol_obj = Symbol(symbol)
+        symbol_obj = Symbol.of(symbol)
         s = f"O:{symbol_obj:x}" if symbol_obj.is_option() else symbol
-        while True:
-            try:
-                r = requests.get(f"{self._url}/v2/aggs/ticker/{s}/range/1/day/{start}/{end}?apiKey={self._api_key}")
-                json = http_response(r)
-                count = json.get('resultsCount', -1)
-                if count == 0: return []
-                if count > 0: break
-            except TooManyRequestsError: 
-                logger.warning("wait 30 seconds for the next request of the price of symbol %s", symbol)
-                time.sleep(30)
-
-        res = r.json()['results']
+        json = self._get(f"/v2/aggs/ticker/{s}/range/1/day/{start}/{end}")
+        count = json.get('resultsCount', -1)
+        if count < 0:
+            logger.warning("unexpected response of the price of symbol %s: %s", symbol, json)
+        if count <= 0: return []
+
+        res = json['results']
         for obj in res:
             obj['open'] = obj.pop('o')
             obj['close'] = obj.pop('c')
@@ -43,4 +88,11 @@ class PolygonApi(MarketApi):
             obj['weighted_average'] = obj.pop('vw')
             obj['transactions'] = obj.pop('n')
             obj['time'] = datetime.fromtimestamp(obj.pop('t') / 1000)
-        return res
\ No newline at end of file
+        return res
+
+    def get_daily_prices_of(self, symbols, start_date, end_date):
+        """Daily prices of many symbols fetched concurrently within the request quota: dict of symbol => prices."""
+        with ThreadPoolExecutor(self._max_workers, thread_name_prefix="polygon") as executor:
+            futures = {symbol: executor.submit(self.get_daily_prices, symbol, start_date, end_date)
+                       for symbol in dict.fromkeys(symbols)}
+            return {symbol: future.result() for symbol, future in futures.items()}
@@ -0,0 +1,89 @@
+# -*- coding: utf-8 -*-
+
+import threading
+from datetime import date, datetime, timedelta
+
+from pymongo import ReplaceOne
+
+from smartrade import app_logger
+from smartrade.utils import get_database
+
+logger = app_logger.get_logger(__name__)
+
+class PriceCoverage:
+    """Per-symbol sets of the day ranges whose daily prices have been retrieved, including the ranges
+    known to have no prices, persisted in the price_coverage collection next to price_history.
+    """
+
+    def __init__(self, db_name):
+        self._collection = get_database(db_name).price_coverage
+        self._lock = threading.Lock()
+
+    @classmethod
+    def _day(cls, time):
+        return time.date() if isinstance(time, datetime) else time
+
+    @classmethod
+    def _to_ranges(cls, doc):
+        return [(start.date(), end.date()) for start, end in doc['ranges']]
+
+    def ranges(self, symbol):
+        """Sorted disjoint (first day, last day) ranges retrieved for the symbol, None if it's never recorded."""
+        doc = self._collection.find_one({'symbol': symbol})
+        return self._to_ranges(doc) if doc else None
+
+    def ranges_of(self, symbols):
+        """symbol => ranges of the symbols that have been recorded."""
+        return {doc['symbol']: self._to_ranges(doc) for doc in self._collection.find({'symbol': {'$in': list(symbols)}})}
+
+    @classmethod
+    def missing(cls, ranges, start_day: date, end_day: date):
+        """Sub-ranges of [start_day, end_day] not covered by the ranges."""
+        start_day, end_day = cls._day(start_day), cls._day(end_day)
+        gaps = []
+        for first, last in ranges or []:
+            if last < start_day: continue
+            if first > end_day: break
+
+            if first > start_day:
+                gaps.append((start_day, first - timedelta(days=1)))
+            start_day = last + timedelta(days=1)
+        if start_day <= end_day:
+            gaps.append((start_day, end_day))
+        return gaps
+
+    @classmethod
+    def merge(cls, ranges, start_day: date, end_day: date):
+        """Ranges with [start_day, end_day] added, merging the overlapping and adjacent ones."""
+        start_day, end_day = cls._day(start_day), cls._day(end_day)
+        merged = []
+        for first, last in ranges or []:
+            if last + timedelta(days=1) < start_day or first > end_day + timedelta(days=1):
+                merged.append((first, last))
+            else:
+                start_day, end_day = min(first, start_day), max(last, end_day)
+        merged.append((start_day, end_day))
+        return sorted(merged)
+
+    def add(self, symbol, *day_ranges):
+        """Record the (first day, last day) ranges as retrieved for the symbol."""
+        with self._lock:
+            ranges = self.ranges(symbol) or []
+            for start_day, end_day in day_ranges:
+                ranges = self.merge(ranges, start_day, end_day)
+            self._save([(symbol, ranges)])
+
+    def _save(self, symbol_ranges):
+        requests = []
+        for symbol, ranges in symbol_ranges:
+            doc = {'symbol': symbol, 'ranges': [[datetime.combine(first, datetime.min.time()),
+                                                 datetime.combine(last, datetime.min.time())] for first, last in ranges]}
+            requests.append(ReplaceOne({'symbol': symbol}, doc, upsert=True))
+        if requests:
+            self._collection.bulk_write(requests, ordered=False)
+
+    def seed(self, symbol_ranges):
+        """Record the ranges of the prices saved for the symbols that predate the coverage as retrieved."""
+        with self._lock:
+            self._save(symbol_ranges.items())
+        logger.debug("seeded coverage of %s symbols", len(symbol_ranges))
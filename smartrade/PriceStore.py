@@ -0,0 +1,123 @@
+# -*- coding: utf-8 -*-
+
+import os
+import threading
+from datetime import datetime, timezone
+
+try:
+    import numpy
+except ImportError: # optional dependency
+    numpy = None
+
+from smartrade import app_logger
+
+logger = app_logger.get_logger(__name__)
+
+class PriceStore:
+    """Local columnar store of daily prices: one file of fixed-size records per symbol in time order,
+    read through numpy memory maps so that range reads are slices of the mapped file.
+    """
+
+    FIELDS = ('open', 'high', 'low', 'close', 'volume', 'weighted_average')
+
+    def __init__(self, root_dir):
+        if numpy is None:
+            raise ImportError("numpy is required by PriceStore")
+
+        self._root_dir = root_dir
+        self._dtype = numpy.dtype([('time', 'datetime64[ms]')] + [(field, 'f8') for field in self.FIELDS])
+        self._lock = threading.Lock()
+        self._maps = {} # symbol => ((inode, modification time, file size), memmap)
+        os.makedirs(root_dir, exist_ok=True)
+
+    @classmethod
+    def from_env(cls):
+        """Store under the PRICE_STORE_DIR environment variable, or None if it's unset or numpy is missing."""
+        root_dir = os.getenv('PRICE_STORE_DIR', None)
+        if not root_dir: return None
+
+        if numpy is None:
+            logger.warning("price store %s is disabled since numpy is not installed", root_dir)
+            return None
+        return cls(root_dir)
+
+    def _path(self, symbol):
+        return os.path.join(self._root_dir, f"{symbol}.prices")
+
+    def _array(self, symbol):
+        """Memory map of the symbol's file, reopened once the file is appended or replaced(e.g. by another process)."""
+        path = self._path(symbol)
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            return numpy.zeros(0, self._dtype)
+        if stat.st_size == 0: return numpy.zeros(0, self._dtype)
+
+        version = (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+        cached = self._maps.get(symbol, None)
+        if cached and cached[0] == version: return cached[1]
+
+        array = numpy.memmap(path, self._dtype, mode='r', shape=(stat.st_size // self._dtype.itemsize,))
+        self._maps[symbol] = (version, array)
+        return array
+
+    @classmethod
+    def _utc(cls, time):
+        if time.tzinfo:
+            time = time.astimezone(timezone.utc).replace(tzinfo=None)
+        return numpy.datetime64(time, 'ms')
+
+    def last_time(self, symbol):
+        array = self._array(symbol)
+        return array['time'][-1].astype(datetime) if len(array) else None
+
+    def _record(self, doc):
+        values = (doc.get(field, None) for field in self.FIELDS)
+        return (self._utc(doc['time']), *(numpy.nan if value is None else value for value in values))
+
+    def save(self, symbol, docs):
+        """Save the price docs, return the number of saved records.
+
+        Docs later than the last stored time are appended, the others replace the stored records of their times
+        by rewriting the file.
+        """
+        with self._lock:
+            array = self._array(symbol)
+            last = array['time'][-1] if len(array) else None
+            records = {}
+            for doc in docs:
+                record = self._record(doc)
+                records[record[0]] = record
+            if not records: return 0
+
+            path = self._path(symbol)
+            if last is None or min(records) > last:
+                with open(path, 'ab') as f:
+                    numpy.array(sorted(records.values()), self._dtype).tofile(f)
+                logger.debug("appended %s prices of %s", len(records), symbol)
+                return len(records)
+
+            merged = {time: record for time, record in zip(array['time'], array.tolist())}
+            merged.update(records)
+            temp_path = path + ".tmp"
+            numpy.array([merged[time] for time in sorted(merged)], self._dtype).tofile(temp_path)
+            # readers keep the mapping of the replaced file
+            os.replace(temp_path, path)
+            self._maps.pop(symbol, None)
+        logger.debug("rewrote %s prices of %s with %s saved", len(merged), symbol, len(records))
+        return len(records)
+
+    def read(self, symbol, start_date=None, end_date=None):
+        """Records of the symbol between the dates (inclusive) as a slice of the memory-mapped file."""
+        array = self._array(symbol)
+        times = array['time']
+        start = numpy.searchsorted(times, self._utc(start_date), 'left') if start_date else 0
+        end = numpy.searchsorted(times, self._utc(end_date), 'right') if end_date else len(array)
+        return array[start:end]
+
+    @classmethod
+    def to_docs(cls, symbol, records):
+        times = records['time'].astype(datetime).tolist()
+        columns = [records[field].tolist() for field in cls.FIELDS]
+        return [{'symbol': symbol, 'time': time, **dict(zip(cls.FIELDS, values))}
+                for time, *values in zip(times, *columns)]
@@ -0,0 +1,54 @@
+# -*- coding: utf-8 -*-
+
+import threading
+from time import monotonic
+
+
+class QuoteCache:
+    """Thread-safe in-memory cache of quotes, each expiring after its own time to live."""
+
+    SWEEP_INTERVAL = 60 # seconds between the evictions of the expired entries never read again
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries = {} # key => (value, expiration in monotonic time)
+        self._last_sweep = monotonic()
+        self.hits = 0
+        self.misses = 0
+        self.stale = 0
+
+    def get(self, key):
+        """Cached value of the key, or None if it's missing or expired."""
+        with self._lock:
+            entry = self._entries.get(key, None)
+            if not entry:
+                self.misses += 1
+                return None
+
+            value, expiration = entry
+            if monotonic() >= expiration:
+                self.stale += 1
+                del self._entries[key]
+                return None
+
+            self.hits += 1
+            return value
+
+    def put(self, key, value, ttl):
+        """Cache the value for ttl seconds."""
+        now = monotonic()
+        with self._lock:
+            self._entries[key] = (value, now + ttl)
+            if now - self._last_sweep >= self.SWEEP_INTERVAL:
+                self._entries = {k: entry for k, entry in self._entries.items() if entry[1] > now}
+                self._last_sweep = now
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses + self.stale
+            return {'hits': self.hits, 'misses': self.misses, 'stale': self.stale, 'size': len(self._entries),
+                    'hit_rate': self.hits / lookups if lookups else 0}
@@ -20,6 +20,7 @@ class TDAmeritradeClient(BrokerClient):
         api_key = config['api_key']
         redirect_uri = config['redirect_uri']
         self._accounts = config['accounts']
+        self._requests_per_minute = config.get('requests_per_minute', self.REQUESTS_PER_MINUTE)
         try:
             self._client = auth.client_from_token_file(token_path, api_key)
         except FileNotFoundError:
@@ -28,6 +29,9 @@ class TDAmeritradeClient(BrokerClient):
                 self._client = auth.client_from_login_flow(
                     driver, api_key, redirect_uri, token_path)
 
+    def requests_per_minute(self):
+        return self._requests_per_minute
+
     def get_account_id(self, account_alias=None):
         for account in self._accounts:
             for key, value in account.items():
@@ -103,7 +107,7 @@ class TDAmeritradeClient(BrokerClient):
             if pre_qty == 0.0:
                 pre_qty = -p.get('previousSessionShortQuantity', 0.0)
             pos = PositionInfo(
-                symbol=Symbol(instrument['symbol']),
+                symbol=Symbol.of(instrument['symbol']),
                 quantity=qty,
                 price=p['marketValue'] / qty,
                 cost=p['averagePrice'],
@@ -144,7 +148,7 @@ class TDAmeritradeClient(BrokerClient):
         res = []
         for leg in legs:
             res.append(LegInfo(
-                symbol=Symbol(leg['instrument']['symbol']),
+                symbol=Symbol.of(leg['instrument']['symbol']),
                 quantity=leg['quantity'],
                 action=Action.from_str(leg['instruction'])
             ))
@@ -211,4 +215,5 @@ class TDAmeritradeClient(BrokerClient):
                     return (start, end)
         except BadRequestError:
             logger.warn("bad request")
+            raise
         return None
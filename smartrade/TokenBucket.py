@@ -0,0 +1,40 @@
+# -*- coding: utf-8 -*-
+
+import threading
+import time
+
+
+class TokenBucket:
+    """Thread-safe token bucket limiting the rate of requests to `rate` per second with bursts up to `capacity`."""
+
+    def __init__(self, rate, capacity=1):
+        self._rate = rate
+        self._capacity = capacity
+        self._tokens = capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self._capacity, self._tokens + (now - self._updated) * self._rate)
+        self._updated = now
+
+    def acquire(self):
+        """Take a token, waiting until one is available. Return the seconds waited."""
+        waited = 0
+        while True:
+            with self._lock:
+                self._refill()
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return waited
+
+                delay = (1 - self._tokens) / self._rate
+            time.sleep(delay)
+            waited += delay
+
+    def drain(self):
+        """Drop the available tokens, e.g. after the server reports the quota is exhausted."""
+        with self._lock:
+            self._refill()
+            self._tokens = min(self._tokens, 0)
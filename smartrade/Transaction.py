@@ -1,18 +1,22 @@
 # -*- coding: utf-8 -*-
 
 import copy
+import os
 import re
 from datetime import datetime
 from enum import Enum, IntEnum
+from functools import lru_cache
 
 from bson import ObjectId
-from dateutil.parser import parse, ParserError
+from dateutil.parser import ParserError
 
 from smartrade import app_logger
-from smartrade.utils import check
+from smartrade.utils import check, DateParser
 
 logger = app_logger.get_logger(__name__)
 
+SYMBOL_CACHE_SIZE = int(os.getenv('SYMBOL_CACHE_SIZE', 8192))
+
 class Validity(IntEnum):
     INVALID = -1
     IGNORED = 0
@@ -116,6 +120,8 @@ class InstrumentType(Enum):
 
 
 class Symbol:
+    __slots__ = ('_ui', '_type', '_strike', '_expired')
+
     def __init__(self, text):
         self._ui = None
         self._type = InstrumentType.OTHER
@@ -130,12 +136,51 @@ class Symbol:
         else:
             self._parse3(text)
 
+    @classmethod
+    def of(cls, text):
+        """Shared symbol parsed from `text`, cached by the raw text."""
+        return _symbol_of_text(text)
+
+    @classmethod
+    def from_fields(cls, ui, expired=None, strike=None, type_=None):
+        """Shared symbol built from the fields of a transaction doc, cached by those fields."""
+        return _symbol_of_fields(ui, expired, strike, type_ and type_[0])
+
+    @classmethod
+    def _build(cls, ui, expired, strike, type_):
+        self = cls("")
+        if not ui: return self
+
+        self._ui = ui
+        if expired:
+            self._type = InstrumentType.from_str(type_)
+            self._strike = float(strike)
+            self._expired = datetime.combine(expired.date(), datetime.min.time())
+        else:
+            self._type = InstrumentType.STOCK
+        return self
+
+    @classmethod
+    def cache_stats(cls):
+        stats = {}
+        for name, cache in (('text', _symbol_of_text), ('fields', _symbol_of_fields)):
+            info = cache.cache_info()
+            lookups = info.hits + info.misses
+            stats[name] = {'hits': info.hits, 'misses': info.misses, 'size': info.currsize,
+                           'max_size': info.maxsize, 'hit_rate': info.hits / lookups if lookups else 0}
+        return stats
+
+    @classmethod
+    def clear_cache(cls):
+        _symbol_of_text.cache_clear()
+        _symbol_of_fields.cache_clear()
+
     def _parse1(self, text):
         """Format: HOOD_031122C14.5"""
         self._ui, tokens = text.split('_')
         self._type = InstrumentType.from_str(tokens[6])
         self._strike = float(tokens[7:])
-        self._expired = parse(tokens[:6])
+        self._expired = _symbol_date_parser.parse(tokens[:6])
 
     def _parse2(self, text):
         """Format: TWTR 02/04/2022 38.00 C"""
@@ -147,7 +192,7 @@ class Symbol:
         elif count == 4:
             self._type = InstrumentType.from_str(tokens[3])
             self._strike = float(tokens[2])
-            self._expired = parse(tokens[1])
+            self._expired = _symbol_date_parser.parse(tokens[1])
 
     def _parse3(self, text):
         """Format: AMD230120C00120000"""
@@ -166,6 +211,10 @@ class Symbol:
         return (self.ui == other.ui and self.type.match(other.type)
                 and self.strike == other.strike and self.expired == other.expired)
 
+    def __hash__(self):
+        # type is left out since AUTO matches both CALL and PUT
+        return hash((self._ui, self._strike, self._expired))
+
     def __repr__(self):
         s = str(self.type)
         if self._type != InstrumentType.OTHER:
@@ -208,7 +257,18 @@ class Symbol:
         return self._expired
 
 
+_symbol_date_parser = DateParser(('%m%d%y', '%m/%d/%Y'))
+# dates of the records whose callers don't share a parser of their own
+_record_date_parser = DateParser()
+
+# symbols are never mutated after construction, so cached instances can be shared
+_symbol_of_text = lru_cache(maxsize=SYMBOL_CACHE_SIZE)(Symbol)
+_symbol_of_fields = lru_cache(maxsize=SYMBOL_CACHE_SIZE)(Symbol._build)
+
+
 class Transaction:
+    __slots__ = ('_id', '_tx_id', '_account', '_date', '_action', '_symbol', '_price', '_quantity',
+                 '_fee', '_amount', '_description', '_valid', '_merge_parent', '_slice_parent', '_grouped')
 
     def __init__(self) -> None:
         self._id = None
@@ -228,24 +288,21 @@ class Transaction:
         self._valid = doc.get('valid', True)
         self._id = doc.get('_id', None)
         self._tx_id = doc.get('tx_id', None)
-        for attr in ['account', 'date', 'quantity', 'price', 'fee', 'amount', 'ui', 'strike', 'expired', 'description', 'merge_parent', 'slice_parent', 'grouped']:
+        for attr in ['account', 'date', 'quantity', 'price', 'fee', 'amount', 'description', 'merge_parent', 'slice_parent', 'grouped']:
             setattr(self, "_" + attr, doc.get(attr, None))
         check(self.quantity is None or self.quantity >= 0, f"quantity {self.quantity} can't be negative")
         self._action = Action.from_str(doc['action'])
-        symbol = ""
         ui = doc.get('ui', None)
-        if ui:
-            symbol += ui
-            expired = doc.get('expired', None)
-            if expired:
-                symbol += " " + expired.strftime('%m/%d/%Y')
-                symbol += " " + str(doc['strike'])
-                symbol += " " + doc['type'][0]
-        self._symbol = Symbol(symbol)
+        expired = doc.get('expired', None) if ui else None
+        if expired:
+            self._symbol = Symbol.from_fields(ui, expired, doc['strike'], doc['type'])
+        else:
+            self._symbol = Symbol.from_fields(ui)
         return self
 
     @classmethod
-    def from_dict(cls, **map):
+    def from_dict(cls, date_parser=None, **map):
+        """Transaction of a broker record, `date_parser` is shared by the records of the same source(a module-wide one by default)."""
         self = cls()
         self._account = map['account']
         self._tx_id = map.get('tx_id', None)
@@ -261,7 +318,7 @@ class Transaction:
         self._fee = self._get_money(map['fee'])
         try:
             date = map['date'].strip().split()[0]
-            self._date = parse(date)
+            self._date = (date_parser or _record_date_parser).parse(date)
         except ParserError:
             logger.warning("wrong date format: %s", date)
             return self
@@ -272,7 +329,7 @@ class Transaction:
         if self.valid == Validity.IGNORED or self.action == Action.INVALID:
             return self
 
-        self._symbol = Symbol(map['symbol'].strip())
+        self._symbol = Symbol.of(map['symbol'].strip())
         self._valid = self._verify()
         return self
 
@@ -353,7 +410,7 @@ class Transaction:
 
     def is_virtual(self):
         """Is the transaction virtual?(either a merged parent or a split child)"""
-        return self.merge_parent == self.id or self.is_sliced()
+        return (self.merge_parent is not None and self.merge_parent == self.id) or bool(self.is_sliced())
 
     def is_original(self):
         """Is the transaction original?"""
@@ -361,7 +418,7 @@ class Transaction:
 
     def is_effective(self):
         """Is the transaction effective to be used in group?"""
-        return (not self.is_merged()) and (self.slice_parent != self.id)
+        return bool((not self.is_merged()) and (self.slice_parent is None or self.slice_parent != self.id))
  
     def same_group(self, other):
         return self.account == other.account and self.symbol.ui == other.symbol.ui and abs((self.date - other.date).total_seconds()) < 2
@@ -415,6 +472,9 @@ class Transaction:
             json['grouped'] = self.grouped
             json['merge_parent'] = stringify(self.merge_parent)
             json['slice_parent'] = stringify(self.slice_parent)
+            # materialized for indexed queries, see Assembler.effective_condition
+            json['effective'] = self.is_effective()
+            json['original'] = self.is_original()
             json['valid'] = self.valid
         if self.valid == Validity.VALID and symbol.ui:
             if hide is None:
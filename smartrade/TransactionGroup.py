@@ -1,5 +1,6 @@
 # -*- coding: utf-8 -*-
 
+from bisect import insort
 from collections import deque
 from datetime import datetime
 import math
@@ -11,6 +12,8 @@ from smartrade.utils import check
 logger = app_logger.get_logger(__name__)
 
 class TransactionGroup:
+    __slots__ = ('_account', '_chains', '_open_chains', '_positions', '_cost', '_profit',
+                 '_total', '_ui', '_duration', '_roi')
 
     ERROR = 1e-6
 
@@ -18,7 +21,10 @@ class TransactionGroup:
 
     def __init__(self, leading_transactions=None):
         self._account = None
-        self._chains = {tx: [] for tx in leading_transactions} if leading_transactions else {}
+        self._chains = {} # open transaction => closing transactions
+        self._open_chains = {} # open transaction => remaining quantity, only for chains not fully closed
+        for tx in leading_transactions or []:
+            self._add_chain(tx)
         self._positions = None
         self._cost = None
         self._profit = None
@@ -76,6 +82,10 @@ class TransactionGroup:
         merged_leading_tx = cls._merge_docs(leading_tx, updated_tx_list, created_tx_map)
         groups = [cls(tx_list) for tx_list in cls.combine(merged_leading_tx)]
         groups.reverse() # LIFO match
+        open_legs = _OpenLegIndex()
+        for rank, group in enumerate(groups):
+            for tx in group.chains:
+                open_legs.add(rank, group, tx)
 
         merged_following_tx = cls._merge_docs(following_tx, updated_tx_list, created_tx_map)
         following_tx_queue = deque(cls.combine(merged_following_tx))
@@ -85,32 +95,40 @@ class TransactionGroup:
             if not close_tx_list: continue
 
             open_tx_list = [tx for tx in tx_list if tx.action.is_open()]
-            grouped = False
-            for group in groups: # search for matching transactions
-                if group._followed_by(close_tx_list, updated_tx_list, created_tx_map):
-                    for tx in open_tx_list: # add new open transactions
-                        group._chains[tx] = []
-                    following_tx_queue.appendleft(close_tx_list)
-                    grouped = True
-                    break
-            check(grouped, "at least one group should be matched")
+            matched = open_legs.match(close_tx_list)
+            check(matched, "at least one group should be matched")
+            rank, group = matched
+            check(group._followed_by(close_tx_list, updated_tx_list, created_tx_map),
+                  "matched group should be followed by the closing transactions")
+            for tx in open_tx_list: # add new open transactions
+                group._add_chain(tx)
+                open_legs.add(rank, group, tx)
+            following_tx_queue.appendleft(close_tx_list)
         for group in groups:
             group._account = merged_leading_tx[0].account
             group._inventory()
 
         return groups, updated_tx_list, created_tx_map
     
+    def _add_chain(self, open_tx, close_tx_list=None):
+        close_tx_list = close_tx_list or []
+        self._chains[open_tx] = close_tx_list
+        opened = open_tx.quantity
+        for close_tx in close_tx_list:
+            opened -= close_tx.quantity
+        if opened > self.ERROR:
+            self._open_chains[open_tx] = opened
+
+    def _remaining(self, open_tx):
+        return self._open_chains.get(open_tx, 0)
+
     def _followed_by(self, following_tx_list, updated_tx_list, created_tx_map):
         res = False
-        for open_tx, close_tx_list in self.chains.items():
-            opened = open_tx.quantity
-            for close_tx in close_tx_list:
-                opened -= close_tx.quantity
-            check(opened > -self.ERROR, f"opened {opened} should be positive")
-            if opened <= self.ERROR: continue
-
+        for open_tx, opened in list(self._open_chains.items()):
+            close_tx_list = self._chains[open_tx]
+            remaining = opened
             for tx in following_tx_list:
-                check(tx.is_effective(), f"{tx} should be effective")
+                check(tx.is_effective(), lambda: f"{tx} should be effective")
                 if tx.quantity > self.ERROR and open_tx.closed_by(tx):
                     sliced_tx, original_tx, slice_created = tx.slice(min(opened, tx.quantity))
                     if original_tx.is_original():
@@ -120,12 +138,20 @@ class TransactionGroup:
                         tx_id = str(original_tx.id)
                         if tx_id in created_tx_map or slice_created:
                             check(original_tx.quantity >= self.ERROR,
-                                f"quantity {original_tx.quantity} should be positive")
+                                  lambda: f"quantity {original_tx.quantity} should be positive")
                             created_tx_map[tx_id] = original_tx # restore original copy to avoid quantity change
                     if sliced_tx.quantity > self.ERROR: # ignore tiny sliced transactions
-                        check(sliced_tx.is_effective(), f"{sliced_tx} should be effective")
+                        check(sliced_tx.is_effective(), lambda: f"{sliced_tx} should be effective")
                         close_tx_list.append(sliced_tx)
+                        remaining -= sliced_tx.quantity
                     res = True
+            if remaining == opened: continue
+
+            check(remaining > -self.ERROR, lambda: f"opened {remaining} should be positive")
+            if remaining > self.ERROR:
+                self._open_chains[open_tx] = remaining
+            else: # fully closed
+                del self._open_chains[open_tx]
         return res
 
     def _inventory(self, include_quotes=True):
@@ -134,20 +160,18 @@ class TransactionGroup:
         first_date = datetime.max
         last_date = datetime.min
         for open_tx, close_tx_list in self.chains.items():
-            opened = open_tx.quantity
             total += open_tx.amount
             symbol = open_tx.symbol
             self._ui = symbol.ui
             first_date = min(first_date, open_tx.date)
             last_date = max(first_date, open_tx.date)
             for close_tx in close_tx_list:
-                opened -= close_tx.quantity
                 total += close_tx.amount
                 first_date = min(first_date, close_tx.date)
                 last_date = max(first_date, close_tx.date)
-            if opened > self.ERROR:
-                symbol_str = format(open_tx.symbol)
-                positions[symbol_str] = (positions.get(symbol_str, 0)
+        for open_tx, opened in self._open_chains.items():
+            symbol_str = format(open_tx.symbol)
+            positions[symbol_str] = (positions.get(symbol_str, 0)
                                      + opened * (1 if open_tx.action == Action.BTO else -1))
         self._total = total
         self._positions = positions
@@ -168,22 +192,36 @@ class TransactionGroup:
         self._roi = roi
 
     @classmethod
-    def _get_price(cls, symbol):
-        try:
-            return cls._provider.get_quotes(symbol)[0][symbol]
-        except KeyError:
-            logger.warning("cannot find the quote of symbol %s", symbol)
-            return (0, 0, 0)
-
-    def _get_market_value(self):
+    def _get_prices(cls, symbols):
+        """Quotes of symbols from one batch of provider requests."""
+        prices = {}
+        for symbol, (quote, _) in cls._provider.get_latest_quotes(symbols).items():
+            if not quote:
+                logger.warning("cannot find the quote of symbol %s", symbol)
+            prices[symbol] = quote or (0, 0, 0)
+        return prices
+
+    def _get_market_value(self, prices=None):
         if not self._provider: return 0
 
+        if prices is None:
+            prices = self._get_prices(self.positions)
         val = 0
         for symbol, qty in self.positions.items():
-            price = self._get_price(symbol)[0]
+            price = prices[symbol][0]
             val += price * qty * (100 if '_' in symbol else 1)
         return val
 
+    @classmethod
+    def quote(cls, tx_groups):
+        """Add the market values of the positions to the profits of groups loaded without quotes."""
+        if not cls._provider: return
+
+        prices = cls._get_prices([symbol for group in tx_groups for symbol in group.positions])
+        for group in tx_groups:
+            if group.positions:
+                group._profit = group.total + group._get_market_value(prices)
+
     def _get_cost(self):
         open_tx = self.chains.keys()
         options = [set(), set(), set(), set()]
@@ -246,7 +284,6 @@ class TransactionGroup:
     def from_doc(cls, doc, include_quotes=True):
         self = cls()
         self._account = doc['account']
-        chains = self._chains = {}
         ui = doc['ui']
         for chain_array in doc['chains']:
             leading_tx = chain_array[0]
@@ -260,7 +297,7 @@ class TransactionGroup:
                 tx['expired'] = leading_tx.get('expired', None)
                 close_tx = Transaction.from_doc(tx)
                 close_tx_list.append(close_tx)
-            chains[open_tx] = close_tx_list
+            self._add_chain(open_tx, close_tx_list)
         self._inventory(include_quotes)
         return self
 
@@ -285,9 +322,7 @@ class TransactionGroup:
                     del positions[symbol]
         prices = {}
         if ui and include_quotes:
-            for symbol in positions_list[ui]:
-                prices[symbol] = cls._get_price(symbol)
-            prices[ui] = cls._get_price(ui)
+            prices = cls._get_prices([*positions_list[ui], ui])
 
         return total, profit, positions_list, prices
 
@@ -336,3 +371,56 @@ class TransactionGroup:
 
     def __str__(self):
         return self.__repr__()
+
+
+class _OpenLegIndex:
+    """Open legs indexed by contract(ui, type, strike, expiry), each kept in LIFO order of their groups.
+
+    A close scans only the legs of its own contract(and of the AUTO type matching calls and puts), from the
+    latest group on, dropping the fully closed legs as they're met.
+    """
+    __slots__ = ('_legs', '_count')
+
+    def __init__(self):
+        self._legs = {}
+        self._count = 0
+
+    @classmethod
+    def _keys(cls, tx):
+        symbol = tx.symbol
+        key = (symbol.ui, symbol.strike, symbol.expired)
+        if symbol.type == InstrumentType.AUTO:
+            return [(*key, InstrumentType.AUTO), (*key, InstrumentType.CALL), (*key, InstrumentType.PUT)]
+        if symbol.type in (InstrumentType.CALL, InstrumentType.PUT):
+            return [(*key, symbol.type), (*key, InstrumentType.AUTO)]
+        return [(*key, symbol.type)]
+
+    def add(self, rank, group, open_tx):
+        self._count += 1 # tie breaker, groups are never compared
+        insort(self._legs.setdefault(self._keys(open_tx)[0], []), (rank, self._count, group, open_tx))
+
+    def match(self, close_tx_list):
+        """
+        Find the first group in LIFO order that has an open leg closed by any of the transactions.
+
+        Returns: (rank, group) or None
+        """
+        res = None
+        for tx in close_tx_list:
+            if tx.quantity <= TransactionGroup.ERROR: continue
+
+            for key in self._keys(tx):
+                legs = self._legs.get(key, [])
+                i = 0
+                while i < len(legs):
+                    rank, _, group, open_tx = legs[i]
+                    if res and rank >= res[0]: break
+
+                    if group._remaining(open_tx) <= TransactionGroup.ERROR:
+                        del legs[i] # a closed leg never reopens
+                        continue
+                    if open_tx.closed_by(tx):
+                        res = (rank, group)
+                        break
+                    i += 1
+        return res
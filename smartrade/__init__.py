@@ -54,10 +54,14 @@ def configure_app(config=None):
         from smartrade.PolygonApi import PolygonApi
         api = MarketApi.get_providers(CONF_FILE)[0]
         from smartrade.MarketDataProvider import MarketDataProvider
-        provider = MarketDataProvider(broker, api, app.config['DATABASE'])
+        from smartrade.PriceStore import PriceStore
+        provider = MarketDataProvider(broker, api, app.config['DATABASE'], price_store=PriceStore.from_env())
         app.config['provider'] = provider
         from smartrade.TransactionGroup import TransactionGroup
         TransactionGroup.set_provider(provider)
+        # transactions saved by an older version are not found by the effective/original conditions otherwise
+        from smartrade.indexes import ensure_transaction_flags
+        ensure_transaction_flags(app.config['DATABASE'])
 
 configure_app()
 
@@ -12,13 +12,16 @@ from pprint import pprint
 from dateutil.parser import parse
 
 from smartrade.Assembler import Assembler
+from smartrade.BackfillPlanner import BackfillPlanner
 from smartrade.BrokerClient import BrokerClient
 from smartrade.exceptions import ConfigurationError
+from smartrade import indexes
 from smartrade.Inspector import Inspector
 from smartrade.Loader import Loader
 from smartrade.MarketApi import MarketApi
 from smartrade.MarketDataProvider import MarketDataProvider
 from smartrade.PolygonApi import PolygonApi
+from smartrade.PriceStore import PriceStore
 from smartrade.TDAmeritradeClient import TDAmeritradeClient
 from smartrade.TransactionGroup import TransactionGroup
 from smartrade.utils import to_json
@@ -48,6 +51,10 @@ def total_cash(db_name, account, start_date=None, end_date=None):
     inspector = Inspector(db_name, account)
     return inspector.total_cash(start_date, end_date)
 
+def account_totals(db_name, account, start_date=None, end_date=None):
+    inspector = Inspector(db_name, account)
+    return inspector.account_totals(start_date, end_date)
+
 def distinct_tickers(db_name, account, start_date=None, end_date=None):
     inspector = Inspector(db_name, account)
     return inspector.distinct_tickers(start_date, end_date)
@@ -63,6 +70,11 @@ def ticker_transaction_groups(db_name, account, ticker):
 def group_transactions(db_name, account, ticker, save_db=False):
     return Assembler(db_name, account).group_transactions(ticker, save_db)
 
+def regroup_transactions(db_name, account, tickers=None, save_db=False):
+    if tickers is None:
+        tickers = distinct_tickers(db_name, account)
+    return Assembler(db_name, account).regroup(tickers, save_db)
+
 def get_broker(config):
     cfg_path = expanduser(config['conf_path'])
     return BrokerClient.get_brokers(cfg_path)[0]
@@ -79,7 +91,7 @@ def get_config():
 def get_provider(config, db_name):
     broker = get_broker(config)
     api = get_api(config)
-    return MarketDataProvider(broker, api, db_name)
+    return MarketDataProvider(broker, api, db_name, price_store=PriceStore.from_env())
 
 # ============Command Argument Parse============
 
@@ -118,9 +130,15 @@ filter_options = (
 @subcommand(*data_options, *filter_options,
             argument('-v', '--verbose', action='store_true', help='show transaction groups'),
             argument('-a', '--account', help='account id or alias or index'),
+            argument('-j', '--jobs', type=int, default=Assembler.MAX_WORKERS,
+                     help='number of tickers grouped concurrently'),
             argument('-t', '--ticker', nargs='+', help="ticker name(s)"))
 def load(config, args):
-    """Load transactions."""
+    """Load transactions.
+
+    Regroup the given tickers, or the tickers traded in the given dates, or else the tickers of the newly
+    loaded transactions(none if nothing is loaded).
+    """
     env = _get_env(args)
     db_name = args.database_name or config['DATABASE'][env]
     broker = get_broker(config)
@@ -146,15 +164,23 @@ def load(config, args):
         loader.load(data_files[0], args.reload)
         for f in data_files[1:]:
             loader.load(f, False)
+    if loader.duplicates:
+        print(f"skipped {loader.duplicates} transaction(s) already saved")
     assembler = Assembler(db_name, account_id)
-    inspector = Inspector(db_name, account_id)
-    for ticker in (args.ticker if args.ticker else inspector.distinct_tickers(args.start_date, args.end_date)):
-        ticker = ticker.upper()
-        tx_groups = assembler.group_transactions(ticker, args.save_database)
+    if args.ticker:
+        tickers = [ticker.upper() for ticker in args.ticker]
+    elif start_date or end_date:
+        tickers = Inspector(db_name, account_id).distinct_tickers(start_date, end_date)
+    else: # only tickers with newly loaded transactions
+        tickers = sorted({ui for _, ui in loader.written_tickers})
+    regrouped = assembler.regroup(tickers, args.save_database, args.jobs, args.verbose)
+    for ticker, (count, elapsed) in sorted(regrouped['tickers'].items()):
         if args.verbose:
-            _display_transaction_groups(ticker, tx_groups)
+            _display_transaction_groups(ticker, regrouped['groups'][ticker])
         else:
-            print(f"ticker {ticker} has {len(tx_groups)} group(s)")
+            print(f"ticker {ticker} has {count} group(s) ({elapsed:.3f}s)")
+    for ticker, error in sorted(regrouped['failures'].items()):
+        print(f"ticker {ticker} failed: {error}")
 
 @subcommand(*data_options, *filter_options,
             argument('-v', '--verbose', action='store_true', help='show transaction groups'),
@@ -169,6 +195,8 @@ def report(config, args):
     inspector = Inspector(db_name, account_id)
     provider = get_provider(config, db_name)
     TransactionGroup.set_provider(provider)
+    totals = inspector.account_totals(args.start_date, args.end_date)
+    print(", ".join(f"{name}={amount:.2f}" for name, amount in totals.items()))
     for ticker in (args.ticker if args.ticker else inspector.distinct_tickers(args.start_date, args.end_date)):
         ticker = ticker.upper()
         tx_groups = inspector.ticker_transaction_groups(ticker)
@@ -272,6 +300,30 @@ def hours(config, args):
     provider = get_provider(config, db_name)
     pprint(provider.get_market_hours(args.date))
 
+@subcommand(*data_options)
+def ensure_indexes(config, args):
+    """Create the missing indexes of the database, materializing the fields they need(run after upgrading)."""
+    env = _get_env(args)
+    db_name = args.database_name or config['DATABASE'][env]
+    pprint(indexes.ensure_indexes(db_name))
+
+@subcommand(
+    *data_options,
+    argument('-a', '--account', help='account id or alias or index'),
+    argument('-p', '--plan', action='store_true', help="only show the planned downloads"))
+def backfill(config, args):
+    """Backfill the missing price history of the traded symbols, resuming the unfinished backfill."""
+    env = _get_env(args)
+    db_name = args.database_name or config['DATABASE'][env]
+    provider = get_provider(config, db_name)
+    account_id = get_broker(config).get_account_id(args.account)
+    planner = BackfillPlanner(db_name, account_id, provider)
+    if args.plan:
+        for task in planner.plan():
+            print(f"{task['symbol']}: {task['start']:%Y-%m-%d} - {task['end']:%Y-%m-%d} via {task['source']}")
+    else:
+        pprint(planner.run())
+
 def _get_env(args):
     env = args.env or 'test'
     if env not in ('test', 'dev', 'prod'):
@@ -5,6 +5,10 @@ class ClientError(Exception):
     """Client-side error"""
 
 
+class ServerError(Exception):
+    """Server-side error"""
+
+
 class ConfigurationError(ClientError):
     """Configuration error"""
 
@@ -16,3 +20,7 @@ class BadRequestError(ClientError):
 
 class TooManyRequestsError(ClientError):
     """Too many requests error"""
+
+    def __init__(self, retry_after=None):
+        super().__init__(f"retry after {retry_after} seconds" if retry_after is not None else "")
+        self.retry_after = retry_after
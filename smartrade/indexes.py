@@ -0,0 +1,96 @@
+# -*- coding: utf-8 -*-
+
+"""Indexes of the collections and the fields materialized for them."""
+
+from pymongo import UpdateOne
+from pymongo.errors import OperationFailure
+
+from smartrade import app_logger
+from smartrade.Transaction import Transaction
+from smartrade.utils import get_database, ASC
+
+logger = app_logger.get_logger(__name__)
+
+# collection => (index keys, index options) needed by the query paths
+INDEXES = {
+    'transactions': (
+        # effective transactions of a ticker in the grouping order, e.g. Assembler.group_transactions
+        ([('account', ASC), ('valid', ASC), ('effective', ASC), ('ui', ASC), ('date', ASC),
+          ('action', ASC), ('expired', ASC), ('strike', ASC), ('type', ASC)], {}),
+        # transactions of some actions in a period, e.g. Inspector.total_interest
+        ([('account', ASC), ('action', ASC), ('date', ASC)], {}),
+        # effective transactions in date order, e.g. Inspector.positions, Inspector.transaction_period
+        ([('account', ASC), ('valid', ASC), ('effective', ASC), ('date', ASC)], {}),
+        # transactions filtered in any other way in date order, e.g. Inspector.transaction_list
+        ([('account', ASC), ('date', ASC)], {}),
+    ),
+    'transaction_groups': (
+        ([('account', ASC), ('ui', ASC), ('completed', ASC)], {}),
+    ),
+    'balance_history': (
+        ([('account', ASC), ('date', ASC)], {'unique': True}),
+    ),
+    'cash_ledger': (
+        ([('account', ASC), ('date', ASC)], {'unique': True}),
+    ),
+    'quotes': (
+        ([('symbol', ASC), ('date', ASC)], {'unique': True}),
+    ),
+    'price_history': (
+        ([('symbol', ASC), ('time', ASC)], {'unique': True}),
+    ),
+    'price_coverage': (
+        ([('symbol', ASC)], {'unique': True}),
+    ),
+    'market_hours': (
+        ([('date', ASC)], {'unique': True}),
+    ),
+    'backfill_jobs': (
+        ([('account', ASC), ('created', ASC)], {}),
+    ),
+}
+
+def materialize_transaction_flags(db_name, condition=None, batch_size=1000):
+    """Set the effective and original flags of the transactions(matching the condition) saved before they were
+    materialized."""
+    collection = get_database(db_name).transactions
+    requests = []
+    count = 0
+    for doc in collection.find({**(condition or {}), 'effective': {'$exists': False}}):
+        tx = Transaction.from_doc(doc)
+        requests.append(UpdateOne({'_id': doc['_id']},
+                                  {'$set': {'effective': tx.is_effective(), 'original': tx.is_original()}}))
+        if len(requests) == batch_size:
+            count += collection.bulk_write(requests, ordered=False).modified_count
+            requests = []
+    if requests:
+        count += collection.bulk_write(requests, ordered=False).modified_count
+    if count:
+        logger.info("materialized flags of %s transactions", count)
+    return count
+
+def ensure_transaction_flags(db_name, account=None):
+    """Materialize the missing flags of the transactions(of the account if given) before they are queried by them.
+
+    Only one lookup when none is missing, which is cheap for an account as it leads the transaction indexes.
+    """
+    condition = {'account': account[-4:]} if account else {}
+    if get_database(db_name).transactions.find_one({**condition, 'effective': {'$exists': False}}, {'_id': 1}):
+        logger.warning("found transactions without materialized flags(condition: %s)", condition)
+        return materialize_transaction_flags(db_name, condition)
+    return 0
+
+def ensure_indexes(db_name):
+    """Create the missing indexes of every collection, return the index names by collection."""
+    materialize_transaction_flags(db_name)
+    db = get_database(db_name)
+    names = {}
+    for collection, indexes in INDEXES.items():
+        names[collection] = []
+        for keys, options in indexes:
+            try:
+                names[collection].append(db[collection].create_index(keys, **options))
+            except OperationFailure as e:
+                # e.g. duplicates saved before a unique index existed
+                logger.error("failed to create index %s of %s (error type: %s, error: %s)", keys, collection, type(e), e)
+    return names
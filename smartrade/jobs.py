@@ -3,7 +3,7 @@
 """Background jobs."""
 
 import atexit
-from datetime import timezone
+from datetime import datetime, timedelta, timezone
 
 from apscheduler.schedulers.background import BackgroundScheduler
 
@@ -19,6 +19,24 @@ def _retrieve_quotes(app):
         db_name = app.config['DATABASE']
         Inspector(db_name, acct_id).summarize()
 
+def _load_market_hours(app):
+    provider = app.config.get('provider', None)
+    if not provider: return
+
+    logger.debug("Loading market hours")
+    today = datetime.now(timezone.utc).date()
+    provider.load_market_hours(today, today + timedelta(days=7))
+
+def _backfill_prices(app):
+    provider = app.config.get('provider', None)
+    if not provider: return
+
+    logger.debug("Backfilling price history")
+    from smartrade.BackfillPlanner import BackfillPlanner
+    for account in app.config['broker_client'][0]['accounts']:
+        acct_id = list(account.values())[0]
+        BackfillPlanner(app.config['DATABASE'], acct_id, provider).start()
+
 def run(app):
     hour = '20-23'
     minute = '30' if app.config['ENV'] == 'production' else '45'
@@ -26,5 +44,8 @@ def run(app):
     scheduler = BackgroundScheduler(timezone=timezone.utc)
     scheduler.add_job(func=lambda: _retrieve_quotes(app), trigger="cron",
                       day_of_week='mon-fri', hour=hour, minute=minute)
+    # not run on start, the calendar defaults to the regular hours of weekdays until it's loaded
+    scheduler.add_job(func=lambda: _load_market_hours(app), trigger="cron", hour='12')
+    scheduler.add_job(func=lambda: _backfill_prices(app), trigger="cron", hour='2')
     scheduler.start()
     atexit.register(lambda: scheduler.shutdown())
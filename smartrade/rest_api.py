@@ -1,5 +1,6 @@
 # -*- coding: utf-8 -*-
 
+from datetime import datetime
 import re
 
 from dateutil.parser import parse
@@ -7,11 +8,13 @@ from flask import jsonify, render_template, request, session
 
 from smartrade import app, app_logger
 from smartrade.Assembler import Assembler
+from smartrade.BackfillPlanner import BackfillPlanner
 from smartrade.exceptions import TooManyRequestsError 
 from smartrade.Inspector import Inspector
 from smartrade.Loader import Loader
+from smartrade.Transaction import Symbol
 from smartrade.TransactionGroup import TransactionGroup
-from smartrade.utils import CustomJsonEncoder, parse_date_range, to_json
+from smartrade.utils import CustomJsonEncoder, parse_date_range, pool_stats, to_json
 
 logger = app_logger.get_logger(__name__)
 
@@ -32,30 +35,24 @@ def account_summary(account):
     provider = app.config['provider']
     inspector = Inspector(db_name, account, provider)
     total_profit, total_market_value, positions = inspector.summarize(False)
-    total_cash = inspector.total_cash()
-    total_market_value += total_cash
+    totals = inspector.account_totals()
+    total_market_value += totals['total_cash']
     position_map = {symbol: qty for pos_map in positions.values()
                     for symbol, qty in pos_map.items()}
-    symbols = position_map.keys()
-    for symbol in symbols:
-        quantity = position_map[symbol]
-        price = provider.get_price(symbol)
+    now = datetime.utcnow()
+    prices = provider.get_prices(position_map, [now])
+    for symbol, quantity in position_map.items():
+        price = prices[symbol, now]
         value = quantity * price
         if '_' in symbol:
             value *= 100
         total_market_value += value
         total_profit += value
-    total_dividend = inspector.total_dividend()
-    total_interest = inspector.total_interest()
-    total_profit += total_dividend + total_interest
+    total_profit += totals['total_dividend'] + totals['total_interest']
     summary = {
-        'total_investment': inspector.total_investment(),
-        'total_interest': total_interest,
-        'total_dividend': total_dividend,
-        'total_trading': inspector.total_trading(),
+        **totals,
         'total_profit': total_profit,
-        'total_market_value': total_market_value,
-        'total_cash': total_cash
+        'total_market_value': total_market_value
     }
     # avoid negative total_investment when calculating total profit rate
     summary['total_profit_rate'] = summary['total_profit'] / max(summary['total_investment'], 1)
@@ -165,6 +162,18 @@ def upload_balance_history(account):
     return {"uploaded": len(balance_map)}
 
 
+@app.route('/account/<account>/backfill', methods=['GET'])
+def backfill_progress(account):
+    planner = BackfillPlanner(app.config['DATABASE'], account, app.config['provider'])
+    return planner.progress() or {}
+
+
+@app.route('/account/<account>/backfill', methods=['POST'])
+def start_backfill(account):
+    planner = BackfillPlanner(app.config['DATABASE'], account, app.config['provider'])
+    return planner.progress(planner.start())
+
+
 @app.route('/account/<account>/orders', methods=['GET'])
 def get_orders(account):
     broker = app.config['broker']
@@ -173,6 +182,21 @@ def get_orders(account):
     return jsonify(to_json(orders))
 
 
+@app.route('/db/pool_stats', methods=['GET'])
+def db_pool_stats():
+    return pool_stats()
+
+
+@app.route('/cache/symbol_stats', methods=['GET'])
+def symbol_cache_stats():
+    return Symbol.cache_stats()
+
+
+@app.route('/cache/quote_stats', methods=['GET'])
+def quote_cache_stats():
+    return app.config['provider'].quote_cache_stats()
+
+
 @app.errorhandler(404)
 def page_not_found(err):
     return f"Page not found: {err}", 404
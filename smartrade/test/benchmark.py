@@ -0,0 +1,259 @@
+# -*- coding: utf-8 -*-
+
+"""Benchmarks against a local mongod.
+
+Usage: python -m smartrade.test.benchmark [benchmark name...]
+"""
+
+import csv
+import json
+import random
+import sys
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+from glob import glob
+
+from bson import ObjectId
+from dateutil.parser import parse
+
+from smartrade.Assembler import Assembler
+from smartrade.indexes import ensure_indexes
+from smartrade.Inspector import Inspector
+from smartrade.Loader import Loader
+from smartrade.MarketDataProvider import MarketDataProvider
+from smartrade.Transaction import Transaction
+from smartrade.TransactionGroup import TransactionGroup
+from smartrade.utils import get_database, DateParser, ASC
+
+DB_NAME = "trading_benchmark"
+DATA_DIR = "smartrade/test"
+
+BENCHMARKS = {}
+
+def benchmark(f):
+    BENCHMARKS[f.__name__] = f
+    return f
+
+def timed(f, *args, **kwargs):
+    start = time.perf_counter()
+    res = f(*args, **kwargs)
+    return res, time.perf_counter() - start
+
+def _fixture_transactions(scale):
+    transactions = []
+    for path in sorted(glob(f"{DATA_DIR}/*.csv") + glob(f"{DATA_DIR}/*.json")):
+        account = path.split("/")[-1].split("-")[0]
+        transactions.extend(Loader(DB_NAME, account)._parse_file(path))
+    return transactions * scale
+
+@benchmark
+def load_save(scale=100):
+    """Insert the test fixtures scaled up `scale` times: one by one vs. in batches."""
+    transactions = _fixture_transactions(scale)
+    collection = get_database(DB_NAME).transactions
+    print(f"inserting {len(transactions)} transactions")
+
+    collection.delete_many({})
+    _, elapsed = timed(lambda: [collection.insert_one(tx.to_json()) for tx in transactions])
+    print(f"insert_one: {elapsed:.3f}s")
+
+    for batch_size in (100, 1000, 10000):
+        collection.delete_many({})
+        loader = Loader(DB_NAME, "0000", batch_size=batch_size)
+        stats, elapsed = timed(loader._save, transactions, False)
+        failed = sum(s[2] for s in stats)
+        slowest = max(s[1] for s in stats)
+        print(f"insert_many(batch_size={batch_size}): {elapsed:.3f}s,"
+              f" {len(stats)} batches, slowest batch {slowest:.3f}s, {failed} failed")
+    collection.delete_many({})
+
+def _fixture_dates():
+    dates = []
+    for path in sorted(glob(f"{DATA_DIR}/*.csv")):
+        with open(path) as csv_file:
+            dates.extend(row[0].split()[0] for row in csv.reader(csv_file) if row and row[0][:1].isdigit())
+    for path in sorted(glob(f"{DATA_DIR}/*.json")):
+        with open(path) as json_file:
+            dates.extend(obj['transactionDate'] for obj in json.load(json_file))
+    return dates
+
+@benchmark
+def parse_dates(repeat=1000):
+    """Parse the dates of the test fixtures `repeat` times: dateutil vs. DateParser."""
+    dates = _fixture_dates()
+    rows = len(dates) * repeat
+    print(f"parsing {rows} dates")
+    _, dateutil_elapsed = timed(lambda: [parse(date) for _ in range(repeat) for date in dates])
+    print(f"dateutil: {dateutil_elapsed:.3f}s, {dateutil_elapsed / rows * 1e6:.2f}us/row")
+    date_parser = DateParser()
+    _, elapsed = timed(lambda: [date_parser.parse(date) for _ in range(repeat) for date in dates])
+    print(f"DateParser: {elapsed:.3f}s, {elapsed / rows * 1e6:.2f}us/row,"
+          f" {date_parser.fallbacks} fallbacks, {dateutil_elapsed / elapsed:.1f}x faster")
+
+def _wheel_docs(count, ui="WHL", seed=1):
+    """Synthetic wheel strategy history: sell puts, get assigned, sell calls, get called away.
+
+    A core stock position bought at the beginning is trimmed every year to keep old groups open.
+    """
+    rng = random.Random(seed)
+    docs = []
+    day = datetime(2000, 1, 3, 10)
+
+    def add(action, date, quantity, price, type_='STOCK', strike=None, expired=None):
+        share = quantity * (100 if strike else 1)
+        amount = share * price * (-1 if action in ('BTO', 'BTC') else 1)
+        doc = {'_id': ObjectId(), 'account': "0000", 'date': date, 'action': action, 'ui': ui,
+               'quantity': quantity, 'price': price, 'fee': 0, 'amount': amount, 'type': type_,
+               'valid': 1, 'description': "", 'tx_id': None, 'grouped': None, 'merge_parent': None,
+               'slice_parent': None, 'effective': True, 'original': True}
+        if strike:
+            doc['strike'] = strike
+            doc['expired'] = expired
+        docs.append(doc)
+
+    add('BTO', day, 10000, 10.0)
+    shares = 0
+    week = 0
+    while len(docs) < count:
+        week += 1
+        day += timedelta(days=7)
+        strike = float(rng.randint(80, 120))
+        expired = datetime.combine((day + timedelta(days=4)).date(), datetime.min.time())
+        settle = expired + timedelta(days=3)
+        type_ = 'CALL' if shares else 'PUT'
+        add('STO', day, 1, 1.0, type_, strike, expired)
+        outcome = rng.random()
+        if outcome < 0.4:
+            add('EXPIRED', settle, 1, 0, type_, strike, expired)
+        elif outcome < 0.7:
+            add('BTC', day + timedelta(days=2), 1, 0.5, type_, strike, expired)
+        else:
+            add('ASSIGNED', settle, 1, 0, type_, strike, expired)
+            if shares:
+                add('STC', settle, 100, strike)
+                shares = 0
+            else:
+                add('BTO', settle, 100, strike)
+                shares = 100
+        if week % 52 == 0:
+            add('STC', day + timedelta(days=1, hours=1), 10, 10.0)
+    return docs
+
+def _split_docs(docs):
+    """Split docs into leading and following transactions the same way as Assembler.group_transactions."""
+    close_dates = {doc['date'] for doc in docs
+                   if doc['action'] in ('STC', 'BTC', 'SPLIT_FROM', 'EXPIRED', 'ASSIGNED', 'EXERCISE')}
+    close_dates |= {d - timedelta(seconds=1) for d in close_dates} | {d + timedelta(seconds=1) for d in close_dates}
+    order = lambda doc: (doc['date'], doc['action'], doc.get('expired') or datetime.min, doc.get('strike') or 0, doc['type'])
+    leading = sorted((doc for doc in docs if doc['action'] in ('STO', 'BTO', 'SPLIT') and doc['date'] not in close_dates), key=order)
+    following = sorted((doc for doc in docs if doc['date'] in close_dates), key=order)
+    return leading, following
+
+@benchmark
+def assemble(count=50000):
+    """Group a synthetic wheel strategy history of `count` transactions."""
+    leading, following = _split_docs(_wheel_docs(count))
+    print(f"grouping {len(leading)} leading and {len(following)} following transactions")
+    (groups, _, _), elapsed = timed(TransactionGroup.assemble, leading, following)
+    print(f"assemble: {elapsed:.3f}s, {len(groups)} groups, {len([g for g in groups if not g.completed])} incomplete")
+
+@benchmark
+def group_memory(count=50000):
+    """Memory and allocations of loading every group of a large account via Inspector.ticker_transaction_groups."""
+    db = get_database(DB_NAME)
+    db.transactions.delete_many({})
+    db.transaction_groups.delete_many({})
+    ensure_indexes(DB_NAME)
+    db.transactions.insert_many(_wheel_docs(count))
+    Assembler(DB_NAME, "0000").group_transactions("WHL", True)
+    inspector = Inspector(DB_NAME, "0000")
+
+    tracemalloc.start()
+    groups, elapsed = timed(inspector.ticker_transaction_groups, "WHL", False)
+    snapshot = tracemalloc.take_snapshot()
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    blocks = sum(stat.count for stat in snapshot.statistics('filename'))
+    transactions = sum(len(chain) + 1 for group in groups for chain in group.chains.values())
+    print(f"loaded {len(groups)} groups of {transactions} transactions in {elapsed:.3f}s:"
+          f" {current / 2**20:.1f} MiB in {blocks} live blocks, peak {peak / 2**20:.1f} MiB")
+    db.transactions.delete_many({})
+    db.transaction_groups.delete_many({})
+
+def fold_positions(inspector, tickers=None, day=None):
+    """Positions folded in Python transaction by transaction, the way Inspector.positions used to."""
+    condition = inspector._date_limit({**inspector._effective_tx_cond, **inspector._trading_tx_cond}, None, day)
+    if tickers:
+        condition['ui'] = {'$in': tickers}
+    positions = {}
+    for doc in inspector._tx_collection.find(condition).sort([("date", ASC)]):
+        Inspector._add_position(positions, Transaction.from_doc(doc))
+    return {k: v for k, v in positions.items() if v != 0}
+
+@benchmark
+def positions(count=50000, snapshots=20):
+    """Position snapshots of a synthetic wheel strategy history: Python fold vs. Inspector.positions."""
+    db = get_database(DB_NAME)
+    db.transactions.delete_many({})
+    ensure_indexes(DB_NAME)
+    docs = _wheel_docs(count)
+    db.transactions.insert_many(docs)
+    inspector = Inspector(DB_NAME, "0000")
+    start_date, end_date = docs[0]['date'], docs[-1]['date']
+    days = [start_date + (end_date - start_date) * (i + 1) / snapshots for i in range(snapshots)]
+    print(f"{snapshots} snapshots of {len(docs)} transactions")
+
+    folded, elapsed = timed(lambda: [fold_positions(inspector, day=day) for day in days])
+    print(f"fold: {elapsed:.3f}s")
+    aggregated, elapsed = timed(lambda: [inspector.positions(day=day) for day in days])
+    print(f"aggregate: {elapsed:.3f}s, same positions: {folded == aggregated}")
+    db.transactions.delete_many({})
+
+class _CandleSource:
+    """Stand-in for the broker and market API, generating daily candles without network."""
+
+    def get_daily_prices(self, symbol, start_date, end_date):
+        rng = random.Random(symbol)
+        day = datetime.combine(start_date.date(), datetime.min.time()) + timedelta(hours=5)
+        end = end_date.replace(tzinfo=None)
+        candles = []
+        price = 100.0
+        while day <= end:
+            if day.weekday() < 5:
+                price *= 1 + rng.uniform(-0.02, 0.02)
+                candles.append({'time': day, 'open': price, 'high': price * 1.01, 'low': price * 0.99,
+                                'close': price, 'volume': rng.randint(1000, 100000)})
+            day += timedelta(days=1)
+        return candles
+
+@benchmark
+def backfill(symbols=100, years=20):
+    """First-time daily price history backfill of a watchlist: one replace_one per candle vs. bulk_write."""
+    ensure_indexes(DB_NAME)
+    source = _CandleSource()
+    provider = MarketDataProvider(source, source, DB_NAME)
+    collection = get_database(DB_NAME).price_history
+    end_date = datetime.utcnow() - timedelta(days=1)
+    start_date = end_date - timedelta(days=365 * years)
+    watchlist = [f"SYM{i}" for i in range(symbols)]
+    candles = sum(len(source.get_daily_prices(symbol, start_date, end_date)) for symbol in watchlist)
+    print(f"backfilling {symbols} symbols, {candles} candles")
+
+    collection.delete_many({})
+    symbol = watchlist[0]
+    _, elapsed = timed(lambda: [collection.replace_one({'symbol': symbol, 'time': doc['time']}, {**doc, 'symbol': symbol}, upsert=True)
+                                for doc in source.get_daily_prices(symbol, start_date, end_date)])
+    print(f"replace_one: {elapsed:.3f}s for 1 symbol, {elapsed * symbols:.3f}s estimated for {symbols} symbols")
+
+    collection.delete_many({})
+    _, elapsed = timed(lambda: [provider.backfill_daily_prices(symbol, start_date, end_date, 'broker')
+                                for symbol in watchlist])
+    print(f"bulk_write: {elapsed:.3f}s, {collection.count_documents({})} candles saved")
+    collection.delete_many({})
+
+
+if __name__ == '__main__':
+    for name in sys.argv[1:] or BENCHMARKS:
+        print(f"====={name}=====")
+        BENCHMARKS[name]()
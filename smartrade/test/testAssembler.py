@@ -0,0 +1,62 @@
+# -*- coding: utf-8 -*-
+
+import os
+
+import pymongo
+from pymongo.errors import PyMongoError
+
+from smartrade.Assembler import Assembler
+from smartrade.cli import load_db
+from smartrade.Inspector import Inspector
+from smartrade.test.TestBase import TestBase
+from smartrade.utils import get_database, DEFAULT_MONGODB_URI
+
+import unittest
+
+
+def _replica_set_reachable():
+    try:
+        with pymongo.MongoClient(os.environ.get('MONGODB_URI', DEFAULT_MONGODB_URI), serverSelectionTimeoutMS=2000) as client:
+            return 'setName' in client.admin.command('hello')
+    except PyMongoError:
+        return False
+
+
+class TestAssembler(TestBase):
+    FILES = ["7379-1.csv", "7379-2.csv", "7379-3.json"]
+
+    def setUp(self):
+        super().setUp()
+        for i, path in enumerate(self.FILES):
+            load_db(self.DB_NAME, self.ACCOUNT0, f"smartrade/test/{path}", i == 0)
+        self.tickers = sorted(Inspector(self.DB_NAME, self.ACCOUNT0).distinct_tickers())
+
+    def _docs(self):
+        db = get_database(self.DB_NAME)
+        account_cond = Assembler.account_condition(self.ACCOUNT0)
+        transactions = sorted(db.transactions.find(account_cond), key=lambda doc: doc['_id'])
+        groups = sorted((str({k: v for k, v in doc.items() if k != '_id'})
+                         for doc in db.transaction_groups.find(account_cond)))
+        return transactions, groups
+
+    def assertRegrouped(self, atomic):
+        assembler = Assembler(self.DB_NAME, self.ACCOUNT0, atomic)
+        for ticker in self.tickers:
+            assembler.group_transactions(ticker, True)
+        transactions, groups = self._docs()
+        self.assertTrue(groups)
+        # regrouping again only replaces the incomplete groups with the same ones
+        for ticker in self.tickers:
+            assembler.group_transactions(ticker, True)
+        self.assertEqual((transactions, groups), self._docs())
+
+    def test_regroup(self):
+        self.assertRegrouped(False)
+
+    @unittest.skipUnless(_replica_set_reachable(), "session transactions require a replica set(MONGODB_URI)")
+    def test_regroup_atomic(self):
+        self.assertRegrouped(True)
+
+
+if __name__ == '__main__':
+    unittest.main()
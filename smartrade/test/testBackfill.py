@@ -0,0 +1,91 @@
+# -*- coding: utf-8 -*-
+
+from datetime import timedelta
+
+from smartrade.BackfillPlanner import BackfillPlanner
+from smartrade.cli import load_db
+from smartrade.MarketDataProvider import MarketDataProvider
+from smartrade.test.CandleSource import CandleSource
+from smartrade.test.TestBase import TestBase
+from smartrade.utils import get_database
+
+import unittest
+
+
+class TestBackfill(TestBase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        load_db(cls.DB_NAME, cls.ACCOUNT0, f"smartrade/test/{cls.ACCOUNT0}-1.csv")
+
+    def setUp(self):
+        super().setUp()
+        db = get_database(self.DB_NAME)
+        db.price_history.delete_many({})
+        db.price_coverage.delete_many({})
+        db.backfill_jobs.delete_many({})
+        self.broker = CandleSource()
+        self.api = CandleSource()
+        self.provider = MarketDataProvider(self.broker, self.api, self.DB_NAME)
+
+    def test_backfill(self):
+        planner = BackfillPlanner(self.DB_NAME, self.ACCOUNT0, self.provider)
+        tasks = planner.plan()
+        symbols = [task['symbol'] for task in tasks]
+        self.assertEqual(len(symbols), len(set(symbols)))
+        self.assertTrue(all((task['source'] == 'api') == ('_' in task['symbol']) for task in tasks))
+        tickers = [s for s in symbols if '_' not in s]
+        self.assertTrue(all(s.split('_')[0] in tickers for s in symbols))
+
+        self.broker.failing = {tickers[0]}
+        progress = planner.run()
+        self.assertEqual('incomplete', progress['status'])
+        self.assertEqual((len(tasks), len(tasks) - 1, 1), (progress['total'], progress['done'], progress['failed']))
+        self.assertEqual(len(tasks), len(self.broker.requests) + len(self.api.requests))
+
+        # resume the unfinished job
+        self.broker.failing = set()
+        self.broker.requests = []
+        self.api.requests = []
+        progress = planner.run()
+        self.assertEqual(('done', len(tasks), 0), (progress['status'], progress['done'], progress['failed']))
+        self.assertEqual([tickers[0]], self.broker.requests + self.api.requests)
+        self.assertEqual([], planner.plan())
+
+    def test_abandoned(self):
+        planner = BackfillPlanner(self.DB_NAME, self.ACCOUNT0, self.provider)
+        tickers = [task['symbol'] for task in planner.plan() if task['source'] == 'broker']
+        # a symbol that keeps failing, e.g. delisted
+        self.broker.failing = {tickers[0]}
+        for attempt in range(1, BackfillPlanner.MAX_ATTEMPTS + 1):
+            progress = planner.run()
+            self.assertEqual(attempt == BackfillPlanner.MAX_ATTEMPTS, progress['status'] == 'done')
+        self.assertEqual((0, 1), (progress['failed'], progress['abandoned']))
+        self.assertEqual(BackfillPlanner.MAX_ATTEMPTS, self.broker.requests.count(tickers[0]))
+
+        # a new gap is planned along with the abandoned one
+        db = get_database(self.DB_NAME)
+        db.price_history.delete_many({'symbol': tickers[1]})
+        db.price_coverage.delete_many({'symbol': tickers[1]})
+        self.broker.requests = []
+        progress = planner.run()
+        self.assertEqual((2, 1), (progress['total'], progress['failed']))
+        self.assertEqual({tickers[0], tickers[1]}, set(self.broker.requests))
+
+    def test_gaps(self):
+        planner = BackfillPlanner(self.DB_NAME, self.ACCOUNT0, self.provider)
+        task = next(task for task in planner.plan() if task['source'] == 'broker')
+        symbol, start, end = task['symbol'], task['start'], task['end']
+        middle = start + timedelta(days=(end - start).days // 2)
+        self.provider.backfill_daily_prices(symbol, middle - timedelta(days=30), middle + timedelta(days=30), 'broker')
+        self.provider.backfill_daily_prices(symbol, start + timedelta(days=3), start + timedelta(days=4), 'broker')
+        # the covered days in the middle are not requested again, the ones near the start are
+        tasks = [task for task in planner.plan() if task['symbol'] == symbol]
+        self.assertEqual(2, len(tasks))
+        days = [(task['start'].date(), task['end'].date()) for task in tasks]
+        self.assertEqual([(start.date(), (middle - timedelta(days=31)).date()),
+                          ((middle + timedelta(days=31)).date(), end.date())], days)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,58 @@
+# -*- coding: utf-8 -*-
+
+from datetime import datetime
+
+from smartrade.cli import load_db
+from smartrade.Inspector import Inspector
+from smartrade.MarketDataProvider import PriceGrid
+from smartrade.test.TestBase import TestBase
+from smartrade.utils import get_database
+
+import unittest
+
+
+class GridStandIn:
+    """Stand-in for the provider pricing every symbol by its name and the day of week, recording the days priced."""
+
+    def __init__(self):
+        self.days = []
+
+    def get_prices(self, symbols, days):
+        grid = PriceGrid(list(symbols), list(days))
+        grid.values = [[sum(map(ord, symbol)) / 10 + day.weekday() for day in grid.days] for symbol in grid.symbols]
+        self.days.extend(grid.days)
+        return grid
+
+
+class TestBalance(TestBase):
+    def assertBalances(self, account):
+        db = get_database(self.DB_NAME)
+        db.balance_history.delete_many({})
+        provider = GridStandIn()
+        inspector = Inspector(self.DB_NAME, account, provider)
+        start_date, end_date = inspector.transaction_period()
+        balances = inspector.balance_history(start_date, end_date)
+        self.assertEqual((end_date.date() - start_date.date()).days + 1, len(balances))
+        for day, (balance, _) in balances.items():
+            self.assertEqual(inspector.compute_balance(datetime.strptime(day, "%Y-%m-%d"))[-1], balance, day)
+
+        # saved balances are reused, the missing ones are computed and saved
+        self.assertEqual(len(balances), db.balance_history.count_documents({'account': account}))
+        missing = sorted(balances)[1::3]
+        db.balance_history.delete_many({'account': account, 'date': {'$in': [
+            datetime.strptime(day, "%Y-%m-%d") for day in missing]}})
+        provider.days = []
+        self.assertEqual(balances, inspector.balance_history(start_date, end_date))
+        # only the days holding positions are priced
+        self.assertLessEqual({day.strftime("%Y-%m-%d") for day in provider.days}, set(missing))
+        self.assertEqual(len(balances), db.balance_history.count_documents({'account': account}))
+
+    def test_balance_history(self):
+        load_db(self.DB_NAME, self.ACCOUNT0, f"smartrade/test/{self.ACCOUNT0}-1.csv")
+        self.assertBalances(self.ACCOUNT0)
+        load_db(self.DB_NAME, self.ACCOUNT1, f"smartrade/test/{self.ACCOUNT1}-1.csv")
+        self.assertBalances(self.ACCOUNT1)
+
+
+if __name__ == '__main__':
+    unittest.main()
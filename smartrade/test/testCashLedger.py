@@ -0,0 +1,72 @@
+# -*- coding: utf-8 -*-
+
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from smartrade.Assembler import Assembler
+from smartrade.CashLedger import CashLedger
+from smartrade.cli import load_db
+from smartrade.Inspector import Inspector
+from smartrade.test.TestBase import TestBase
+from smartrade.utils import get_database
+
+import unittest
+
+
+class TestCashLedger(TestBase):
+    def setUp(self):
+        super().setUp()
+        load_db(self.DB_NAME, self.ACCOUNT0, f"smartrade/test/{self.ACCOUNT0}-1.csv")
+        self.inspector = Inspector(self.DB_NAME, self.ACCOUNT0)
+        self.tx_cond = {**Assembler.account_condition(self.ACCOUNT0), 'valid': 1, **Assembler.effective_condition()}
+        self.ledger = CashLedger(self.DB_NAME, self.tx_cond)
+
+    def assertCash(self):
+        start_date, end_date = self.inspector.transaction_period()
+        days = [start_date + timedelta(days=i) for i in range(-1, (end_date - start_date).days + 2, 3)]
+        for day in days:
+            expected = self.inspector.account_totals(end_date=day)['total_cash']
+            self.assertAlmostEqual(expected, self.inspector.total_cash(end_date=day))
+            expected = self.inspector.account_totals(day, end_date)['total_cash']
+            self.assertAlmostEqual(expected, self.inspector.total_cash(day, end_date))
+
+    def test_load(self):
+        self.assertCash()
+
+    def test_refresh(self):
+        transactions = get_database(self.DB_NAME).transactions
+        doc = transactions.find_one({**self.tx_cond, 'amount': {'$ne': 0}})
+        # move a transaction into a day of its own, then back in the middle of its day
+        for date in (doc['date'] - timedelta(days=400), doc['date'] + timedelta(hours=12)):
+            transactions.update_one({'_id': doc['_id']}, {'$set': {'date': date}})
+            self.ledger.refresh([doc['date'], date])
+            self.assertCash()
+            self.assertAlmostEqual(doc['amount'], self.inspector.total_cash(date, date))
+            self.assertAlmostEqual(0.0, self.inspector.total_cash(date + timedelta(seconds=1), date + timedelta(hours=1)))
+            doc['date'] = date
+
+    def test_concurrent_refresh(self):
+        transactions = get_database(self.DB_NAME).transactions
+        doc = transactions.find_one({**self.tx_cond, 'amount': {'$ne': 0}})
+        date = doc['date'] + timedelta(days=1)
+        transactions.update_one({'_id': doc['_id']}, {'$set': {'date': date}})
+        with ThreadPoolExecutor(8) as executor:
+            for future in [executor.submit(CashLedger(self.DB_NAME, self.tx_cond).refresh, [doc['date'], date])
+                           for _ in range(8)]:
+                future.result()
+        self.assertCash()
+
+    def test_regroup(self):
+        days = get_database(self.DB_NAME).cash_ledger.count_documents(Assembler.account_condition(self.ACCOUNT0))
+        res = Assembler(self.DB_NAME, self.ACCOUNT0).regroup(self.inspector.distinct_tickers())
+        self.assertFalse(res['failures'])
+        self.assertCash()
+        self.assertEqual(days, self.ledger.rebuild())
+
+    def test_dropped(self):
+        get_database(self.DB_NAME).cash_ledger.drop()
+        self.assertCash()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,44 @@
+# -*- coding: utf-8 -*-
+
+import json
+
+from smartrade.Assembler import Assembler
+from smartrade.cli import load_db
+from smartrade.Inspector import Inspector
+from smartrade.test.TestBase import TestBase
+
+import unittest
+
+
+class TestGroups(TestBase):
+    FILES = {TestBase.ACCOUNT0: ["7379-1.csv", "7379-2.csv", "7379-3.json"],
+             TestBase.ACCOUNT1: ["7977-1.csv", "7977-2.json"],
+             TestBase.ACCOUNT2: ["2666-1.csv"]}
+
+    @classmethod
+    def _normalize(cls, obj):
+        if isinstance(obj, dict): return {k: cls._normalize(v) for k, v in obj.items()}
+        if isinstance(obj, list): return [cls._normalize(v) for v in obj]
+        if isinstance(obj, float): return round(obj, 6)
+        if isinstance(obj, (int, str, bool)) or obj is None: return obj
+        return str(obj)
+
+    def test_groups(self):
+        """Groups of all the fixture accounts are the same as the ones the LIFO scan over groups assembled."""
+        with open("smartrade/test/groups.json") as f:
+            expected = json.load(f)
+        groups = {}
+        for account, files in self.FILES.items():
+            for i, path in enumerate(files):
+                load_db(self.DB_NAME, account, f"smartrade/test/{path}", i == 0)
+            assembler = Assembler(self.DB_NAME, account)
+            for ticker in sorted(Inspector(self.DB_NAME, account).distinct_tickers()):
+                groups[f"{account}/{ticker}"] = self._normalize(
+                    [group.to_json() for group in assembler.group_transactions(ticker, True)])
+        self.assertEqual(sorted(expected), sorted(groups))
+        for key, ticker_groups in expected.items():
+            self.assertEqual(ticker_groups, groups[key], key)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,200 @@
+# -*- coding: utf-8 -*-
+
+"""Query plans of the query paths against a local mongod."""
+
+import os
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone
+from unittest import mock
+
+import pymongo
+from pymongo.collection import Collection
+from pymongo.errors import PyMongoError
+
+from smartrade.Assembler import Assembler
+from smartrade.cli import load_db
+from smartrade.indexes import ensure_indexes
+from smartrade.Inspector import Inspector
+from smartrade.Loader import Loader
+from smartrade.MarketDataProvider import MarketDataProvider
+from smartrade.test.CandleSource import CandleSource
+from smartrade.test.TestBase import TestBase
+from smartrade.utils import get_database, DEFAULT_MONGODB_URI
+
+import unittest
+
+
+class QueryRecorder:
+    """Records the queries sent through pymongo collections to explain them afterwards."""
+
+    def __init__(self):
+        self.queries = [] # (collection, kind, filter, cursor or pipeline)
+
+    @contextmanager
+    def recording(self):
+        recorder = self
+        find, aggregate, distinct = Collection.find, Collection.aggregate, Collection.distinct
+
+        def recorded_find(collection, filter=None, *args, **kwargs):
+            cursor = find(collection, filter, *args, **kwargs)
+            recorder.queries.append((collection, 'find', filter, cursor))
+            return cursor
+
+        def recorded_aggregate(collection, pipeline, *args, **kwargs):
+            recorder.queries.append((collection, 'aggregate', None, pipeline))
+            return aggregate(collection, pipeline, *args, **kwargs)
+
+        def recorded_distinct(collection, key, filter=None, *args, **kwargs):
+            recorder.queries.append((collection, 'distinct', filter, None))
+            return distinct(collection, key, filter, *args, **kwargs)
+
+        def recorder_of(method):
+            original = getattr(Collection, method)
+            def recorded(collection, filter, *args, **kwargs):
+                recorder.queries.append((collection, method, filter, None))
+                return original(collection, filter, *args, **kwargs)
+            return recorded
+
+        patches = [mock.patch.object(Collection, 'find', recorded_find),
+                   mock.patch.object(Collection, 'aggregate', recorded_aggregate),
+                   mock.patch.object(Collection, 'distinct', recorded_distinct)]
+        patches += [mock.patch.object(Collection, method, recorder_of(method))
+                    for method in ('delete_many', 'update_one', 'update_many', 'replace_one')]
+        for patch in patches:
+            patch.start()
+        try:
+            yield self
+        finally:
+            for patch in reversed(patches):
+                patch.stop()
+
+    @classmethod
+    def winning_plan(cls, collection, kind, filter, query):
+        if kind == 'find':
+            return query.clone().explain()['queryPlanner']['winningPlan']
+
+        if kind == 'aggregate':
+            res = collection.database.command('aggregate', collection.name, pipeline=query, explain=True)
+            planner = res['queryPlanner'] if 'queryPlanner' in res else res['stages'][0]['$cursor']['queryPlanner']
+            return planner['winningPlan']
+
+        # distinct and write operations select their documents the same way as the query
+        return collection.find(filter).explain()['queryPlanner']['winningPlan']
+
+    @classmethod
+    def stages(cls, plan):
+        """Every stage name of the query plan."""
+        yield plan.get('stage', None)
+        for key in ('inputStage', 'queryPlan'):
+            if key in plan:
+                yield from cls.stages(plan[key])
+        for stage in plan.get('inputStages', []):
+            yield from cls.stages(stage)
+
+
+def _mongod_reachable():
+    try:
+        with pymongo.MongoClient(os.environ.get('MONGODB_URI', DEFAULT_MONGODB_URI), serverSelectionTimeoutMS=2000) as client:
+            client.admin.command('ping')
+        return True
+    except PyMongoError:
+        return False
+
+
+@unittest.skipUnless(_mongod_reachable(), "query plans are explained by a running mongod(MONGODB_URI)")
+class TestIndexes(TestBase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        load_db(cls.DB_NAME, cls.ACCOUNT0, f"smartrade/test/{cls.ACCOUNT0}-1.csv")
+        ensure_indexes(cls.DB_NAME)
+        cls.db = get_database(cls.DB_NAME)
+
+    def assertPlans(self, recorder):
+        self.assertTrue(recorder.queries)
+        for collection, kind, filter, query in recorder.queries:
+            if collection.name == 'market_hours' and not filter:
+                continue # the whole calendar is loaded at once
+
+            stages = list(recorder.stages(recorder.winning_plan(collection, kind, filter, query)))
+            description = f"{kind} on {collection.name}: {filter or query} => {stages}"
+            self.assertNotIn('COLLSCAN', stages, description)
+            if kind == 'find':
+                self.assertNotIn('SORT', stages, description)
+
+    def test_effective_transactions(self):
+        account_cond = Assembler.account_condition(self.ACCOUNT0)
+        for condition in (Assembler.effective_condition(), Assembler.ineffective_condition()):
+            cursor = self.db.transactions.find({**account_cond, 'valid': 1, **condition, 'ui': "AAPL"})
+            plan = list(QueryRecorder.stages(cursor.explain()['queryPlanner']['winningPlan']))
+            self.assertIn('IXSCAN', plan)
+            self.assertNotIn('COLLSCAN', plan)
+
+    def test_materialized_flags(self):
+        collection = self.db.transactions
+        account_cond = Assembler.account_condition(self.ACCOUNT0)
+        count = collection.count_documents(account_cond)
+        self.assertEqual(0, collection.count_documents({'effective': {'$exists': False}}))
+        # nothing is merged or sliced before grouping
+        self.assertEqual(count, collection.count_documents({**account_cond, 'original': True}))
+
+    def test_loader(self):
+        class NoTransactions:
+            def get_transactions(self, *args):
+                return []
+
+        with QueryRecorder().recording() as recorder:
+            Loader(self.DB_NAME, self.ACCOUNT0, NoTransactions()).live_load()
+            load_db(self.DB_NAME, self.ACCOUNT0, f"smartrade/test/{self.ACCOUNT0}-1.csv")
+        self.assertPlans(recorder)
+
+    def test_assembler(self):
+        assembler = Assembler(self.DB_NAME, self.ACCOUNT0)
+        tickers = Inspector(self.DB_NAME, self.ACCOUNT0).distinct_tickers()
+        with QueryRecorder().recording() as recorder:
+            for ticker in tickers:
+                assembler.group_transactions(ticker, True)
+        self.assertPlans(recorder)
+
+    def test_inspector(self):
+        source = CandleSource()
+        provider = MarketDataProvider(source, source, self.DB_NAME)
+        inspector = Inspector(self.DB_NAME, self.ACCOUNT0, provider)
+        start_date, end_date = inspector.transaction_period()
+        with QueryRecorder().recording() as recorder:
+            inspector.transaction_period()
+            for total in (inspector.total_investment, inspector.total_interest, inspector.total_dividend,
+                          inspector.total_trading, inspector.total_cash):
+                total()
+                total(start_date, end_date)
+            inspector.account_totals()
+            inspector.account_totals(start_date, end_date)
+            tickers = inspector.distinct_tickers(start_date, end_date)
+            inspector.ticker_costs(tickers[0], start_date, end_date)
+            inspector.summarize(False)
+            inspector.transaction_list()
+            inspector.transaction_list(start_date, end_date, ",".join(tickers[:2]), True, 1, 1, 1, 1)
+            inspector.transaction_list(action="INTEREST,DIVIDEND")
+            inspector.ticker_transactions(tickers[0])
+            inspector.positions()
+            inspector.positions(tickers[:2], end_date)
+            inspector.balance_history(end_date - timedelta(days=7), end_date)
+            inspector.get_balance(end_date)
+            inspector.save_actual_balance({end_date.strftime("%m/%d/%Y"): 100.0})
+        self.assertPlans(recorder)
+
+    def test_market_data_provider(self):
+        source = CandleSource()
+        provider = MarketDataProvider(source, source, self.DB_NAME)
+        day = datetime(2022, 2, 1, 21, tzinfo=timezone.utc)
+        with QueryRecorder().recording() as recorder:
+            provider.get_quotes(["AAPL", "MSFT"], day)
+            provider.get_daily_price_history("AAPL", day - timedelta(days=30), day)
+            provider.get_prices(["AAPL", "MSFT"], [day - timedelta(days=1), day])
+            provider.get_price("MSFT", day)
+            provider.get_market_hours(day)
+        self.assertPlans(recorder)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,7 +1,15 @@
 # -*- coding: utf-8 -*-
 
+from unittest import mock
+
+from pymongo.errors import BulkWriteError
+
 from smartrade.cli import load_db
+from smartrade.Inspector import Inspector
+from smartrade.Loader import Loader
 from smartrade.test.TestBase import TestBase
+from smartrade.Transaction import Transaction
+from smartrade.utils import get_database
 
 import unittest
 
@@ -52,6 +60,55 @@ class TestLoad(TestBase):
         self.assertEqual(23, len(valid_transactions))
         self.assertEqual(5, len(invalid_transactions))
 
+    def test_written_tickers(self):
+        loader = Loader(self.DB_NAME, self.ACCOUNT1)
+        self.assertFalse(loader.written_tickers)
+        loader.load(f"smartrade/test/{self.ACCOUNT1}-1.csv", True)
+        tickers = {ui for _, ui in loader.written_tickers}
+        self.assertEqual({'ETHE', 'HOOD', 'MU'}, tickers)
+        self.assertEqual({self.ACCOUNT1}, {account for account, _ in loader.written_tickers})
+
+        loader = Loader(self.DB_NAME, self.ACCOUNT1)
+        loader.load(f"smartrade/test/{self.ACCOUNT1}-2.json", False)
+        self.assertEqual({'HOOD', 'MU'}, {ui for _, ui in loader.written_tickers})
+
+    def test_batches(self):
+        loader = Loader(self.DB_NAME, self.ACCOUNT1, batch_size=4)
+        transactions = loader.load(f"smartrade/test/{self.ACCOUNT1}-1.csv", True)
+        collection = get_database(self.DB_NAME).transactions
+        self.assertEqual(len(transactions), collection.count_documents({'account': self.ACCOUNT1}))
+        self.assertEqual(0, loader.duplicates)
+
+        # saved transactions are skipped and counted, the others are inserted
+        saved = [Transaction.from_doc(doc) for doc in collection.find({'account': self.ACCOUNT1}).limit(6)]
+        collection.delete_one({'_id': saved[-1].id})
+        stats = loader._save(saved, False)
+        self.assertEqual([(4, 4), (2, 1)], [(count, failed) for count, _, failed in stats])
+        self.assertEqual(5, loader.duplicates)
+        self.assertEqual(len(transactions), collection.count_documents({'account': self.ACCOUNT1}))
+
+        # other errors are raised after all the batches
+        error = BulkWriteError({'writeErrors': [{'index': 0, 'code': 121, 'errmsg': "Document failed validation"}]})
+        with mock.patch.object(loader, '_transactions') as failing:
+            failing.insert_many.side_effect = error
+            self.assertRaises(BulkWriteError, loader._save, saved, False)
+            self.assertEqual(2, failing.insert_many.call_count)
+        self.assertEqual(5, loader.duplicates)
+
+    def test_unflagged(self):
+        load_db(self.DB_NAME, self.ACCOUNT0, f"smartrade/test/{self.ACCOUNT0}-1.csv")
+        inspector = Inspector(self.DB_NAME, self.ACCOUNT0)
+        totals, positions = inspector.account_totals(), inspector.positions()
+        # transactions saved before the flags were materialized
+        db = get_database(self.DB_NAME)
+        db.transactions.update_many({'account': self.ACCOUNT0}, {'$unset': {'effective': 1, 'original': 1}})
+        db.cash_ledger.drop()
+        inspector = Inspector(self.DB_NAME, self.ACCOUNT0)
+        self.assertEqual(0, db.transactions.count_documents({'effective': {'$exists': False}}))
+        self.assertEqual(totals, inspector.account_totals())
+        self.assertAlmostEqual(totals['total_cash'], inspector.total_cash())
+        self.assertEqual(positions, inspector.positions())
+
 
 if __name__ == '__main__':
     unittest.main()
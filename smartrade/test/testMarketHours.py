@@ -0,0 +1,93 @@
+# -*- coding: utf-8 -*-
+
+from datetime import date, datetime, timedelta, timezone
+
+from smartrade.MarketDataProvider import MarketDataProvider
+from smartrade.test.TestBase import TestBase
+from smartrade.utils import get_database
+
+import unittest
+
+
+class HoursStandIn:
+    """Stand-in for the broker opening the market 9:30-16:00 EST on weekdays except the holidays."""
+
+    def __init__(self, holidays=()):
+        self.requests = []
+        self.holidays = set(holidays)
+
+    def get_market_hours(self, day):
+        self.requests.append(day.date())
+        if day.weekday() >= 5 or day.date() in self.holidays: return None
+
+        return f"{day.date()}T09:30:00-05:00", f"{day.date()}T16:00:00-05:00"
+
+
+class CountingCollection:
+    """Collection counting its find calls."""
+
+    def __init__(self, collection):
+        self.collection = collection
+        self.finds = 0
+
+    def find(self, *args, **kwargs):
+        self.finds += 1
+        return self.collection.find(*args, **kwargs)
+
+    def __getattr__(self, name):
+        return getattr(self.collection, name)
+
+
+class TestMarketHours(TestBase):
+    HOLIDAY = date(2022, 1, 17)
+
+    def setUp(self):
+        super().setUp()
+        get_database(self.DB_NAME).market_hours.delete_many({})
+        self.broker = HoursStandIn([self.HOLIDAY])
+        self.provider = MarketDataProvider(self.broker, None, self.DB_NAME)
+
+    def test_load(self):
+        self.provider.load_market_hours(date(2022, 1, 10), date(2022, 1, 21))
+        self.assertEqual(12, len(self.broker.requests))
+        self.provider.load_market_hours(date(2022, 1, 10), date(2022, 1, 21))
+        self.assertEqual(12, len(self.broker.requests))
+
+        # the calendar saved by another provider
+        provider = MarketDataProvider(HoursStandIn(), None, self.DB_NAME)
+        self.assertFalse(provider.has_trading_day(date(2022, 1, 15), self.HOLIDAY))
+        self.assertEqual((datetime(2022, 1, 18, 14, 30, tzinfo=timezone.utc), datetime(2022, 1, 18, 21, tzinfo=timezone.utc)),
+                         provider.get_market_hours(date(2022, 1, 18)))
+        # the latest session before the holiday
+        self.assertEqual(datetime(2022, 1, 14, 21, tzinfo=timezone.utc),
+                         provider._trading_time(datetime(2022, 1, 18, 12, tzinfo=timezone.utc))[1])
+        self.assertIsNone(provider.get_market_hours(self.HOLIDAY))
+        self.assertEqual([], provider._broker.requests)
+
+    def test_get(self):
+        self.assertIsNone(self.provider.get_market_hours(self.HOLIDAY))
+        self.assertIsNone(self.provider.get_market_hours(self.HOLIDAY))
+        self.assertEqual([self.HOLIDAY], self.broker.requests)
+
+    def test_defaults(self):
+        hours = CountingCollection(self.provider._hours_collection)
+        self.provider._hours_collection = hours
+        # the regular hours of weekdays for the days never retrieved, without a query per day
+        day = date(2019, 1, 1)
+        open_days = 0
+        while day < date(2022, 1, 1):
+            open_days += bool(self.provider._calendar_hours(day))
+            day += timedelta(days=1)
+        self.assertEqual(784, open_days)
+        self.assertTrue(self.provider.has_trading_day(date(2019, 1, 5), date(2021, 12, 31)))
+        self.assertEqual(1, hours.finds)
+        self.assertEqual([], self.broker.requests)
+
+        # reloaded for the missing days once the calendar gets old
+        self.provider._calendar_loaded -= MarketDataProvider.HOURS_MISS_TTL + 1
+        self.provider.load_market_hours(self.HOLIDAY, self.HOLIDAY)
+        self.assertEqual(2, hours.finds)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,117 @@
+# -*- coding: utf-8 -*-
+
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import json
+import threading
+import time
+
+from smartrade.exceptions import ServerError, TooManyRequestsError
+from smartrade.PolygonApi import PolygonApi
+from smartrade.test.TestBase import TestBase
+
+import unittest
+
+
+class PolygonStandIn(BaseHTTPRequestHandler):
+    """Local stand-in of the Polygon aggregates endpoint.
+
+    Ticker RATE is rate limited on its first request, ticker LIMIT always, ticker NONE has no results,
+    ticker FAIL always fails on the server.
+    """
+    protocol_version = "HTTP/1.1" # keep-alive
+    requests = []
+    ports = set()
+
+    def do_GET(self):
+        ticker = self.path.split("/")[4]
+        PolygonStandIn.requests.append((ticker, time.monotonic()))
+        PolygonStandIn.ports.add(self.client_address[1])
+        if ticker == "RATE" and len([r for r in self.requests if r[0] == ticker]) == 1:
+            self._reply(429, {'status': "ERROR"}, {'Retry-After': "0.3"})
+        elif ticker == "LIMIT":
+            self._reply(429, {'status': "ERROR"}, {'Retry-After': "0"})
+        elif ticker == "FAIL":
+            self._reply(500, {'status': "ERROR"})
+        elif ticker == "NONE":
+            self._reply(200, {'resultsCount': 0})
+        else:
+            bar = {'o': 1.0, 'c': 2.0, 'h': 3.0, 'l': 0.5, 'v': 100, 'vw': 1.5, 'n': 10, 't': 1643691600000}
+            self._reply(200, {'resultsCount': 1, 'results': [bar]})
+
+    def _reply(self, code, body, headers=None):
+        content = json.dumps(body).encode()
+        self.send_response(code)
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.send_header('Content-Type', "application/json")
+        self.send_header('Content-Length', str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    def log_message(self, *args):
+        pass
+
+
+class TestPolygonApi(TestBase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.server = ThreadingHTTPServer(("127.0.0.1", 0), PolygonStandIn)
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+        cls.url = f"http://127.0.0.1:{cls.server.server_address[1]}"
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+        super().tearDownClass()
+
+    def setUp(self):
+        super().setUp()
+        PolygonStandIn.requests = []
+        PolygonStandIn.ports = set()
+
+    def _api(self, **config):
+        return PolygonApi({'api_key': "key", 'url': self.url, 'requests_per_minute': 6000, **config})
+
+    def test_daily_prices(self):
+        prices = self._api().get_daily_prices("AAPL", datetime(2022, 2, 1), datetime(2022, 2, 2))
+        self.assertEqual(1, len(prices))
+        self.assertEqual(2.0, prices[0]['close'])
+        self.assertEqual(1.5, prices[0]['weighted_average'])
+        self.assertIsInstance(prices[0]['time'], datetime)
+        self.assertEqual([], self._api().get_daily_prices("NONE", datetime(2022, 2, 1), datetime(2022, 2, 2)))
+
+    def test_retry_after(self):
+        start = time.monotonic()
+        prices = self._api().get_daily_prices("RATE", datetime(2022, 2, 1), datetime(2022, 2, 2))
+        self.assertEqual(1, len(prices))
+        self.assertEqual(2, len(PolygonStandIn.requests))
+        self.assertGreaterEqual(time.monotonic() - start, 0.3)
+
+    def test_retries_run_out(self):
+        api = self._api(max_retries=1)
+        with self.assertRaises(ServerError):
+            api.get_daily_prices("FAIL", datetime(2022, 2, 1), datetime(2022, 2, 2))
+        with self.assertRaises(TooManyRequestsError):
+            api.get_daily_prices("LIMIT", datetime(2022, 2, 1), datetime(2022, 2, 2))
+        self.assertEqual(4, len(PolygonStandIn.requests))
+        self.assertEqual(365, self._api(history_days=365).history_days())
+
+    def test_request_quota(self):
+        symbols = [f"S{c}" for c in "ABCDEFGH"]
+        api = self._api(requests_per_minute=600, burst=1, max_workers=4)
+        start = time.monotonic()
+        prices = api.get_daily_prices_of(symbols, datetime(2022, 2, 1), datetime(2022, 2, 2))
+        self.assertEqual(symbols, list(prices))
+        self.assertTrue(all(len(p) == 1 for p in prices.values()))
+        # 10 requests per second after the first one
+        self.assertGreaterEqual(time.monotonic() - start, 0.65)
+        times = sorted(t for _, t in PolygonStandIn.requests)
+        self.assertGreaterEqual(times[-1] - times[0], 0.65)
+        self.assertLessEqual(len(PolygonStandIn.ports), 4)
+
+
+if __name__ == '__main__':
+    unittest.main()
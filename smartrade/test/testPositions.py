@@ -0,0 +1,65 @@
+# -*- coding: utf-8 -*-
+
+from datetime import timedelta
+
+from smartrade.cli import load_db
+from smartrade.Inspector import Inspector
+from smartrade.test.TestBase import TestBase
+from smartrade.Transaction import Transaction
+from smartrade.utils import get_database, ASC
+
+import unittest
+
+
+def fold_positions(inspector, tickers=None, day=None):
+    """Positions folded in Python transaction by transaction as the reference of Inspector.positions."""
+    condition = inspector._date_limit({**inspector._effective_tx_cond, **inspector._trading_tx_cond}, None, day)
+    if tickers:
+        condition['ui'] = {'$in': tickers}
+    positions = {}
+    for doc in inspector._tx_collection.find(condition).sort([("date", ASC)]):
+        Inspector._add_position(positions, Transaction.from_doc(doc))
+    return {k: v for k, v in positions.items() if v != 0}
+
+
+class TestPositions(TestBase):
+    def assertPositions(self, account):
+        inspector = Inspector(self.DB_NAME, account)
+        self.assertEqual(fold_positions(inspector), inspector.positions())
+        start_date, end_date = inspector.transaction_period()
+        tickers = inspector.distinct_tickers()[:3]
+        day = start_date - timedelta(days=1)
+        while day <= end_date:
+            self.assertEqual(fold_positions(inspector, day=day), inspector.positions(day=day))
+            self.assertEqual(fold_positions(inspector, tickers, day), inspector.positions(tickers, day))
+            day += timedelta(days=3)
+
+    def test_positions(self):
+        load_db(self.DB_NAME, self.ACCOUNT0, f"smartrade/test/{self.ACCOUNT0}-1.csv")
+        self.assertPositions(self.ACCOUNT0)
+        # with AUTO type options
+        load_db(self.DB_NAME, self.ACCOUNT0, f"smartrade/test/{self.ACCOUNT0}-2.csv", False)
+        self.assertPositions(self.ACCOUNT0)
+        load_db(self.DB_NAME, self.ACCOUNT1, f"smartrade/test/{self.ACCOUNT1}-1.csv")
+        self.assertPositions(self.ACCOUNT1)
+
+    def test_expired_closed(self):
+        load_db(self.DB_NAME, self.ACCOUNT0, f"smartrade/test/{self.ACCOUNT0}-1.csv")
+        inspector = Inspector(self.DB_NAME, self.ACCOUNT0)
+        positions = inspector.positions()
+        transactions = get_database(self.DB_NAME).transactions
+        # an option leg fully closed before it expired
+        doc = next(doc for doc in transactions.find({**inspector._effective_tx_cond, 'action': 'BTC'})
+                   if str(Transaction.from_doc(doc).symbol) not in positions)
+        day = doc['date'] + timedelta(days=1)
+        day_positions = inspector.positions(day=day)
+        doc.pop('_id')
+        transactions.insert_one({**doc, 'tx_id': f"{doc['tx_id']}-E", 'action': 'EXPIRED',
+                                 'date': doc['date'] + timedelta(minutes=1), 'price': 0, 'fee': 0, 'amount': 0})
+        self.assertEqual(positions, inspector.positions())
+        self.assertEqual(day_positions, inspector.positions(day=day))
+        self.assertPositions(self.ACCOUNT0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,76 @@
+# -*- coding: utf-8 -*-
+
+from datetime import date, datetime, timedelta, timezone
+
+from smartrade.MarketDataProvider import MarketDataProvider
+from smartrade.PriceCoverage import PriceCoverage
+from smartrade.test.CandleSource import CandleSource
+from smartrade.test.TestBase import TestBase
+from smartrade.utils import get_database
+
+import unittest
+
+
+class TestPriceCoverage(TestBase):
+    def setUp(self):
+        super().setUp()
+        db = get_database(self.DB_NAME)
+        db.price_history.delete_many({})
+        db.price_coverage.delete_many({})
+        self.source = CandleSource()
+        self.provider = MarketDataProvider(self.source, self.source, self.DB_NAME)
+
+    def test_ranges(self):
+        ranges = PriceCoverage.merge([], date(2022, 1, 1), date(2022, 1, 31))
+        ranges = PriceCoverage.merge(ranges, date(2022, 3, 1), date(2022, 3, 31))
+        self.assertEqual([(date(2022, 1, 1), date(2022, 1, 31)), (date(2022, 3, 1), date(2022, 3, 31))], ranges)
+        self.assertEqual([(date(2022, 2, 1), date(2022, 2, 28)), (date(2022, 4, 1), date(2022, 4, 5))],
+                         PriceCoverage.missing(ranges, date(2022, 1, 15), date(2022, 4, 5)))
+        self.assertEqual([], PriceCoverage.missing(ranges, date(2022, 3, 2), date(2022, 3, 3)))
+        # adjacent ranges are merged
+        ranges = PriceCoverage.merge(ranges, date(2022, 2, 1), date(2022, 2, 28))
+        self.assertEqual([(date(2022, 1, 1), date(2022, 3, 31))], ranges)
+
+    def test_interior_gap(self):
+        time_zone = timezone.utc
+        for start, end in ((datetime(2022, 1, 3), datetime(2022, 1, 31)), (datetime(2022, 3, 1), datetime(2022, 3, 31))):
+            self.provider.backfill_daily_prices("AAPL", start.replace(tzinfo=time_zone), end.replace(tzinfo=time_zone), 'broker')
+        self.source.requests = []
+        start, end = datetime(2022, 1, 10, tzinfo=time_zone), datetime(2022, 3, 10, tzinfo=time_zone)
+        prices = self.provider.get_daily_price_history("AAPL", start, end)
+        self.assertEqual(["AAPL"], self.source.requests)
+        self.assertEqual(4, len(prices))
+        # served locally after the gap is filled
+        self.provider.get_daily_price_history("AAPL", start, end)
+        self.assertEqual(["AAPL"], self.source.requests)
+
+    def test_seed(self):
+        days = [date(2022, 1, d) for d in (3, 4, 5, 6, 7, 10, 11, 18, 19, 20, 21)]
+        get_database(self.DB_NAME).price_history.insert_many(
+            [{'symbol': "MSFT", 'time': datetime.combine(day, datetime.min.time()), 'close': 1.0} for day in days])
+        # the trading days without prices are not taken as retrieved, the weekend is
+        expected = [(date(2022, 1, 3), date(2022, 1, 11)), (date(2022, 1, 18), date(2022, 1, 21))]
+        self.assertEqual({"MSFT": expected}, self.provider.coverage_ranges(["MSFT"]))
+        self.assertEqual({"MSFT": expected}, self.provider.coverage_ranges(["MSFT"]))
+
+    def test_known_empty(self):
+        self.source.get_daily_prices = lambda *args: self.source.requests.append(args[0]) or []
+        start, end = datetime(2022, 1, 3, tzinfo=timezone.utc), datetime(2022, 1, 14, tzinfo=timezone.utc)
+        for _ in range(2):
+            self.assertEqual([], self.provider.get_daily_price_history("HOOD_011422C20", start, end))
+        self.assertEqual(["HOOD_011422C20"], self.source.requests)
+
+    def test_unpublished(self):
+        self.source.get_daily_prices = lambda *args: []
+        end = MarketDataProvider._latest_price_day("MSFT")
+        self.provider.backfill_daily_prices("MSFT", end - timedelta(days=10), end, 'broker')
+        # the prices of the latest days may be published later
+        unsettled_day = datetime.utcnow().date() - timedelta(days=MarketDataProvider.UNSETTLED_DAYS)
+        self.assertEqual([((end - timedelta(days=10)).date(), unsettled_day - timedelta(days=1))],
+                         self.provider.coverage_ranges(["MSFT"])["MSFT"])
+        self.provider.backfill_daily_prices("MSFT", end - timedelta(days=1), end, 'broker')
+        self.assertEqual(1, len(self.provider.coverage_ranges(["MSFT"])["MSFT"]))
+
+
+if __name__ == '__main__':
+    unittest.main()
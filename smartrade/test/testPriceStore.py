@@ -0,0 +1,54 @@
+# -*- coding: utf-8 -*-
+
+import tempfile
+from datetime import datetime, timedelta
+
+from smartrade.PriceStore import PriceStore, numpy
+from smartrade.test.TestBase import TestBase
+
+import unittest
+
+
+@unittest.skipIf(numpy is None, "numpy is not installed")
+class TestPriceStore(TestBase):
+    def setUp(self):
+        super().setUp()
+        self.root_dir = tempfile.TemporaryDirectory()
+        self.store = PriceStore(self.root_dir.name)
+
+    def tearDown(self):
+        self.root_dir.cleanup()
+        super().tearDown()
+
+    @classmethod
+    def candles(cls, start, days, close):
+        return [{'time': start + timedelta(days=i), 'open': close, 'high': close, 'low': close, 'close': close,
+                 'volume': 1} for i in range(days)]
+
+    def closes(self, symbol):
+        return [doc['close'] for doc in PriceStore.to_docs(symbol, self.store.read(symbol))]
+
+    def test_save(self):
+        start = datetime(2022, 1, 3)
+        self.assertEqual(5, self.store.save("AAPL", self.candles(start, 5, 1.0)))
+        self.assertEqual(2, self.store.save("AAPL", self.candles(start + timedelta(days=5), 2, 2.0)))
+        self.assertEqual([1.0] * 5 + [2.0] * 2, self.closes("AAPL"))
+        self.assertEqual(start + timedelta(days=6), self.store.last_time("AAPL"))
+
+        # corrected candles replace the stored ones, earlier ones are inserted in time order
+        self.store.save("AAPL", self.candles(start - timedelta(days=1), 3, 3.0))
+        self.assertEqual([3.0] * 3 + [1.0] * 3 + [2.0] * 2, self.closes("AAPL"))
+        docs = PriceStore.to_docs("AAPL", self.store.read("AAPL", start, start + timedelta(days=1)))
+        self.assertEqual([start, start + timedelta(days=1)], [doc['time'] for doc in docs])
+
+    def test_replaced(self):
+        start = datetime(2022, 1, 3)
+        self.store.save("AAPL", self.candles(start, 5, 1.0))
+        self.assertEqual([1.0] * 5, self.closes("AAPL"))
+        # rewritten to a file of the same size by another process
+        PriceStore(self.root_dir.name).save("AAPL", self.candles(start, 5, 2.0))
+        self.assertEqual([2.0] * 5, self.closes("AAPL"))
+
+
+if __name__ == '__main__':
+    unittest.main()
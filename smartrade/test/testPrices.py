@@ -0,0 +1,89 @@
+# -*- coding: utf-8 -*-
+
+from datetime import datetime, timedelta, timezone
+import random
+import tempfile
+
+from smartrade.MarketDataProvider import MarketDataProvider
+from smartrade.PriceStore import PriceStore, numpy
+from smartrade.test.TestBase import TestBase
+from smartrade.test.testMarketHours import CountingCollection
+from smartrade.utils import get_database
+
+import unittest
+
+
+class PriceSource:
+    """Stand-in for the broker and market API with a random close on most weekdays, none for symbol MISSING."""
+
+    HISTORY_DAYS = (datetime.utcnow() - datetime(2021, 12, 1)).days
+
+    def history_days(self):
+        return self.HISTORY_DAYS
+
+    def get_daily_prices(self, symbol, start_date, end_date):
+        if symbol == "MISSING": return []
+
+        day = datetime.combine(start_date.date(), datetime.min.time()) + timedelta(hours=5)
+        candles = []
+        while day <= end_date.replace(tzinfo=None):
+            rng = random.Random(f"{symbol}{day}")
+            if day.weekday() < 5 and rng.random() < 0.9:
+                candles.append({'time': day, 'close': rng.uniform(1, 100)})
+            day += timedelta(days=1)
+        return candles
+
+
+class LiveStandIn(MarketDataProvider):
+    """Provider quoting today's price of every symbol but MISSING at 50.0."""
+
+    def get_quotes(self, symbols, day=None):
+        if day and day.date() < datetime.now(timezone.utc).date(): return super().get_quotes(symbols, day)
+
+        symbols = [symbols] if isinstance(symbols, str) else symbols
+        return {symbol: (50.0, 0, 0) for symbol in symbols if symbol != "MISSING"}, True
+
+
+class TestPrices(TestBase):
+    SYMBOLS = ["AAPL", "MSFT", "HOOD_031122C14.5", "MISSING"]
+
+    def setUp(self):
+        super().setUp()
+        db = get_database(self.DB_NAME)
+        for collection in (db.quotes, db.price_history, db.price_coverage, db.market_hours):
+            collection.delete_many({})
+        # close quote of a past day
+        db.quotes.insert_one({'symbol': "MSFT", 'date': datetime(2022, 2, 4, 20, 30),
+                              'bidPrice': 1.0, 'askPrice': 3.0, 'netChange': 0})
+        source = PriceSource()
+        self.provider = LiveStandIn(source, source, self.DB_NAME)
+
+    def test_prices(self):
+        days = [datetime(2022, 2, 1) + timedelta(days=i) for i in range(30)] + [datetime.utcnow()]
+        prices = self.provider.get_prices(self.SYMBOLS, days)
+        for symbol in self.SYMBOLS:
+            for day in days:
+                self.assertAlmostEqual(self.provider.get_price(symbol, day), prices[symbol, day], msg=f"{symbol} {day}")
+        # the close quote of Friday
+        self.assertEqual(2.0, prices["MSFT", datetime(2022, 2, 5)])
+        self.assertEqual([50.0] * 3 + [0], prices.column(days[-1]))
+        self.assertEqual([0] * len(days), prices["MISSING"])
+
+    @unittest.skipIf(numpy is None, "numpy is not installed")
+    def test_price_store(self):
+        days = [datetime(2022, 2, 1) + timedelta(days=i) for i in range(30)]
+        prices = self.provider.get_prices(self.SYMBOLS, days)
+        with tempfile.TemporaryDirectory() as root_dir:
+            source = PriceSource()
+            provider = LiveStandIn(source, source, self.DB_NAME, price_store=PriceStore(root_dir))
+            history = CountingCollection(provider._price_collection)
+            provider._price_collection = history
+            # the prices saved before are copied into the store once
+            self.assertEqual(prices.values, provider.get_prices(self.SYMBOLS, days).values)
+            finds = history.finds
+            self.assertEqual(prices.values, provider.get_prices(self.SYMBOLS, days).values)
+            self.assertEqual(finds, history.finds)
+
+
+if __name__ == '__main__':
+    unittest.main()
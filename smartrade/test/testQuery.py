@@ -1,7 +1,7 @@
 # -*- coding: utf-8 -*-
 
-from smartrade.cli import get_provider, distinct_tickers, get_config, group_transactions, \
-    ticker_costs, ticker_transaction_groups, total_cash, total_dividend, total_interest, total_investment, total_trading
+from smartrade.cli import get_provider, distinct_tickers, get_config, group_transactions, regroup_transactions, \
+    account_totals, ticker_costs, ticker_transaction_groups, total_cash, total_dividend, total_interest, total_investment, total_trading
 from smartrade.test.TestBase import TestBase
 from smartrade.TransactionGroup import TransactionGroup
 
@@ -83,6 +83,9 @@ class TestQuery(TestBase):
             self.assertAlmostEqual(expected[3], total_cash(self.DB_NAME, self.ACCOUNT0, end_date=end_date))
             self.assertAlmostEqual(expected[4], total_trading(self.DB_NAME, self.ACCOUNT0, end_date=end_date))
             # self.assertAlmostEqual(expected[5], total_profit(self.DB_NAME, self.ACCOUNT0, end_date=end_date))
+            totals = account_totals(self.DB_NAME, self.ACCOUNT0, end_date=end_date)
+            for i, name in enumerate(('total_investment', 'total_interest', 'total_dividend', 'total_cash', 'total_trading')):
+                self.assertAlmostEqual(expected[i], totals[name])
 
     def test_query_tickers(self):
         for date, expected_amt in self.expected_amounts.items():
@@ -108,9 +111,11 @@ class TestQuery(TestBase):
         for i, profit in enumerate(sorted([tx.profit for tx in vmw_tx])):
             self.assertAlmostEqual(expected_profits[i], profit)
         
-        for ticker in distinct_tickers(self.DB_NAME, self.ACCOUNT0):
-            tx = group_transactions(self.DB_NAME, self.ACCOUNT0, ticker, True)
-            self.assertTrue(tx)
+        regrouped = regroup_transactions(self.DB_NAME, self.ACCOUNT0, save_db=True)
+        self.assertFalse(regrouped['failures'])
+        self.assertEqual(set(distinct_tickers(self.DB_NAME, self.ACCOUNT0)), set(regrouped['tickers']))
+        for count, _ in regrouped['tickers'].values():
+            self.assertTrue(count)
 
         # for ticker in distinct_tickers(self.DB_NAME, self.ACCOUNT0):
             # tx = group_transactions(self.DB_NAME, self.ACCOUNT0, ticker)
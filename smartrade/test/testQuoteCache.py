@@ -0,0 +1,37 @@
+# -*- coding: utf-8 -*-
+
+import time
+
+from smartrade.QuoteCache import QuoteCache
+from smartrade.test.TestBase import TestBase
+
+import unittest
+
+
+class TestQuoteCache(TestBase):
+    def test_get(self):
+        cache = QuoteCache()
+        self.assertIsNone(cache.get("AAPL"))
+        cache.put("AAPL", (1.0, True), 60)
+        cache.put("MSFT", (2.0, True), 0.05)
+        self.assertEqual((1.0, True), cache.get("AAPL"))
+        self.assertEqual((2.0, True), cache.get("MSFT"))
+        time.sleep(0.1)
+        self.assertIsNone(cache.get("MSFT"))
+        self.assertIsNone(cache.get("MSFT"))
+        self.assertEqual((1.0, True), cache.get("AAPL"))
+        self.assertEqual({'hits': 3, 'misses': 2, 'stale': 1, 'size': 1, 'hit_rate': 0.5}, cache.stats())
+
+    def test_sweep(self):
+        cache = QuoteCache()
+        cache.SWEEP_INTERVAL = 0.05
+        for i in range(10):
+            cache.put(f"S{i}", (1.0, True), 0)
+        time.sleep(0.1)
+        # the expired entries never read again are evicted
+        cache.put("AAPL", (1.0, True), 60)
+        self.assertEqual(1, cache.stats()['size'])
+
+
+if __name__ == '__main__':
+    unittest.main()
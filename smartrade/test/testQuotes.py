@@ -0,0 +1,100 @@
+# -*- coding: utf-8 -*-
+
+from datetime import date, datetime, timedelta, timezone
+import threading
+
+from smartrade.MarketDataProvider import MarketDataProvider
+from smartrade.test.TestBase import TestBase
+from smartrade.utils import get_database
+
+import unittest
+
+
+class QuoteStandIn(MarketDataProvider):
+    """Provider quoting every symbol at 1.0 without the broker, blocked until `release` if it's held.
+
+    Symbol BAD fails its chunk, the quotes are old ones unless `actual` is set.
+    """
+
+    def __init__(self, db_name):
+        super().__init__(None, None, db_name)
+        self.requests = []
+        self.release = threading.Event()
+        self.release.set()
+        self.actual = True
+
+    def get_quotes(self, symbols, day=None):
+        self.requests.append(list(symbols))
+        self.release.wait(10)
+        if "BAD" in symbols:
+            raise ConnectionError(symbols)
+        return {symbol: {'price': 1.0} for symbol in symbols}, self.actual
+
+
+class TestQuotes(TestBase):
+    def setUp(self):
+        super().setUp()
+        # the regular hours
+        get_database(self.DB_NAME).market_hours.delete_many({})
+        self.provider = QuoteStandIn(self.DB_NAME)
+
+    def test_coalesce(self):
+        self.provider.release.clear()
+        futures = self.provider.submit_quotes(["AAPL", "MSFT"])
+        # the in-flight request of MSFT is shared
+        overlapping = self.provider.submit_quotes(["MSFT", "HOOD"])
+        self.assertIs(futures["MSFT"], overlapping["MSFT"])
+        self.provider.release.set()
+        self.assertEqual(({'price': 1.0}, True), overlapping["MSFT"].result())
+        self.assertEqual(({'price': 1.0}, True), futures["AAPL"].result())
+        overlapping["HOOD"].result()
+        self.assertEqual([["AAPL", "MSFT"], ["HOOD"]], sorted(self.provider.requests))
+        self.assertEqual({}, self.provider._pending_quotes)
+        # served from the quote cache afterwards
+        self.assertEqual({"AAPL": ({'price': 1.0}, True)}, self.provider.get_latest_quotes(["AAPL"]))
+        self.assertEqual(2, len(self.provider.requests))
+
+    def test_chunks(self):
+        self.provider.QUOTE_CHUNK_SIZE = 3
+        symbols = [f"S{i}" for i in range(8)]
+        quotes = self.provider.get_latest_quotes(symbols + symbols[:2])
+        self.assertEqual(symbols, list(quotes))
+        self.assertEqual([3, 3, 2], sorted(map(len, self.provider.requests), reverse=True))
+        self.assertEqual(symbols, sorted(sum(self.provider.requests, [])))
+        self.assertEqual({}, self.provider._pending_quotes)
+
+    def test_failure(self):
+        self.provider.QUOTE_CHUNK_SIZE = 2
+        futures = self.provider.submit_quotes(["AAPL", "BAD", "MSFT"])
+        # the error reaches every future of the chunk
+        for symbol in ("AAPL", "BAD"):
+            self.assertRaises(ConnectionError, futures[symbol].result)
+        self.assertEqual(({'price': 1.0}, True), futures["MSFT"].result())
+        self.assertEqual({}, self.provider._pending_quotes)
+        # failures are not cached
+        self.assertRaises(ConnectionError, self.provider.submit_quotes(["AAPL", "BAD"])["AAPL"].result)
+        self.assertEqual(3, len(self.provider.requests))
+
+    def test_old_quotes(self):
+        self.provider.actual = False
+        self.assertEqual({"AAPL": ({'price': 1.0}, False)}, self.provider.get_latest_quotes(["AAPL"]))
+        # the old quote resorted to is not served from the cache
+        self.provider.actual = True
+        self.assertEqual({"AAPL": ({'price': 1.0}, True)}, self.provider.get_latest_quotes(["AAPL"]))
+        self.assertEqual(2, len(self.provider.requests))
+
+    def test_ttl(self):
+        time_zone = timezone.utc
+        # Friday during market hours
+        self.assertEqual(MarketDataProvider.QUOTE_TTL, self.provider._quote_ttl(datetime(2022, 1, 7, 15, tzinfo=time_zone)))
+        # Friday after the close: until Monday's open
+        after_close = datetime(2022, 1, 7, 21, tzinfo=time_zone)
+        monday_open = datetime.combine(date(2022, 1, 10), MarketDataProvider.OPEN_TIME).replace(tzinfo=time_zone)
+        self.assertEqual((monday_open - after_close).total_seconds(), self.provider._quote_ttl(after_close))
+        # Monday before the open
+        before_open = monday_open - timedelta(hours=1)
+        self.assertEqual(3600, self.provider._quote_ttl(before_open))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,5 +1,9 @@
 # -*- coding: utf-8 -*-
 
+from datetime import datetime
+
+from bson import ObjectId
+
 from smartrade.Transaction import Transaction, Action, Symbol
 from smartrade.TransactionGroup import TransactionGroup
 from smartrade.test.TestBase import TestBase
@@ -37,6 +41,22 @@ class TestTransaction(TestBase):
         symbol = Symbol(symbol_str)
         self.assertEqual("GOOG220624C02200000", format(symbol, 'x'))
 
+    def test_symbol_cache(self):
+        Symbol.clear_cache()
+        symbol = Symbol.of("TWTR 02/04/2022 38.00 C")
+        self.assertIs(symbol, Symbol.of("TWTR 02/04/2022 38.00 C"))
+        self.assertEqual(Symbol("TWTR_020422C38"), symbol)
+        self.assertEqual(hash(Symbol("TWTR_020422C38")), hash(symbol))
+        self.assertEqual({'hits': 1, 'misses': 1}, {k: Symbol.cache_stats()['text'][k] for k in ('hits', 'misses')})
+
+        doc = {'ui': 'TWTR', 'expired': symbol.expired, 'strike': 38, 'type': 'CALL'}
+        tx1 = Transaction.from_doc({**doc, 'action': 'STO', 'quantity': 1})
+        tx2 = Transaction.from_doc({**doc, 'action': 'BTC', 'quantity': 1})
+        self.assertIs(tx1.symbol, tx2.symbol)
+        self.assertEqual(symbol, tx1.symbol)
+        self.assertEqual(0.5, Symbol.cache_stats()['fields']['hit_rate'])
+        self.assertEqual(1, len({symbol, tx1.symbol}))
+
     def test_transaction(self):
         transactions = [
             Transaction.from_dict(
@@ -100,6 +120,31 @@ class TestTransaction(TestBase):
         self.assertEqual(2, len(aapl_tx))
         self.assertEqual(1, len(spy_tx))
 
+    def test_partial_close(self):
+        def doc(action, day, quantity):
+            return Transaction.from_doc({'_id': ObjectId(), 'account': self.ACCOUNT0, 'ui': "AAPL",
+                                         'date': datetime(2022, 1, day), 'action': action, 'quantity': quantity,
+                                         'price': 100.0, 'fee': 0, 'amount': 100.0 * quantity * (-1 if action == "BTO" else 1)})
+
+        open_tx = doc("BTO", 3, 10)
+        group = TransactionGroup([open_tx])
+        self.assertEqual(10, group._remaining(open_tx))
+        updated_tx_list, created_tx_map = [], {}
+        for day, quantity, remaining in ((4, 3, 7), (5, 4, 3)):
+            self.assertTrue(group._followed_by([doc("STC", day, quantity)], updated_tx_list, created_tx_map))
+            self.assertEqual(remaining, group._remaining(open_tx))
+        self.assertEqual([], updated_tx_list)
+
+        # the closing transaction is sliced by the remaining quantity
+        close_tx = doc("STC", 6, 5)
+        self.assertTrue(group._followed_by([close_tx], updated_tx_list, created_tx_map))
+        self.assertEqual(0, group._remaining(open_tx))
+        self.assertEqual({}, group._open_chains)
+        self.assertEqual([3, 4, 3], [tx.quantity for tx in group.chains[open_tx]])
+        self.assertEqual(2, close_tx.quantity)
+        self.assertEqual([close_tx.slice_parent], [tx.id for tx in updated_tx_list])
+        self.assertFalse(group._followed_by([close_tx], updated_tx_list, created_tx_map))
+
 
 if __name__ == '__main__':
     unittest.main()
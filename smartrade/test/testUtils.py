@@ -0,0 +1,43 @@
+# -*- coding: utf-8 -*-
+
+from datetime import datetime, timezone
+
+from smartrade.test.TestBase import TestBase
+from smartrade.utils import get_client, get_database, pool_stats, DateParser
+
+import unittest
+
+
+class TestUtils(TestBase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+
+    def test_shared_client(self):
+        db1 = get_database(self.DB_NAME)
+        db2 = get_database(self.DB_NAME + "_other")
+        self.assertIs(db1.client, db2.client)
+        self.assertIs(get_client(), db1.client)
+
+        stats = pool_stats()
+        self.assertTrue(stats)
+        for pool in stats.values():
+            self.assertGreaterEqual(pool['checkouts'], pool['checkins'])
+
+    def test_date_parser(self):
+        parser = DateParser()
+        self.assertEqual(datetime(2022, 2, 3), parser.parse("02/03/2022"))
+        self.assertEqual(datetime(2022, 1, 28, 6, 0, 1, tzinfo=timezone.utc), parser.parse("2022-01-28T06:00:01+0000"))
+        self.assertEqual(datetime(2022, 1, 28), parser.parse("2022-01-28"))
+        self.assertEqual(datetime(2022, 3, 11), parser.parse("031122"))
+        self.assertEqual(0, parser.fallbacks)
+        self.assertEqual(datetime(2022, 2, 3), parser.parse("Feb 3, 2022"))
+        self.assertEqual(1, parser.fallbacks)
+
+
+if __name__ == '__main__':
+    unittest.main()
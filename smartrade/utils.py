@@ -3,24 +3,159 @@
 from collections.abc import Iterable
 from enum import Enum
 import datetime
+import email.utils
 import os
+import random
+import threading
+import time
 
+from dateutil.parser import parse
 from dateutil.relativedelta import relativedelta
 from flask.json import JSONEncoder
 import pymongo
+from pymongo import monitoring
 
 from smartrade.exceptions import BadRequestError, TooManyRequestsError
 
 ASC = pymongo.ASCENDING
 DESC = pymongo.DESCENDING
 
-def get_database(db_name):
-    client = pymongo.MongoClient(os.environ.get('MONGODB_URI', "mongodb://127.0.0.1:27017"))
-    return client[db_name]
+DEFAULT_MONGODB_URI = "mongodb://127.0.0.1:27017"
+
+# environment variable => (MongoClient option, value type)
+MONGODB_CLIENT_OPTIONS = {
+    'MONGODB_MAX_POOL_SIZE': ('maxPoolSize', int),
+    'MONGODB_MIN_POOL_SIZE': ('minPoolSize', int),
+    'MONGODB_MAX_IDLE_TIME_MS': ('maxIdleTimeMS', int),
+    'MONGODB_WAIT_QUEUE_TIMEOUT_MS': ('waitQueueTimeoutMS', int),
+    'MONGODB_CONNECT_TIMEOUT_MS': ('connectTimeoutMS', int),
+    'MONGODB_SOCKET_TIMEOUT_MS': ('socketTimeoutMS', int),
+    'MONGODB_SERVER_SELECTION_TIMEOUT_MS': ('serverSelectionTimeoutMS', int),
+    'MONGODB_READ_PREFERENCE': ('readPreference', str),
+}
+
+class PoolStats(monitoring.ConnectionPoolListener):
+    """Counters of connection pool checkouts, used for sizing the pool."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self.checkouts = 0
+        self.checkout_failures = 0
+        self.checkins = 0
+        self.connections_created = 0
+        self.connections_closed = 0
+        self.total_wait_time = 0.0
+        self.max_wait_time = 0.0
+
+    def _wait_time(self):
+        start = getattr(self._local, 'start', None)
+        self._local.start = None
+        return 0.0 if start is None else time.perf_counter() - start
+
+    def connection_check_out_started(self, event):
+        self._local.start = time.perf_counter()
+
+    def connection_checked_out(self, event):
+        wait_time = self._wait_time()
+        with self._lock:
+            self.checkouts += 1
+            self.total_wait_time += wait_time
+            self.max_wait_time = max(self.max_wait_time, wait_time)
+
+    def connection_check_out_failed(self, event):
+        wait_time = self._wait_time()
+        with self._lock:
+            self.checkout_failures += 1
+            self.total_wait_time += wait_time
+            self.max_wait_time = max(self.max_wait_time, wait_time)
+
+    def connection_checked_in(self, event):
+        with self._lock:
+            self.checkins += 1
+
+    def connection_created(self, event):
+        with self._lock:
+            self.connections_created += 1
+
+    def connection_closed(self, event):
+        with self._lock:
+            self.connections_closed += 1
+
+    def pool_created(self, event): ...
+
+    def pool_ready(self, event): ...
+
+    def pool_cleared(self, event): ...
+
+    def pool_closed(self, event): ...
+
+    def connection_ready(self, event): ...
+
+    def to_json(self):
+        with self._lock:
+            return {
+                'checkouts': self.checkouts,
+                'checkout_failures': self.checkout_failures,
+                'checkins': self.checkins,
+                'in_use': self.checkouts - self.checkins,
+                'connections_created': self.connections_created,
+                'connections_closed': self.connections_closed,
+                'total_wait_time': self.total_wait_time,
+                'avg_wait_time': self.total_wait_time / max(self.checkouts + self.checkout_failures, 1),
+                'max_wait_time': self.max_wait_time
+            }
+
+_clients = {}
+_pool_stats = {}
+_clients_lock = threading.Lock()
+
+def _reset_clients():
+    """Forget the parent's clients in a forked child: MongoClient is not fork-safe."""
+    global _clients_lock
+    _clients.clear()
+    _pool_stats.clear()
+    _clients_lock = threading.Lock()
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_clients)
+
+def _client_options():
+    options = {}
+    for env_var, (option, value_type) in MONGODB_CLIENT_OPTIONS.items():
+        value = os.environ.get(env_var)
+        if value:
+            options[option] = value_type(value)
+    return options
+
+def get_client(uri=None):
+    """Get the process-wide client(with its connection pool) of the given URI."""
+    uri = uri or os.environ.get('MONGODB_URI', DEFAULT_MONGODB_URI)
+    client = _clients.get(uri)
+    if client: return client
+
+    with _clients_lock:
+        client = _clients.get(uri)
+        if not client:
+            stats = PoolStats()
+            client = pymongo.MongoClient(uri, event_listeners=[stats], **_client_options())
+            _pool_stats[uri] = stats
+            _clients[uri] = client
+    return client
+
+def get_database(db_name, uri=None):
+    return get_client(uri)[db_name]
+
+def pool_stats():
+    # strip credentials from the URI keys
+    return {uri.rsplit('@', 1)[-1]: stats.to_json() for uri, stats in list(_pool_stats.items())}
 
 def check(assertion, error_message, log=None, throw_error=True):
+    """error_message: message or function building it, only called when the assertion fails"""
     if assertion: return
 
+    if callable(error_message):
+        error_message = error_message()
     if log:
         log(error_message)
     if throw_error:
@@ -32,11 +167,30 @@ def http_response(response):
         raise BadRequestError()
  
     if code == 429:
-        raise TooManyRequestsError()
+        raise TooManyRequestsError(retry_after(response))
 
     check(code == 200, response.raise_for_status())
     return response.json()
 
+def retry_after(response):
+    """Seconds to wait from the Retry-After header of a response, or None."""
+    value = response.headers.get('Retry-After', None)
+    if value is None: return None
+
+    try:
+        return max(float(value), 0)
+    except ValueError: # HTTP date
+        try:
+            retry_time = email.utils.parsedate_to_datetime(value)
+            return max((retry_time - datetime.datetime.now(datetime.timezone.utc)).total_seconds(), 0)
+        except (TypeError, ValueError):
+            return None
+
+def backoff_delay(attempt, retry_after=None, base=1.0, cap=60.0):
+    """Jittered exponential backoff before the given retry attempt (from 0), at least retry_after seconds."""
+    delay = random.uniform(0, min(cap, base * 2 ** attempt))
+    return max(delay, retry_after or 0)
+
 def get_value(obj, *attrs):
     for attr in attrs:
         if attr in obj:
@@ -49,7 +203,7 @@ def to_json(obj):
     if isinstance(obj, Iterable) and not isinstance(obj, str):
         return [to_json(item) for item in obj]
 
-    if not hasattr(obj, '__dict__'): return obj
+    if not (hasattr(obj, '__dict__') or hasattr(obj, '__slots__')): return obj
 
     clazz = obj.__class__
     return {prop: to_json(getattr(obj, prop)) for prop in dir(clazz)
@@ -61,6 +215,42 @@ class CustomJsonEncoder(JSONEncoder):
             return obj.isoformat()
         return JSONEncoder.default(self, obj)
 
+class DateParser:
+    """Date parser of a single source, which tries the fixed broker formats before dateutil.
+
+    The last matched format is tried first, so a file of uniform dates costs one strptime per row.
+    """
+
+    ISO = None # datetime.fromisoformat
+    FORMATS = ('%m/%d/%Y', ISO, '%Y-%m-%dT%H:%M:%S%z', '%m%d%y')
+
+    def __init__(self, formats=FORMATS):
+        self._formats = formats
+        self._format = formats[0]
+        self.fallbacks = 0
+
+    def parse(self, text):
+        try:
+            return self._parse(text, self._format)
+        except ValueError:
+            pass
+        for fmt in self._formats:
+            if fmt == self._format: continue
+            try:
+                date = self._parse(text, fmt)
+                self._format = fmt
+                return date
+            except ValueError:
+                continue
+        self.fallbacks += 1
+        return parse(text)
+
+    @classmethod
+    def _parse(cls, text, fmt):
+        if fmt is cls.ISO: return datetime.datetime.fromisoformat(text)
+
+        return datetime.datetime.strptime(text, fmt)
+
 def parse_date_range(date_range):
     start_date = end_date = None
     today = datetime.datetime.today()
@@ -13,7 +13,7 @@ from smartrade.Assembler import Assembler
 from smartrade.Inspector import Inspector
 from smartrade.Loader import Loader
 from smartrade.TransactionGroup import TransactionGroup
-from smartrade.utils import check, to_json
+from smartrade.utils import to_json
 
 logger = app_logger.get_logger(__name__)
 BAL_HIST_PATTERN = re.compile('.*"([^"]+)","([^"]+)"')
@@ -28,15 +28,15 @@ def account_home():
     provider = app.config['provider']
     inspector = Inspector(db_name, account, provider)
     total_profit, total_market_value, positions = inspector.summarize(False)
-    total_cash = inspector.total_cash()
-    total_market_value += total_cash
+    totals = inspector.account_totals()
+    total_market_value += totals['total_cash']
     position_map = {symbol: qty for pos_map in positions.values() for symbol, qty in pos_map.items()}
     values=[{}, {}, 0, 0]
-    symbols = position_map.keys()
-    for symbol in symbols:
-        quantity = position_map[symbol]
+    now = datetime.datetime.utcnow()
+    prices = provider.get_prices(position_map, [now])
+    for symbol, quantity in position_map.items():
         index = 0
-        price = provider.get_price(symbol)
+        price = prices[symbol, now]
         value = quantity * price
         if '_' in symbol:
             index = 1
@@ -45,17 +45,11 @@ def account_home():
         values[index + 2] += value
         total_market_value += value
         total_profit += value
-    total_dividend = inspector.total_dividend()
-    total_interest = inspector.total_interest()
-    total_profit += total_dividend + total_interest
+    total_profit += totals['total_dividend'] + totals['total_interest']
     summary = {
-        'total_investment': inspector.total_investment(),
-        'total_interest': total_interest,
-        'total_dividend': total_dividend,
-        'total_trading': inspector.total_trading(),
+        **totals,
         'total_profit': total_profit,
-        'total_market_value': total_market_value,
-        'total_cash': total_cash
+        'total_market_value': total_market_value
     }
     # avoid negative total_investment when calculating total profit rate
     summary['total_profit_rate'] = summary['total_profit'] / max(summary['total_investment'], 1)
@@ -85,13 +79,15 @@ def load(account):
             logger.info("no new transactions")
             return res
         res['transactions'] += live_load_count
+    if loader.duplicates:
+        res['duplicates'] = loader.duplicates
 
     assembler = Assembler(db_name, account)
-    inspector = Inspector(db_name, account)
-    tickers = inspector.distinct_tickers()
-    for ticker in tickers:
-        created_tx_groups = assembler.group_transactions(ticker, True)
-        res['transactionGroups'] += len(created_tx_groups)
+    # tickers without new transactions keep their groups
+    regrouped = assembler.regroup_written(loader.written_tickers)
+    res['transactionGroups'] += regrouped['transactionGroups']
+    if regrouped['failures']:
+        res['failures'] = regrouped['failures']
     return res
 
 @app.route("/transactionGroups")
@@ -159,16 +155,12 @@ def transaction_history():
     transactions = inspector.transaction_list(start_date, end_date, ticker, order == "1",
                                               valid, completed, effective, original, action)
 
-    total_cash = inspector.total_cash(start_date, end_date)
     end_cash = inspector.total_cash(None, end_date)
     start_cash = 0
     if start_date:
         start_cash = inspector.total_cash(None,  start_date - datetime.timedelta(0, 1))
-
-    delta = end_cash - start_cash - total_cash
-    logger.debug("start_cash=%s, end_cash=%s, total_cash=%s, (end_cash - start_cash - total_cash)=%s",
-                 start_cash, end_cash, total_cash, delta)
-    check(abs(delta) < 1e-5, f"delta {delta} should be small")
+    total_cash = end_cash - start_cash
+    logger.debug("start_cash=%s, end_cash=%s, total_cash=%s", start_cash, end_cash, total_cash)
     return {
         'transactions': [tx.to_json(serialize=True) for tx in transactions],
         'cash': { 'start': start_cash, 'end': end_cash, 'total': total_cash }